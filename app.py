@@ -20,6 +20,10 @@ from extensions import limiter, login_manager
 from services.logging_config import configure_logging, init_sentry
 from services import settings
 from services.auth_service import load_user
+from services.compression import compress_response
+from services.db import PoolTimeout, begin_request_stats, end_request_stats
+from services.api_keys import warn_if_no_pepper
+from services.password_pool import PasswordPoolBusy
 from services.utils import json_err, log_exception, client_ip
 
 
@@ -53,6 +57,7 @@ if settings.TRUST_PROXY:
 
 CORS(app, resources={r"/*": {"origins": settings.ALLOWED_ORIGINS, "supports_credentials": False}})
 configure_logging()
+warn_if_no_pepper()
 init_sentry()
 
 
@@ -66,6 +71,7 @@ def bind_request_context():
         rid = uuid.uuid4().hex
 
     g.request_id = rid
+    begin_request_stats(request.endpoint or "-")
     structlog.contextvars.bind_contextvars(
         request_id=rid,
         method=request.method,
@@ -84,6 +90,7 @@ def access_log_and_request_id(response):
     # Loga request (exceto health) em formato JSON (structlog)
     try:
         path = request.path or ""
+        db_fields = end_request_stats()
         if not path.startswith("/health"):
             dur = None
             if hasattr(g, "_start_time"):
@@ -98,6 +105,7 @@ def access_log_and_request_id(response):
                 x_forwarded_for=(request.headers.get("X-Forwarded-For") or "")[:200],
                 remote_addr=(request.remote_addr or "")[:100],
                 user_agent=(request.headers.get("User-Agent") or "")[:200],
+                **db_fields,
             )
     except Exception:
         pass
@@ -110,6 +118,9 @@ def access_log_and_request_id(response):
 
 limiter.init_app(app)
 login_manager.init_app(app)
+# Registrado antes de apply_security_headers: after_request roda em ordem inversa, então a compressão
+# vê a resposta já com os headers finais.
+app.after_request(compress_response)
 
 
 @login_manager.user_loader
@@ -126,6 +137,26 @@ def handle_exception(err: Exception):
             error_code="rate_limit",
             error_type=err.__class__.__name__,
         )
+    if PoolTimeout is not None and isinstance(err, PoolTimeout):
+        # Pool esgotado (DB_POOL_MAX ocupado por DB_POOL_TIMEOUT s): sobrecarga temporária, não bug.
+        structlog.get_logger().warning("db_pool_timeout", endpoint=request.endpoint or "-")
+        response, status = json_err(
+            "Serviço temporariamente sobrecarregado. Tente novamente em instantes.",
+            503,
+            error_code="db_pool_timeout",
+        )
+        response.headers["Retry-After"] = "2"
+        return response, status
+    if isinstance(err, PasswordPoolBusy):
+        # Rajada de login/signup: fila do PBKDF2 cheia. Recusa rápido em vez de disputar CPU com a ingestão.
+        structlog.get_logger().warning("password_pool_busy", endpoint=request.endpoint or "-")
+        response, status = json_err(
+            "Muitos logins ao mesmo tempo. Tente novamente em instantes.",
+            503,
+            error_code="auth_busy",
+        )
+        response.headers["Retry-After"] = "2"
+        return response, status
     if isinstance(err, HTTPException):
         return json_err(
             err.description,
@@ -0,0 +1,543 @@
+"""Modo ASGI opcional.
+
+As rotas dominadas por I/O rodam como corrotinas (psycopg AsyncConnectionPool + redis.asyncio):
+  POST /prever, GET /dashboard_data, POST /billing/webhook, POST /kiwify/webhook, POST /signup
+Todo o resto cai no app Flask (app.py), montado como WSGI no mesmo processo.
+
+Deploy síncrono continua igual (gunicorn app:app). Para o modo async:
+  pip install uvicorn a2wsgi
+  gunicorn -k uvicorn.workers.UvicornWorker -w 2 asgi:app
+Comparação de carga: python -m scripts.load_test --help
+"""
+
+import asyncio
+import json
+import secrets
+import time
+import uuid
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import structlog
+from limits import parse as parse_limit
+from limits.aio.strategies import FixedWindowRateLimiter
+from limits.storage import storage_from_string
+
+from app import _is_allowed_origin, app as flask_app
+from services import settings
+from services.api_keys import INSERT_KEY_SQL, new_api_key, warn_if_no_pepper
+from services.async_db import PoolTimeout, adb, close_async_pools, open_async_pools
+from services.auth_service import (
+    SIGNUP_INSERT_SQL,
+    hash_password_async,
+    require_client_auth_async,
+    signup_fields,
+    validate_password_strength,
+)
+from services.billing_service import (
+    extract_first,
+    find_client_id_from_payload,
+    kiwify_event_to_status,
+    kiwify_get_sale,
+    record_billing_event_async,
+    upsert_subscription_async,
+)
+from services.cache import cache_delete_prefix_async, close_async_redis_client
+from services.captcha import verify_turnstile_async
+from services.compression import compress_bytes, negotiate
+from services.db import begin_request_stats, end_request_stats
+from services.password_pool import PasswordPoolBusy
+from services.lead_service import (
+    dashboard_payload,
+    dashboard_reads_async,
+    new_lead_row,
+    plan_limit_error,
+    prever_fields,
+    prever_insert_async,
+    prever_limit_for_plan,
+    score_lead,
+)
+from services.ranking import rank_add_lead_async
+from services.utils import iso, log_exception, month_key, now_utc, safe_int
+
+logger = structlog.get_logger()
+
+Response = Tuple[int, Dict[str, Any], Dict[str, str]]
+
+
+class Request:
+    def __init__(self, scope: Dict[str, Any], body: bytes, body_size: int):
+        self.scope = scope
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.body = body
+        self.body_size = body_size
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers") or []}
+        self.args = {k: v[0] for k, v in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+        self._data: Optional[Dict[str, Any]] = None
+
+    def header(self, name: str) -> str:
+        return (self.headers.get(name.lower()) or "").strip()
+
+    def data(self) -> Dict[str, Any]:
+        """JSON do corpo (ou form urlencoded), equivalente a get_json(silent=True) or request.form."""
+
+        if self._data is None:
+            parsed: Any = None
+            ctype = self.header("content-type")
+            if "application/x-www-form-urlencoded" in ctype:
+                parsed = {k: v[0] for k, v in parse_qs(self.body.decode("utf-8", "replace")).items()}
+            elif self.body:
+                try:
+                    parsed = json.loads(self.body)
+                except ValueError:
+                    parsed = None
+            self._data = parsed if isinstance(parsed, dict) else {}
+        return self._data
+
+    def client_ip(self) -> str:
+        if settings.TRUST_PROXY:
+            forwarded = self.header("X-Forwarded-For").split(",")[0].strip()
+            if forwarded:
+                return forwarded
+        client = self.scope.get("client") or ("unknown", 0)
+        return str(client[0] or "unknown")
+
+    def client_id(self) -> str:
+        return (
+            self.header("X-CLIENT-ID")
+            or (self.args.get("client_id") or "").strip()
+            or str(self.data().get("client_id") or "").strip()
+        )
+
+    def api_key(self) -> str:
+        key = self.header("X-API-KEY") or self.header("Authorization")
+        if key.lower().startswith("bearer "):
+            key = key[7:].strip()
+        return key
+
+
+def json_ok(payload: Dict[str, Any], code: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    payload.setdefault("ok", True)
+    return code, payload, headers or {}
+
+
+def json_err(msg: str, code: int = 400, /, **extra) -> Response:
+    payload = {"ok": False, "error": msg}
+    payload.update(extra)
+    return code, payload, {}
+
+
+# ---------------------------------------------------------------------------
+# Rate limit (mesmos limites dos decorators do Flask-Limiter; storage async)
+# ---------------------------------------------------------------------------
+
+def _async_storage_uri() -> Tuple[str, Dict[str, Any]]:
+    uri = settings.RATELIMIT_STORAGE_URI or "memory://"
+    options: Dict[str, Any] = {}
+    if uri.startswith(("redis://", "rediss://")):
+        options["implementation"] = "redispy"
+    return f"async+{uri}", options
+
+
+_limiter: Optional[FixedWindowRateLimiter] = None
+
+
+def _get_limiter() -> FixedWindowRateLimiter:
+    global _limiter
+    if _limiter is None:
+        uri, options = _async_storage_uri()
+        _limiter = FixedWindowRateLimiter(storage_from_string(uri, **options))
+    return _limiter
+
+
+async def rate_limited(limit: str, key: str, scope: str) -> bool:
+    try:
+        return not await _get_limiter().hit(parse_limit(limit), scope, key)
+    except Exception:
+        # Storage do limiter fora: não derruba a request (mesmo efeito de swallow_errors).
+        logger.warning("rate_limit_storage_failed", scope=scope)
+        return False
+
+
+def _too_many() -> Response:
+    return json_err(
+        "Muitas requisições. Tente novamente em instantes.",
+        429,
+        error_code="rate_limit",
+        error_type="RateLimitExceeded",
+    )
+
+
+# ---------------------------------------------------------------------------
+# Rotas nativas
+# ---------------------------------------------------------------------------
+
+async def prever(req: Request) -> Response:
+    max_bytes = settings.MAX_PREVER_PAYLOAD_BYTES
+    if max_bytes and req.body_size > max_bytes:
+        return json_err(
+            "Payload muito grande para /prever.",
+            413,
+            code="payload_too_large",
+            limit_bytes=max_bytes,
+            size_bytes=req.body_size,
+        )
+
+    client_id = req.client_id()
+    if not client_id:
+        if await rate_limited(prever_limit_for_plan("trial"), req.client_ip(), "prever"):
+            return _too_many()
+        return json_err("client_id obrigatório", 400)
+
+    ok_auth, client_row, msg = await require_client_auth_async(client_id, req.api_key())
+    plan = (client_row.get("plan") or "trial").lower()
+    if await rate_limited(prever_limit_for_plan(plan), client_id, "prever"):
+        return _too_many()
+
+    if not ok_auth:
+        return json_err(msg, 403, code="auth_required")
+    if (client_row.get("status") or "active") != "active":
+        return json_err("Workspace inativo. Fale com o suporte para reativar.", 403, code="inactive")
+
+    limit_err = plan_limit_error(plan, int(client_row.get("leads_used_month") or 0))
+    if limit_err:
+        return json_err("Limite mensal atingido. Faça upgrade para continuar.", 402, **limit_err)
+
+    fields = prever_fields(req.data())
+    prob, score, label = score_lead(fields)
+    row, limit_err = await prever_insert_async(client_id, client_row, fields, prob, score, label)
+    if limit_err:
+        return json_err("Limite mensal atingido. Faça upgrade para continuar.", 402, **limit_err)
+
+    await asyncio.gather(
+        rank_add_lead_async(client_id, new_lead_row(row.get("id"), row.get("created_at"), fields, prob, score)),
+        cache_delete_prefix_async(f"insights:{client_id}:"),
+    )
+    return json_ok(
+        {
+            "client_id": client_id,
+            "lead_id": int(row.get("id") or 0),
+            "probabilidade": float(prob),
+            "score": int(score),
+            "label": label,
+            "plan": plan,
+            "created_at": iso(row.get("created_at")),
+        }
+    )
+
+
+async def dashboard_data(req: Request) -> Response:
+    client_id = req.client_id()
+    if await rate_limited("30 per minute", client_id or req.client_ip(), "dashboard_data"):
+        return _too_many()
+    page = max(1, safe_int(req.args.get("page"), 1))
+    per_page = max(10, min(safe_int(req.args.get("limit"), settings.DEFAULT_LIMIT), 200))
+    offset = (page - 1) * per_page
+
+    if not client_id:
+        return json_err("client_id obrigatório", 400)
+
+    ok_auth, _, msg = await require_client_auth_async(client_id, req.api_key())
+    if not ok_auth:
+        return json_err(msg, 403, code="auth_required")
+
+    total_leads, rows, top, hot = await dashboard_reads_async(client_id, per_page, offset)
+    return json_ok(dashboard_payload(client_id, page, per_page, total_leads, rows, top, hot))
+
+
+async def billing_webhook(req: Request) -> Response:
+    if await rate_limited("100 per minute", req.client_ip(), "billing_webhook"):
+        return _too_many()
+    if not settings.BILLING_WEBHOOK_SECRET:
+        return json_err("Webhook não configurado (BILLING_WEBHOOK_SECRET ausente).", 501)
+    if req.header("X-BILLING-SECRET") != settings.BILLING_WEBHOOK_SECRET:
+        return json_err("Unauthorized", 403)
+
+    payload = req.data()
+    provider = (payload.get("provider") or "manual").strip().lower()
+    event_type = (payload.get("type") or payload.get("event_type") or "unknown").strip()
+    client_id = (payload.get("client_id") or (payload.get("data") or {}).get("client_id") or "").strip()
+    await record_billing_event_async(provider, event_type, client_id, payload)
+
+    plan = (payload.get("plan") or "").strip().lower()
+    status = (payload.get("status") or "").strip().lower()
+    if client_id and plan and status:
+        try:
+            await upsert_subscription_async(client_id, plan=plan, status=status, provider=provider)
+        except Exception as exc:
+            return json_err("Evento recebido, mas falhou ao aplicar.", 500, detail=repr(exc))
+    return json_ok({"received": True})
+
+
+async def kiwify_webhook(req: Request) -> Response:
+    if await rate_limited("100 per minute", req.client_ip(), "kiwify_webhook"):
+        return _too_many()
+    payload = req.data()
+    if settings.KIWIFY_WEBHOOK_TOKEN:
+        got = extract_first(payload, ["token", "webhook_token", "secret"])
+        if got != settings.KIWIFY_WEBHOOK_TOKEN:
+            return json_err("Unauthorized", 403)
+
+    event_type = extract_first(payload, ["event", "event_type", "type", "trigger"]) or "unknown"
+    client_id = find_client_id_from_payload(payload)
+
+    order_id = extract_first(payload, ["order_id", "orderId", "sale_id", "saleId", "id"])
+    sale = None
+    if order_id and not client_id:
+        # Cliente HTTP da Kiwify é síncrono (requests): roda numa thread para não travar o loop.
+        sale = await asyncio.to_thread(kiwify_get_sale, order_id)
+        if isinstance(sale, dict):
+            client_id = find_client_id_from_payload(sale)
+
+    plan = extract_first(payload, ["plan", "s2"])
+    if not plan and isinstance(sale, dict):
+        plan = extract_first(sale, ["plan", "s2"])
+    status = kiwify_event_to_status(event_type)
+
+    await record_billing_event_async("kiwify", event_type, client_id, payload)
+    if client_id and plan:
+        await upsert_subscription_async(client_id, plan=plan, status=status, provider="kiwify")
+    return json_ok({"received": True})
+
+
+async def signup(req: Request) -> Response:
+    if await rate_limited("5 per hour", req.client_ip(), "signup"):
+        return _too_many()
+    fields = signup_fields(req.data())
+    if fields["honeypot"]:
+        return 200, {"ok": True, "success": True, "message": "Conta trial criada com sucesso!"}, {}
+
+    captcha_token = fields["captcha_token"]
+    if (settings.TURNSTILE_SECRET_KEY and settings.CAPTCHA_ENFORCE) and not captcha_token:
+        return json_err("Confirme que você não é um robô.", 400, code="captcha_required")
+    if settings.TURNSTILE_SECRET_KEY and captcha_token:
+        remote = (req.header("X-Forwarded-For") or req.client_ip()).split(",")[0].strip()
+        res = await verify_turnstile_async(captcha_token, remoteip=remote)
+        if not res.ok and settings.CAPTCHA_ENFORCE:
+            return json_err("Falha na verificação anti-spam. Tente novamente.", 400, code="captcha_invalid")
+        if not res.ok:
+            logger.warning("captcha_soft_fail", reason=res.error)
+
+    email, password = fields["email"], fields["password"]
+    if not email or "@" not in email:
+        return json_err("Email válido é obrigatório", 400)
+    ok_pw, pw_msg = validate_password_strength(password or "")
+    if not ok_pw:
+        return json_err(pw_msg, 400)
+
+    client_id = f"trial-{secrets.token_hex(8)}"
+    api_key, key_hash = new_api_key(client_id)
+    valid_until = now_utc() + timedelta(days=14)
+    # PBKDF2 é CPU: roda no pool de processos limitado (services/password_pool.py), não no event loop.
+    pw_hash = await hash_password_async(password)
+
+    async with adb() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT client_id FROM clients WHERE email=%s", (email,))
+            if await cur.fetchone():
+                return 409, {
+                    "ok": False,
+                    "success": False,
+                    "error": "Este email já está cadastrado. Faça login.",
+                    "code": "email_exists",
+                }, {}
+            await cur.execute(
+                SIGNUP_INSERT_SQL,
+                (
+                    client_id,
+                    fields["nome"] or None,
+                    email,
+                    fields["empresa"] or None,
+                    fields["telefone"] or None,
+                    valid_until,
+                    month_key(),
+                    pw_hash,
+                ),
+            )
+            await cur.execute(INSERT_KEY_SQL, (key_hash, client_id))
+
+    payload = {
+        "ok": True,
+        "success": True,
+        "client_id": client_id,
+        "plan": "trial",
+        "valid_until": iso(valid_until),
+        "message": "Conta trial criada com sucesso!",
+    }
+    return 200, payload, {"X-API-KEY": api_key, "Authorization": f"Bearer {api_key}"}
+
+
+ROUTES: Dict[Tuple[str, str], Callable[[Request], Awaitable[Response]]] = {
+    ("POST", "/prever"): prever,
+    ("GET", "/dashboard_data"): dashboard_data,
+    ("POST", "/billing/webhook"): billing_webhook,
+    ("POST", "/kiwify/webhook"): kiwify_webhook,
+    ("POST", "/signup"): signup,
+}
+
+
+# ---------------------------------------------------------------------------
+# ASGI
+# ---------------------------------------------------------------------------
+
+def _response_headers(req: Request, extra: Dict[str, str], request_id: str) -> List[Tuple[bytes, bytes]]:
+    """Mesmos headers que app.py aplica (CORS allowlist, segurança, X-Request-ID)."""
+
+    headers = {
+        "Content-Type": "application/json",
+        "X-Request-ID": request_id,
+        "X-Content-Type-Options": "nosniff",
+        "X-Frame-Options": "DENY",
+        "Referrer-Policy": "strict-origin-when-cross-origin",
+        "Permissions-Policy": "camera=(), microphone=(), geolocation=(), payment=()",
+        "Access-Control-Expose-Headers": "X-API-KEY, X-Request-ID, Content-Disposition",
+    }
+    origin = req.header("Origin")
+    if origin and _is_allowed_origin(origin):
+        headers["Access-Control-Allow-Origin"] = origin
+        headers["Vary"] = "Origin"
+    if settings.CSP_POLICY:
+        headers["Content-Security-Policy"] = settings.CSP_POLICY
+    headers.update(extra)
+    return [(k.encode("latin-1"), str(v).encode("latin-1")) for k, v in headers.items()]
+
+
+async def _read_body(receive, limit: int) -> Tuple[bytes, int]:
+    """Corpo da request e tamanho total. Acima de `limit` para de acumular (o handler responde 413)."""
+
+    chunks: List[bytes] = []
+    size = 0
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if not limit or size <= limit:
+            chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks), size
+
+
+async def _dispatch(handler, scope, receive, send) -> None:
+    start = time.perf_counter()
+    limit = settings.MAX_PREVER_PAYLOAD_BYTES if handler is prever else 0
+    body, body_size = await _read_body(receive, limit)
+    req = Request(scope, body, body_size)
+    rid = req.header("X-Request-ID")
+    if not rid or len(rid) > 64:
+        rid = uuid.uuid4().hex
+    begin_request_stats(f"asgi:{req.path}")
+    structlog.contextvars.bind_contextvars(request_id=rid, method=req.method, path=req.path)
+    try:
+        try:
+            status, payload, extra = await handler(req)
+        except Exception as exc:
+            if PoolTimeout is not None and isinstance(exc, PoolTimeout):
+                logger.warning("db_pool_timeout", endpoint=req.path)
+                status, payload, extra = json_err(
+                    "Serviço temporariamente sobrecarregado. Tente novamente em instantes.",
+                    503,
+                    error_code="db_pool_timeout",
+                )
+                extra = {"Retry-After": "2"}
+            elif isinstance(exc, PasswordPoolBusy):
+                logger.warning("password_pool_busy", endpoint=req.path)
+                status, payload, extra = json_err(
+                    "Muitos logins ao mesmo tempo. Tente novamente em instantes.",
+                    503,
+                    error_code="auth_busy",
+                )
+                extra = {"Retry-After": "2"}
+            else:
+                trace = log_exception("Unhandled exception")
+                status, payload, extra = json_err(
+                    "Erro interno do servidor",
+                    500,
+                    error_code="internal_error",
+                    code="internal_error",
+                    error_type=exc.__class__.__name__,
+                )
+                if settings.DEBUG_MODE or settings.INCLUDE_TRACEBACK:
+                    payload["trace"] = trace
+
+        data = json.dumps(payload, default=str).encode("utf-8")
+        if settings.COMPRESS_ENABLED:
+            extra = {**extra, "Vary": "Origin, Accept-Encoding"}
+            encoding = negotiate(req.header("Accept-Encoding"))
+            if encoding and len(data) >= settings.COMPRESS_MIN_BYTES:
+                data = compress_bytes(encoding, data)
+                extra["Content-Encoding"] = encoding
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": _response_headers(req, extra, rid)
+                + [(b"content-length", str(len(data)).encode("latin-1"))],
+            }
+        )
+        await send({"type": "http.response.body", "body": data})
+        logger.info(
+            "http_request",
+            status=status,
+            duration_ms=int((time.perf_counter() - start) * 1000),
+            client_ip=req.client_ip()[:100],
+            x_forwarded_for=req.header("X-Forwarded-For")[:200],
+            user_agent=req.header("User-Agent")[:200],
+            serving="asgi",
+            **end_request_stats(),
+        )
+    finally:
+        structlog.contextvars.clear_contextvars()
+
+
+def _build_wsgi_mount():
+    try:
+        from a2wsgi import WSGIMiddleware
+
+        return WSGIMiddleware(flask_app)
+    except ImportError:
+        pass
+    try:
+        from asgiref.wsgi import WsgiToAsgi
+
+        return WsgiToAsgi(flask_app)
+    except ImportError:
+        raise RuntimeError("Modo ASGI precisa de a2wsgi (ou asgiref) para montar o app Flask.") from None
+
+
+_wsgi_mount = None
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            warn_if_no_pepper()
+            try:
+                if settings.DATABASE_URL:
+                    await open_async_pools()
+            except Exception as exc:
+                await send({"type": "lifespan.startup.failed", "message": repr(exc)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_pools()
+            await close_async_redis_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    global _wsgi_mount
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] == "http":
+        handler = ROUTES.get((scope["method"], scope["path"]))
+        if handler is not None:
+            await _dispatch(handler, scope, receive, send)
+            return
+    if _wsgi_mount is None:
+        _wsgi_mount = _build_wsgi_mount()
+    await _wsgi_mount(scope, receive, send)
@@ -1,9 +1,12 @@
-from flask import Blueprint
+from flask import Blueprint, request
 from psycopg.rows import dict_row
 
 from extensions import limiter
-from services.db import db
+from services.db import db, pool_stats
 from services.demo_service import require_admin_key
+from services.live import live_stats
+from services.password_pool import pool_stats as password_pool_stats
+from services.ranking import rank_rebuild
 from services.utils import json_err, json_ok, month_key
 
 admin_bp = Blueprint("admin", __name__)
@@ -34,3 +37,50 @@ def admin_reset_month():
         return json_ok({"usage_month": mk, "clients_total": n})
     finally:
         conn.close()
+
+
+@admin_bp.post("/admin/rebuild_acao_rank")
+@limiter.limit("30 per minute")
+def admin_rebuild_acao_rank():
+    ok, _ = require_admin_key()
+    if not ok:
+        return json_err("Unauthorized", 403)
+
+    data = request.get_json(silent=True) or {}
+    client_id = (data.get("client_id") or "").strip()
+    if not client_id:
+        return json_err("client_id obrigatório", 400)
+
+    rows = rank_rebuild(client_id)
+    if rows is None:
+        return json_err("Redis indisponível: ranking servido direto do Postgres.", 503, code="rank_unavailable")
+    return json_ok({"client_id": client_id, "ranked": len(rows)})
+
+
+@admin_bp.get("/admin/db_pool_stats")
+@limiter.limit("60 per minute")
+def admin_db_pool_stats():
+    """Telemetria deste worker: conexões, hash de senha e rate limit (cada worker do gunicorn tem os seus)."""
+
+    ok, _ = require_admin_key()
+    if not ok:
+        return json_err("Unauthorized", 403)
+    rate_limit = getattr(limiter.storage, "stats", None)
+    return json_ok(
+        {
+            **pool_stats(),
+            "password_pool": password_pool_stats(),
+            "rate_limit": rate_limit() if rate_limit else None,
+        }
+    )
+
+
+@admin_bp.get("/admin/live_stats")
+@limiter.limit("60 per minute")
+def admin_live_stats():
+    """Streams SSE abertos e estado do LISTEN deste worker (/leads_stream)."""
+
+    ok, _ = require_admin_key()
+    if not ok:
+        return json_err("Unauthorized", 403)
+    return json_ok(live_stats())
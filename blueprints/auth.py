@@ -1,5 +1,6 @@
 from datetime import timedelta
 import secrets
+from typing import Any, Dict
 
 from flask import Blueprint, jsonify, request
 from flask_login import login_user
@@ -9,52 +10,61 @@ import structlog
 from extensions import limiter
 from models.user import AuthUser
 from services import settings
+from services.api_keys import issue_api_key, issue_login_key, revoke_cached
 from services.auth_service import (
-    gen_api_key,
+    SIGNUP_INSERT_SQL,
     hash_password,
     needs_rehash,
+    require_client_auth,
+    signup_fields,
     validate_password_strength,
     verify_password,
 )
 from services.captcha import verify_turnstile
 from services.db import db
-from services.utils import iso, json_err, json_ok, month_key, now_utc
+from services.session_tokens import enabled as tokens_enabled, is_token, issue_token, revoke_tokens, token_epoch
+from services.utils import (
+    get_api_key_from_headers,
+    get_client_id_from_request,
+    iso,
+    json_err,
+    json_ok,
+    month_key,
+    now_utc,
+    rate_limit_client_id,
+)
 
 auth_bp = Blueprint("auth", __name__)
 
 
+def _token_payload(client_id: str, plan: str, status: str, epoch: int) -> Dict[str, Any]:
+    token, expires_in = issue_token(client_id, plan, status, epoch)
+    return {"access_token": token, "token_type": "Bearer", "expires_in": expires_in}
+
+
 @auth_bp.post("/signup")
 @limiter.limit("5 per hour")
 def signup():
     data = request.get_json(silent=True) or request.form or {}
-    nome = (data.get("nome") or "").strip()
-    email = (data.get("email") or "").strip().lower()
-    empresa = (data.get("empresa") or "").strip()
-    telefone = (data.get("telefone") or "").strip()
-    password = (data.get("password") or data.get("senha") or "").strip()
+    fields = signup_fields(data)
+    nome, email, empresa, telefone = fields["nome"], fields["email"], fields["empresa"], fields["telefone"]
+    password = fields["password"]
 
     # Honeypot (anti-bot): bots costumam preencher campos invisíveis.
     # Safe: não afeta usuários reais; não cria conta quando acionado.
-    honeypot = (data.get("company_site") or data.get("website") or "").strip()
-    if honeypot:
+    if fields["honeypot"]:
         return jsonify({"ok": True, "success": True, "message": "Conta trial criada com sucesso!"})
 
     # Captcha (Cloudflare Turnstile) - opcional.
     # - Em modo enforce, exige token válido.
     # - Em modo soft, tenta validar quando presente, mas não bloqueia por instabilidade.
-    captcha_token = (
-        data.get("captcha_token")
-        or data.get("cf_turnstile_response")
-        or data.get("cf-turnstile-response")
-        or data.get("cf_turnstile")
-        or ""
-    )
-    if (settings.TURNSTILE_SECRET_KEY and settings.CAPTCHA_ENFORCE) and not str(captcha_token or "").strip():
+    captcha_token = fields["captcha_token"]
+    if (settings.TURNSTILE_SECRET_KEY and settings.CAPTCHA_ENFORCE) and not captcha_token:
         return json_err("Confirme que você não é um robô.", 400, code="captcha_required")
 
-    if settings.TURNSTILE_SECRET_KEY and str(captcha_token or "").strip():
+    if settings.TURNSTILE_SECRET_KEY and captcha_token:
         remote = (request.headers.get("X-Forwarded-For") or request.remote_addr or "").split(",")[0].strip()
-        res = verify_turnstile(str(captcha_token), remoteip=remote)
+        res = verify_turnstile(captcha_token, remoteip=remote)
         if not res.ok and settings.CAPTCHA_ENFORCE:
             return json_err("Falha na verificação anti-spam. Tente novamente.", 400, code="captcha_invalid")
         if not res.ok:
@@ -66,6 +76,9 @@ def signup():
     if not ok_pw:
         return json_err(pw_msg, 400)
 
+    # PBKDF2 fora da transação: a conexão do pool não fica presa esperando o hash.
+    pw_hash = hash_password(password)
+
     conn = db()
     try:
         with conn:
@@ -86,18 +99,10 @@ def signup():
                     )
 
                 client_id = f"trial-{secrets.token_hex(8)}"
-                api_key = gen_api_key(client_id)
                 valid_until = now_utc() + timedelta(days=14)
-                pw_hash = hash_password(password)
 
                 cur.execute(
-                    """
-                    INSERT INTO clients (
-                        client_id, nome, email, empresa, telefone, valid_until,
-                        api_key, plan, status, usage_month, leads_used_month,
-                        password_hash, created_at, updated_at
-                    ) VALUES (%s,%s,%s,%s,%s,%s,%s,'trial','active',%s,0,%s,NOW(),NOW())
-                    """,
+                    SIGNUP_INSERT_SQL,
                     (
                         client_id,
                         nome or None,
@@ -105,11 +110,11 @@ def signup():
                         empresa or None,
                         telefone or None,
                         valid_until,
-                        api_key,
                         month_key(),
                         pw_hash,
                     ),
                 )
+                api_key = issue_api_key(cur, client_id)
 
         response = jsonify(
             {
@@ -145,52 +150,97 @@ def login():
         with conn:
             with conn.cursor(row_factory=dict_row) as cur:
                 cur.execute(
-                    "SELECT client_id, api_key, password_hash, plan, status, valid_until FROM clients WHERE email=%s",
+                    "SELECT client_id, password_hash, plan, status, valid_until, token_epoch FROM clients WHERE email=%s",
                     (email,),
                 )
                 row = cur.fetchone()
-                if not row:
-                    return json_err("Conta não encontrada", 404)
-
-                pw_hash = (row.get("password_hash") or "").strip()
-                if not pw_hash:
-                    return json_err("Conta sem senha. Use o suporte.", 400)
+    finally:
+        conn.close()
+    if not row:
+        return json_err("Conta não encontrada", 404)
 
-                if not verify_password(pw_hash, password):
-                    return json_err("Email ou senha inválidos", 401)
+    pw_hash = (row.get("password_hash") or "").strip()
+    if not pw_hash:
+        return json_err("Conta sem senha. Use o suporte.", 400)
 
-                if needs_rehash(pw_hash):
-                    new_hash = hash_password(password)
-                    cur.execute(
-                        "UPDATE clients SET password_hash=%s, updated_at=NOW() WHERE client_id=%s",
-                        (new_hash, row["client_id"]),
-                    )
+    # PBKDF2 no pool de processos (services/password_pool.py), sem conexão do banco presa.
+    if not verify_password(pw_hash, password):
+        return json_err("Email ou senha inválidos", 401)
+    new_hash = hash_password(password) if needs_rehash(pw_hash) else None
 
-                api_key = (row.get("api_key") or "").strip()
-                if not api_key:
-                    api_key = gen_api_key(row["client_id"])
-                    cur.execute(
-                        "UPDATE clients SET api_key=%s, updated_at=NOW() WHERE client_id=%s",
-                        (api_key, row["client_id"]),
-                    )
-
-                cur.execute("UPDATE clients SET last_login_at=NOW(), updated_at=NOW() WHERE client_id=%s", (row["client_id"],))
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                # Rehash e último login num UPDATE só.
+                cur.execute(
+                    """
+                    UPDATE clients
+                    SET password_hash = COALESCE(%s, password_hash), last_login_at = NOW(), updated_at = NOW()
+                    WHERE client_id = %s
+                    """,
+                    (new_hash, row["client_id"]),
+                )
+                # O banco só tem o hash das chaves: cada login emite uma chave de login nova. As de login mais
+                # antigas acima de API_KEYS_PER_CLIENT são apagadas; as de integração, nunca.
+                api_key, pruned = issue_login_key(cur, row["client_id"])
+        revoke_cached(pruned)
 
         login_user(AuthUser(client_id=row["client_id"], email=email, plan=row.get("plan") or "trial", status=row.get("status") or "active"))
 
-        response = jsonify(
-            {
-                "ok": True,
-                "success": True,
-                "client_id": row.get("client_id"),
-                "plan": (row.get("plan") or "trial"),
-                "status": (row.get("status") or "active"),
-                "valid_until": iso(row.get("valid_until")),
-                "message": "Login realizado com sucesso.",
-            }
-        )
+        payload = {
+            "ok": True,
+            "success": True,
+            "client_id": row.get("client_id"),
+            "plan": (row.get("plan") or "trial"),
+            "status": (row.get("status") or "active"),
+            "valid_until": iso(row.get("valid_until")),
+            "message": "Login realizado com sucesso.",
+        }
+        if tokens_enabled():
+            payload.update(_token_payload(row["client_id"], payload["plan"], payload["status"], row.get("token_epoch") or 0))
+        response = jsonify(payload)
         response.headers["X-API-KEY"] = api_key
         response.headers["Authorization"] = f"Bearer {api_key}"
         return response
     finally:
         conn.close()
+
+
+@auth_bp.post("/token")
+@limiter.limit("60 per minute", key_func=rate_limit_client_id)
+def token():
+    """Access token curto a partir da api_key (o dashboard renova por aqui quando o token expira)."""
+
+    if not tokens_enabled():
+        return json_err("Access tokens desativados (SESSION_TOKEN_SECRET).", 503, code="tokens_disabled")
+    client_id = get_client_id_from_request()
+    if not client_id:
+        return json_err("client_id obrigatório", 400)
+    # Token não renova token: senão um token vazado valeria para sempre.
+    if is_token(get_api_key_from_headers()):
+        return json_err("Envie a api_key para gerar um token.", 403, code="auth_required")
+    ok_auth, row, msg = require_client_auth(client_id)
+    if not ok_auth:
+        return json_err(msg, 403, code="auth_required")
+    epoch = token_epoch(client_id)
+    if epoch is None:
+        return json_err("Cliente não encontrado", 404)
+    plan = (row.get("plan") or "trial").lower()
+    status = row.get("status") or "active"
+    return json_ok({"client_id": client_id, **_token_payload(client_id, plan, status, epoch)})
+
+
+@auth_bp.post("/tokens/revoke")
+@limiter.limit("10 per minute", key_func=rate_limit_client_id)
+def tokens_revoke():
+    """Invalida todos os access tokens do cliente (as api_keys continuam valendo)."""
+
+    client_id = get_client_id_from_request()
+    if not client_id:
+        return json_err("client_id obrigatório", 400)
+    ok_auth, _, msg = require_client_auth(client_id)
+    if not ok_auth:
+        return json_err(msg, 403, code="auth_required")
+    revoke_tokens(client_id)
+    return json_ok({"client_id": client_id, "revoked": True})
@@ -1,5 +1,3 @@
-import json
-
 from flask import Blueprint, request
 from psycopg.rows import dict_row
 
@@ -11,10 +9,12 @@ from services.billing_service import (
     find_client_id_from_payload,
     kiwify_event_to_status,
     kiwify_get_sale,
+    record_billing_event,
     stripe_price_id,
     upsert_subscription,
 )
 from services.db import db
+from services.lead_service import client_usage
 from services.utils import get_client_id_from_request, get_header, json_err, json_ok, rate_limit_client_id
 
 billing_bp = Blueprint("billing", __name__)
@@ -31,6 +31,7 @@ def billing_status():
     if not ok_auth:
         return json_err(msg, 403, code="auth_required")
 
+    usage_month, used = client_usage(client_id, client_row)
     conn = db()
     try:
         with conn:
@@ -46,8 +47,8 @@ def billing_status():
                 "client": {
                     "plan": client_row.get("plan"),
                     "status": client_row.get("status"),
-                    "usage_month": client_row.get("usage_month"),
-                    "leads_used_month": int(client_row.get("leads_used_month") or 0),
+                    "usage_month": usage_month,
+                    "leads_used_month": used,
                 },
             }
         )
@@ -122,19 +123,7 @@ def billing_webhook():
     event_type = (payload.get("type") or payload.get("event_type") or "unknown").strip()
     client_id = (payload.get("client_id") or (payload.get("data") or {}).get("client_id") or "").strip()
 
-    conn = db()
-    try:
-        with conn:
-            with conn.cursor(row_factory=dict_row) as cur:
-                cur.execute(
-                    """
-                    INSERT INTO billing_events (provider, event_type, client_id, payload)
-                    VALUES (%s,%s,%s,%s::jsonb)
-                    """,
-                    (provider, event_type, client_id or None, json.dumps(payload)),
-                )
-    finally:
-        conn.close()
+    record_billing_event(provider, event_type, client_id, payload)
 
     plan = (payload.get("plan") or "").strip().lower()
     status = (payload.get("status") or "").strip().lower()
@@ -176,16 +165,7 @@ def kiwify_webhook():
 
     status = kiwify_event_to_status(event_type)
 
-    conn = db()
-    try:
-        with conn:
-            with conn.cursor(row_factory=dict_row) as cur:
-                cur.execute(
-                    "INSERT INTO billing_events (provider, event_type, client_id, payload) VALUES (%s,%s,%s,%s::jsonb)",
-                    (provider, event_type, client_id or None, json.dumps(payload)),
-                )
-    finally:
-        conn.close()
+    record_billing_event(provider, event_type, client_id, payload)
 
     if client_id and plan:
         upsert_subscription(client_id, plan=plan, status=status, provider=provider)
@@ -7,7 +7,7 @@ import sentry_sdk
 
 from extensions import limiter
 from services import settings
-from services.db import db
+from services.db import db, replica_status
 from services.utils import iso, json_ok, now_utc
 from services.lead_service import lead_temperature
 
@@ -56,7 +56,7 @@ def health_db():
         with conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT 1")
-        return json_ok({"db": True, "error": "", "ts": iso(now_utc())})
+        return json_ok({"db": True, "error": "", "replica": replica_status(), "ts": iso(now_utc())})
     except Exception as exc:
         return json_ok({"db": False, "error": repr(exc), "ts": iso(now_utc())})
     finally:
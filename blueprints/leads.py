@@ -1,32 +1,52 @@
-import json
 import random
 import string
 from datetime import timedelta
-from typing import Any, Dict
 
 import psycopg
-from flask import Blueprint, Response, request, stream_with_context
+from flask import Blueprint, Response, request, send_file, stream_with_context
 from psycopg.rows import dict_row
 
 from extensions import limiter
 from services import settings
-from services.auth_service import gen_api_key, require_client_auth
-from services.db import db, ensure_client_row, get_active_leads_query
-from services.demo_service import bump_demo_counter, demo_rate_limited, require_demo_key
-from services.cache import cache_delete, cache_delete_prefix, cache_get_json, cache_set_json
+from services.api_keys import forget_client, issue_api_key
+from services.auth_service import require_client_auth
+from services.db import READ_ONLY, db, ensure_client_row, get_active_leads_query, note_client_write
+from services.statements import execute as execute_statement
+from services.demo_service import bump_demo_counter, demo_rate_limited, require_admin_key, require_demo_key
+from services.cache import cache_delete_prefix, cache_get_json, cache_set_json
+from services.changes import SOFT_DELETE_SQL, decode_cursor, fetch_changes
+from services.cohorts import DEFAULT_WEEKS, MAX_WEEKS, MIN_WEEKS, analytics_unavailable, fetch_cohorts
+from services.compression import no_compress
+from services.export import FORMAT_CSV, FORMATS, format_unavailable, parse_export_filters, stream_export
+from services.export_jobs import STATUS_DONE, STATUS_EXPIRED, create_job, get_job, job_file, job_payload
+from services.insights import bins_key, fetch_insights, parse_bins
 from services.lead_service import (
+    ACTION_LIST_LIMIT,
+    action_item,
+    plan_limit_error,
+    prever_fields,
+    prever_insert_params,
     check_quota_and_bump,
+    client_usage,
     count_leads,
-    count_status,
+    dashboard_payload,
+    fetch_action_candidates,
     fetch_recent_leads,
     get_threshold,
     hot_leads_today,
-    lead_temperature,
+    new_lead_row,
     prever_rate_limit,
+    score_lead,
     top_origens,
 )
+from services.live import stream as live_stream, subscribe as live_subscribe, unsubscribe as live_unsubscribe
+from services.metrics_service import compute_metrics, get_metrics_snapshot, metrics_payload
+from services.payloads import fetch_payload, store_payload
+from services.ranking import rank_add_lead, rank_invalidate, rank_remove, rank_set_label, rank_top
+from services.session_tokens import forget_epoch
 from services.utils import (
     client_ip,
+    get_api_key_from_headers,
     get_client_id_from_request,
     json_err,
     json_ok,
@@ -34,16 +54,14 @@ from services.utils import (
     month_key,
     now_utc,
     rate_limit_client_id,
-    safe_float,
     safe_int,
 )
-from services.validation import sanitize_name, sanitize_origin, sanitize_phone
 
 leads_bp = Blueprint("leads", __name__)
 
 
 def _prever_limit() -> str:
-    return prever_rate_limit(get_client_id_from_request())
+    return prever_rate_limit(get_client_id_from_request(), get_api_key_from_headers())
 
 
 @leads_bp.get("/prever_example")
@@ -115,21 +133,14 @@ def criar_cliente():
 
     row = ensure_client_row(client_id, plan=plan)
 
-    api_key = (row.get("api_key") or "").strip()
-    if not api_key:
-        api_key = gen_api_key(client_id)
-        conn = db()
-        try:
-            with conn:
-                with conn.cursor(row_factory=dict_row) as cur:
-                    cur.execute(
-                        "UPDATE clients SET api_key=%s, plan=%s, updated_at=NOW() WHERE client_id=%s",
-                        (api_key, plan, client_id),
-                    )
-                    cur.execute("SELECT * FROM clients WHERE client_id=%s", (client_id,))
-                    row = cur.fetchone() or row
-        finally:
-            conn.close()
+    # Só o hash das chaves fica no banco: cada chamada emite uma chave nova para o cliente.
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                api_key = issue_api_key(cur, client_id)
+    finally:
+        conn.close()
 
     meta = settings.PLAN_CATALOG.get((row.get("plan") or plan).lower(), settings.PLAN_CATALOG["trial"])
     return json_ok(
@@ -156,6 +167,7 @@ def client_meta():
 
     plan = (row.get("plan") or "trial").strip().lower()
     cat = settings.PLAN_CATALOG.get(plan, settings.PLAN_CATALOG["trial"])
+    usage_month, used = client_usage(client_id, row)
     return json_ok(
         {
             "client_id": client_id,
@@ -164,8 +176,8 @@ def client_meta():
             "price_brl_month": cat["price_brl_month"],
             "setup_fee_brl": cat.get("setup_fee_brl", 0),
             "lead_limit_month": cat["lead_limit_month"],
-            "leads_used_this_month": int(row.get("leads_used_month") or 0),
-            "usage_month": row.get("usage_month") or month_key(),
+            "leads_used_this_month": used,
+            "usage_month": usage_month,
             "ts": iso(now_utc()),
         }
     )
@@ -203,12 +215,15 @@ def set_plan():
                 if status:
                     sets.append("status=%s")
                     vals.append(status)
+                sets.append("token_epoch=token_epoch + 1")  # access tokens levam plano/status
                 sets.append("updated_at=NOW()")
                 q = f"UPDATE clients SET {', '.join(sets)} WHERE client_id=%s"
                 vals.append(client_id)
                 cur.execute(q, tuple(vals))
                 cur.execute("SELECT * FROM clients WHERE client_id=%s", (client_id,))
                 row = cur.fetchone() or {}
+        forget_client(client_id)
+        forget_epoch(client_id)
         return json_ok({"client_id": client_id, "plan": row.get("plan"), "status": row.get("status")})
     finally:
         conn.close()
@@ -241,111 +256,34 @@ def prever():
         return json_err("Workspace inativo. Fale com o suporte para reativar.", 403, code="inactive")
 
     plan = (client_row.get("plan") or "trial").lower()
-    cat = settings.PLAN_CATALOG.get(plan, settings.PLAN_CATALOG["trial"])
-    used = int(client_row.get("leads_used_month") or 0)
-    limit = int(cat.get("lead_limit_month") or 0)
-    if limit > 0 and used >= limit:
-        return json_err(
-            "Limite mensal atingido. Faça upgrade para continuar.",
-            402,
-            code="plan_limit",
-            plan=plan,
-            used=used,
-            limit=limit,
-            price_brl_month=cat.get("price_brl_month"),
-            setup_fee_brl=cat.get("setup_fee_brl", 0),
-        )
-
-    lead = data.get("lead") or {}
-    nome = sanitize_name(data.get("nome") or lead.get("nome") or "")
-    email = (data.get("email_lead") or data.get("email") or lead.get("email_lead") or lead.get("email") or "").strip()
-    telefone = sanitize_phone(data.get("telefone") or lead.get("telefone") or "")
-
-    origem = sanitize_origin(data.get("origem") or lead.get("origem") or lead.get("source") or "")
-
-    tempo_site = safe_int(data.get("tempo_site") if "tempo_site" in data else lead.get("tempo_site"), 0)
-    paginas_visitadas = safe_int(data.get("paginas_visitadas") if "paginas_visitadas" in data else lead.get("paginas_visitadas"), 0)
-    clicou_preco = safe_int(data.get("clicou_preco") if "clicou_preco" in data else lead.get("clicou_preco"), 0)
-
-    base = 0.10
-    base += min(tempo_site / 400, 0.25)
-    base += min(paginas_visitadas / 10, 0.25)
-    base += 0.20 if clicou_preco else 0.0
-    if telefone and len(telefone) >= 10:
-        base += 0.06
-    if nome and len(nome) >= 4:
-        base += 0.04
-
-    prob = max(0.02, min(0.98, base))
-    score = int(round(prob * 100))
-    label = 1 if prob >= 0.70 else (0 if prob < 0.35 else None)
-
-    payload = lead if isinstance(lead, dict) else {}
-    payload.setdefault("nome", nome)
-    payload.setdefault("email", email)
-    payload.setdefault("email_lead", email)
-    payload.setdefault("telefone", telefone)
-    payload.setdefault("origem", origem or payload.get("origem", ""))
-    payload.setdefault("tempo_site", tempo_site)
-    payload.setdefault("paginas_visitadas", paginas_visitadas)
-    payload.setdefault("clicou_preco", clicou_preco)
+    limit_err = plan_limit_error(plan, int(client_row.get("leads_used_month") or 0))
+    if limit_err:
+        return json_err("Limite mensal atingido. Faça upgrade para continuar.", 402, **limit_err)
 
+    fields = prever_fields(data)
+    prob, score, label = score_lead(fields)
     conn = db()
     try:
         with conn:
             with conn.cursor(row_factory=dict_row) as cur:
-                cur.execute(
-                    "SELECT plan, leads_used_month FROM clients WHERE client_id=%s FOR UPDATE",
-                    (client_id,),
-                )
+                mk = month_key()
+                execute_statement(cur, "prever_lock_usage", (mk, client_id))
                 locked_client = cur.fetchone() or {}
                 plan_locked = (locked_client.get("plan") or client_row.get("plan") or "trial").lower()
-                cat_locked = settings.PLAN_CATALOG.get(plan_locked, settings.PLAN_CATALOG["trial"])
-                used_locked = int(locked_client.get("leads_used_month") or 0)
-                limit_locked = int(cat_locked.get("lead_limit_month") or 0)
-                if limit_locked > 0 and used_locked >= limit_locked:
-                    return json_err(
-                        "Limite mensal atingido. Faça upgrade para continuar.",
-                        402,
-                        code="plan_limit",
-                        plan=plan_locked,
-                        used=used_locked,
-                        limit=limit_locked,
-                        price_brl_month=cat_locked.get("price_brl_month"),
-                        setup_fee_brl=cat_locked.get("setup_fee_brl", 0),
-                    )
-
-                cur.execute(
-                    """
-                    INSERT INTO leads
-                      (client_id, nome, email_lead, telefone, origem, tempo_site, paginas_visitadas, clicou_preco,
-                       payload, probabilidade, score, label, virou_cliente, created_at, updated_at)
-                    VALUES
-                      (%s,%s,%s,%s,%s,%s,%s,%s,%s::jsonb,%s,%s,%s,NULL,NOW(),NOW())
-                    RETURNING id, created_at
-                    """,
-                    (
-                        client_id,
-                        nome,
-                        email,
-                        telefone,
-                        origem,
-                        tempo_site,
-                        paginas_visitadas,
-                        clicou_preco,
-                        json.dumps(payload),
-                        float(prob),
-                        int(score),
-                        label,
-                    ),
+                limit_err = plan_limit_error(plan_locked, int(locked_client.get("leads_used_month") or 0))
+                if limit_err:
+                    return json_err("Limite mensal atingido. Faça upgrade para continuar.", 402, **limit_err)
+
+                execute_statement(
+                    cur,
+                    "prever_insert_lead",
+                    prever_insert_params(client_id, fields, prob, score, label),
                 )
                 row = cur.fetchone() or {}
-                cur.execute(
-                    "UPDATE clients SET leads_used_month = leads_used_month + 1, updated_at=NOW() WHERE client_id=%s",
-                    (client_id,),
-                )
+                execute_statement(cur, "prever_bump_usage", (mk, mk, client_id))
 
-        cache_delete(f"acao_do_dia:{client_id}")
+        note_client_write(client_id)
+        rank_add_lead(client_id, new_lead_row(row.get("id"), row.get("created_at"), fields, prob, score))
         cache_delete_prefix(f"insights:{client_id}:")
 
         return json_ok(
@@ -359,9 +297,9 @@ def prever():
                 "created_at": iso(row.get("created_at")),
             }
         )
-    except (psycopg.errors.UndefinedColumn, psycopg.errors.NotNullViolation):
+    except (psycopg.errors.UndefinedColumn, psycopg.errors.UndefinedTable, psycopg.errors.NotNullViolation):
         return json_err(
-            "Esquema do banco desatualizado. Rode as migrations do Alembic.",
+            "Esquema do banco desatualizado. Rode python -m services.migrations up.",
             500,
             code="schema_outdated",
         )
@@ -388,31 +326,9 @@ def dashboard_data():
 
     total_leads = count_leads(client_id)
     rows = fetch_recent_leads(client_id, limit=per_page, offset=offset)
-    convertidos, negados, pendentes = count_status(rows)
     top_origens_rows = top_origens(client_id, days=30, limit=6)
     hot_leads = hot_leads_today(client_id, limit=20)
-
-    def norm(item: Dict[str, Any]) -> Dict[str, Any]:
-        rr = dict(item)
-        rr["created_at"] = iso(rr.get("created_at"))
-        return rr
-
-    return json_ok(
-        {
-            "client_id": client_id,
-            "convertidos": convertidos,
-            "negados": negados,
-            "pendentes": pendentes,
-            "page": page,
-            "per_page": per_page,
-            "total_leads": total_leads,
-            "top_origens_30d": top_origens_rows,
-            "hot_leads_today": hot_leads,
-            "hot_leads_today_tz": "America/Sao_Paulo",
-            "dados": [norm(r) for r in rows],
-            "total_recentes_considerados": len(rows),
-        }
-    )
+    return json_ok(dashboard_payload(client_id, page, per_page, total_leads, rows, top_origens_rows, hot_leads))
 
 
 @leads_bp.post("/confirmar_venda")
@@ -433,10 +349,11 @@ def confirmar_venda():
         with conn:
             with conn.cursor() as cur:
                 cur.execute(
-                    "UPDATE leads SET virou_cliente=1, updated_at=NOW() WHERE client_id=%s AND id=%s",
+                    "UPDATE leads SET virou_cliente=1, labeled_at=NOW(), updated_at=NOW() WHERE client_id=%s AND id=%s",
                     (client_id, lead_id),
                 )
-        cache_delete(f"acao_do_dia:{client_id}")
+        note_client_write(client_id)
+        rank_set_label(client_id, lead_id, 1.0)
         cache_delete_prefix(f"insights:{client_id}:")
         return json_ok({"client_id": client_id, "lead_id": lead_id, "virou_cliente": 1})
     finally:
@@ -461,50 +378,126 @@ def negar_venda():
         with conn:
             with conn.cursor() as cur:
                 cur.execute(
-                    "UPDATE leads SET virou_cliente=0, updated_at=NOW() WHERE client_id=%s AND id=%s",
+                    "UPDATE leads SET virou_cliente=0, labeled_at=NOW(), updated_at=NOW() WHERE client_id=%s AND id=%s",
                     (client_id, lead_id),
                 )
-        cache_delete(f"acao_do_dia:{client_id}")
+        note_client_write(client_id)
+        rank_set_label(client_id, lead_id, 0.0)
         cache_delete_prefix(f"insights:{client_id}:")
         return json_ok({"client_id": client_id, "lead_id": lead_id, "virou_cliente": 0})
     finally:
         conn.close()
 
 
-@leads_bp.get("/metrics")
-@limiter.limit("100 per minute")
-def metrics():
-    if not settings.DATABASE_URL:
-        return json_ok({"db": False, "reason": "DATABASE_URL ausente", "ts": iso(now_utc())})
+@leads_bp.post("/excluir_lead")
+# Mesmo teto do /prever: CRM sincronizando exclusões em lote; cada chamada é um UPDATE pela PK.
+@limiter.limit("600 per minute", key_func=rate_limit_client_id)
+def excluir_lead():
+    """Soft delete: some do dashboard/export e sai como tombstone no /leads_changes."""
+
+    data = request.get_json(silent=True) or {}
+    client_id = get_client_id_from_request()
+    lead_id = safe_int(data.get("lead_id"), 0)
+    if not client_id or not lead_id:
+        return json_err("client_id e lead_id obrigatórios", 400)
+
+    ok_auth, _, msg = require_client_auth(client_id)
+    if not ok_auth:
+        return json_err(msg, 403, code="auth_required")
 
     conn = db()
     try:
         with conn:
-            with conn.cursor(row_factory=dict_row) as cur:
-                active_leads_query = get_active_leads_query()
-                cur.execute(f"SELECT COUNT(*) AS total {active_leads_query};")
-                total = int(cur.fetchone()["total"])
-                cur.execute(
-                    f"SELECT COUNT(*) AS labeled {active_leads_query} AND virou_cliente IS NOT NULL;"
-                )
-                labeled = int(cur.fetchone()["labeled"])
-                cur.execute(
-                    f"SELECT COUNT(*) AS pending {active_leads_query} AND virou_cliente IS NULL;"
-                )
-                pending = int(cur.fetchone()["pending"])
-        return json_ok(
-            {
-                "db": True,
-                "total_leads": total,
-                "labeled": labeled,
-                "pending": pending,
-                "ts": iso(now_utc()),
-            }
-        )
+            with conn.cursor() as cur:
+                cur.execute(SOFT_DELETE_SQL, (client_id, lead_id))
+                deleted = cur.rowcount > 0
+        if deleted:
+            note_client_write(client_id)
+            rank_remove(client_id, lead_id)
+            cache_delete_prefix(f"insights:{client_id}:")
+        return json_ok({"client_id": client_id, "lead_id": lead_id, "deleted": deleted})
     finally:
         conn.close()
 
 
+@leads_bp.get("/leads_changes")
+@limiter.limit("600 per minute", key_func=rate_limit_client_id)
+def leads_changes():
+    """Delta de leads desde ?cursor= (vazio = desde o começo). Guarde next_cursor para a próxima chamada."""
+
+    client_id = get_client_id_from_request()
+    if not client_id:
+        return json_err("client_id obrigatório", 400)
+
+    ok_auth, _, msg = require_client_auth(client_id)
+    if not ok_auth:
+        return json_err(msg, 403, code="auth_required")
+
+    try:
+        page = fetch_changes(client_id, request.args.get("cursor") or "", safe_int(request.args.get("limit"), 0))
+    except ValueError:
+        return json_err("cursor inválido", 400, code="invalid_cursor")
+    return json_ok({"client_id": client_id, **page})
+
+
+@leads_bp.get("/leads_stream")
+@no_compress
+@limiter.limit("60 per minute", key_func=rate_limit_client_id)
+def leads_stream():
+    """SSE com leads quentes novos/reescorados do cliente (substitui o polling de /acao_do_dia).
+
+    Eventos: "lead" (upsert; rescoring que esfriou o lead vem com temperatura != hot), "delete" e "reset"
+    (recarregar a lista).
+    Reconexão: mande o último id recebido em Last-Event-ID.
+    """
+
+    client_id = get_client_id_from_request()
+    if not client_id:
+        return json_err("client_id obrigatório", 400)
+
+    ok_auth, _, msg = require_client_auth(client_id)
+    if not ok_auth:
+        return json_err(msg, 403, code="auth_required")
+
+    last_event_id = (request.headers.get("Last-Event-ID") or request.args.get("last_event_id") or "").strip()
+    try:
+        decode_cursor(last_event_id)
+    except ValueError:
+        return json_err("Last-Event-ID inválido", 400, code="invalid_cursor")
+
+    sub = live_subscribe(client_id)
+    if sub is None:
+        return json_err(
+            "Muitas conexões de stream abertas para este cliente.",
+            429,
+            code="too_many_streams",
+            limit=settings.SSE_MAX_STREAMS_PER_CLIENT,
+        )
+
+    resp = Response(stream_with_context(live_stream(sub, last_event_id)), mimetype="text/event-stream")
+    # Gerador que nunca começou não roda o finally: garante a saída pelo close da resposta.
+    resp.call_on_close(lambda: live_unsubscribe(sub))
+    resp.headers["Cache-Control"] = "no-cache, no-transform"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+@leads_bp.get("/metrics")
+@limiter.limit("100 per minute")
+def metrics():
+    if not settings.DATABASE_URL:
+        return json_ok({"db": False, "reason": "DATABASE_URL ausente", "ts": iso(now_utc())})
+
+    # Padrão: snapshot estimado (pg_class/pg_stats). ?exact=1 faz COUNT real e exige ADMIN_KEY.
+    if (request.args.get("exact") or "").strip().lower() in ("1", "true", "yes"):
+        ok_admin, _ = require_admin_key()
+        if not ok_admin:
+            return json_err("Unauthorized", 403, code="admin_required")
+        return json_ok(metrics_payload(compute_metrics(exact=True)))
+
+    return json_ok(metrics_payload(get_metrics_snapshot()))
+
+
 @leads_bp.get("/insights")
 @limiter.limit("600 per minute", key_func=rate_limit_client_id)
 def insights():
@@ -518,111 +511,53 @@ def insights():
     if not ok_auth:
         return json_err(msg, 403, code="auth_required")
 
-    cache_key = f"insights:{client_id}:{days}"
+    try:
+        edges, score_bins = parse_bins(request.args)
+    except ValueError as exc:
+        return json_err(f"Faixas inválidas: {exc}", 400, code="invalid_bands")
+
+    cache_key = f"insights:{client_id}:{days}:{bins_key(edges, score_bins)}"
     cached = cache_get_json(cache_key)
     if cached:
         return json_ok(cached)
 
     threshold = get_threshold(client_id)
     since = now_utc() - timedelta(days=days)
-
-    conn = db()
-    try:
-        with conn:
-            with conn.cursor(row_factory=dict_row) as cur:
-                active_leads_query = get_active_leads_query()
-                cur.execute(
-                    f"""
-                    SELECT
-                      COUNT(*) AS window_total,
-                      COUNT(*) FILTER (WHERE virou_cliente IS NOT NULL) AS labeled,
-                      COUNT(*) FILTER (WHERE virou_cliente = 1) AS converted,
-                      COUNT(*) FILTER (WHERE virou_cliente = 0) AS denied,
-
-                      COUNT(*) FILTER (WHERE probabilidade IS NOT NULL AND probabilidade >= 0.0 AND probabilidade < 0.2 AND virou_cliente IS NOT NULL) AS b0_labeled,
-                      COUNT(*) FILTER (WHERE probabilidade IS NOT NULL AND probabilidade >= 0.0 AND probabilidade < 0.2 AND virou_cliente = 1) AS b0_converted,
-                      COUNT(*) FILTER (WHERE probabilidade IS NOT NULL AND probabilidade >= 0.2 AND probabilidade < 0.4 AND virou_cliente IS NOT NULL) AS b1_labeled,
-                      COUNT(*) FILTER (WHERE probabilidade IS NOT NULL AND probabilidade >= 0.2 AND probabilidade < 0.4 AND virou_cliente = 1) AS b1_converted,
-                      COUNT(*) FILTER (WHERE probabilidade IS NOT NULL AND probabilidade >= 0.4 AND probabilidade < 0.6 AND virou_cliente IS NOT NULL) AS b2_labeled,
-                      COUNT(*) FILTER (WHERE probabilidade IS NOT NULL AND probabilidade >= 0.4 AND probabilidade < 0.6 AND virou_cliente = 1) AS b2_converted,
-                      COUNT(*) FILTER (WHERE probabilidade IS NOT NULL AND probabilidade >= 0.6 AND probabilidade < 0.8 AND virou_cliente IS NOT NULL) AS b3_labeled,
-                      COUNT(*) FILTER (WHERE probabilidade IS NOT NULL AND probabilidade >= 0.6 AND probabilidade < 0.8 AND virou_cliente = 1) AS b3_converted,
-                      COUNT(*) FILTER (WHERE probabilidade IS NOT NULL AND probabilidade >= 0.8 AND probabilidade < 1.01 AND virou_cliente IS NOT NULL) AS b4_labeled,
-                      COUNT(*) FILTER (WHERE probabilidade IS NOT NULL AND probabilidade >= 0.8 AND probabilidade < 1.01 AND virou_cliente = 1) AS b4_converted
-                    {active_leads_query}
-                      AND client_id=%s
-                      AND created_at >= %s
-                    """,
-                    (client_id, since),
-                )
-                agg = cur.fetchone() or {}
-
-                cur.execute(
-                    f"""
-                    SELECT
-                      DATE(created_at) AS day,
-                      COUNT(*) AS total,
-                      COUNT(*) FILTER (WHERE virou_cliente = 1) AS converted,
-                      COUNT(*) FILTER (WHERE virou_cliente = 0) AS denied,
-                      COUNT(*) FILTER (WHERE virou_cliente IS NULL) AS pending
-                    {active_leads_query}
-                      AND client_id=%s
-                      AND created_at >= %s
-                    GROUP BY DATE(created_at)
-                    ORDER BY DATE(created_at) ASC
-                    """,
-                    (client_id, since),
-                )
-                day_rows = cur.fetchall() or []
-    finally:
-        conn.close()
-
-    def _rate(converted: int, labeled: int) -> float:
-        return round(float((converted / labeled) if labeled else 0.0), 4)
-
-    bands = [
-        {"band": "0-0.2", "labeled": int(agg.get("b0_labeled") or 0), "converted": int(agg.get("b0_converted") or 0), "conversion_rate": _rate(int(agg.get("b0_converted") or 0), int(agg.get("b0_labeled") or 0))},
-        {"band": "0.2-0.4", "labeled": int(agg.get("b1_labeled") or 0), "converted": int(agg.get("b1_converted") or 0), "conversion_rate": _rate(int(agg.get("b1_converted") or 0), int(agg.get("b1_labeled") or 0))},
-        {"band": "0.4-0.6", "labeled": int(agg.get("b2_labeled") or 0), "converted": int(agg.get("b2_converted") or 0), "conversion_rate": _rate(int(agg.get("b2_converted") or 0), int(agg.get("b2_labeled") or 0))},
-        {"band": "0.6-0.8", "labeled": int(agg.get("b3_labeled") or 0), "converted": int(agg.get("b3_converted") or 0), "conversion_rate": _rate(int(agg.get("b3_converted") or 0), int(agg.get("b3_labeled") or 0))},
-        {"band": "0.8-1.0", "labeled": int(agg.get("b4_labeled") or 0), "converted": int(agg.get("b4_converted") or 0), "conversion_rate": _rate(int(agg.get("b4_converted") or 0), int(agg.get("b4_labeled") or 0))},
-    ]
-
-    series = [
-        {
-            "day": (r.get("day").isoformat() if r.get("day") else ""),
-            "total": int(r.get("total") or 0),
-            "converted": int(r.get("converted") or 0),
-            "denied": int(r.get("denied") or 0),
-            "pending": int(r.get("pending") or 0),
-        }
-        for r in day_rows
-    ]
-
-    labeled_all = int(agg.get("labeled") or 0)
-    conv_all = int(agg.get("converted") or 0)
-    den_all = int(agg.get("denied") or 0)
-    overall_rate = (conv_all / labeled_all) if labeled_all else 0.0
+    agg = fetch_insights(client_id, since, edges, score_bins)
 
     payload = {
         "client_id": client_id,
         "threshold": float(threshold),
-        "overall": {
-            "window_total": int(agg.get("window_total") or 0),
-            "labeled": labeled_all,
-            "converted": conv_all,
-            "denied": den_all,
-            "conversion_rate": round(float(overall_rate), 4),
-        },
-        "bands": bands,
-        "series": series,
+        **agg,
         "window_days": days,
     }
     cache_set_json(cache_key, payload)
     return json_ok(payload)
 
 
+@leads_bp.get("/cohorts")
+@limiter.limit("120 per minute", key_func=rate_limit_client_id)
+def cohorts():
+    """Coortes semanais (conversão acumulada por semana de chegada) e latência até o rótulo por origem."""
+
+    client_id = get_client_id_from_request()
+    if not client_id:
+        return json_err("client_id obrigatório", 400)
+
+    ok_auth, _, msg = require_client_auth(client_id)
+    if not ok_auth:
+        return json_err(msg, 403, code="auth_required")
+
+    unavailable = analytics_unavailable()
+    if unavailable:
+        return json_err(unavailable, 503, code="analytics_unavailable")
+
+    weeks = max(MIN_WEEKS, min(safe_int(request.args.get("weeks"), DEFAULT_WEEKS), MAX_WEEKS))
+    return json_ok(fetch_cohorts(client_id, weeks))
+
+
 @leads_bp.get("/leads_export.csv")
+@leads_bp.get("/leads_export")
 @limiter.limit("600 per minute", key_func=rate_limit_client_id)
 def leads_export():
     client_id = get_client_id_from_request()
@@ -633,80 +568,102 @@ def leads_export():
     if not ok_auth:
         return json_err(msg, 403, code="auth_required")
 
-    # CSV seguro: aplica quoting adequado e mitiga CSV injection (Excel/Sheets).
-    import csv
-    import io
-
-    def csv_safe(value: Any) -> str:
-        s = "" if value is None else str(value)
-        # Protege contra fórmulas maliciosas ao abrir em planilhas.
-        if s.startswith(("=", "+", "-", "@")):
-            return "'" + s
-        return s
-
-    def generate_csv():
-        conn = db()
-        cur = None
-        try:
-            cur = conn.cursor(row_factory=dict_row)
-            active_leads_query = get_active_leads_query()
-            cur.execute(
-                f"""
-                SELECT nome, email_lead, telefone, tempo_site, paginas_visitadas, clicou_preco,
-                       probabilidade, score, created_at, virou_cliente
-                {active_leads_query}
-                  AND client_id=%s
-                ORDER BY created_at DESC
-                """,
-                (client_id,),
-            )
-
-            buf = io.StringIO()
-            writer = csv.writer(buf)
-            writer.writerow([
-                "nome",
-                "email",
-                "telefone",
-                "tempo_site",
-                "paginas_visitadas",
-                "clicou_preco",
-                "probabilidade",
-                "score",
-                "created_at",
-                "virou_cliente",
-            ])
-            yield buf.getvalue()
-            buf.seek(0)
-            buf.truncate(0)
-
-            while True:
-                rows = cur.fetchmany(1000)
-                if not rows:
-                    break
-                for r in rows:
-                    writer.writerow([
-                        csv_safe(r.get("nome")),
-                        csv_safe(r.get("email_lead")),
-                        csv_safe(r.get("telefone")),
-                        csv_safe(r.get("tempo_site")),
-                        csv_safe(r.get("paginas_visitadas")),
-                        csv_safe(r.get("clicou_preco")),
-                        csv_safe(r.get("probabilidade")),
-                        csv_safe(r.get("score")),
-                        csv_safe(iso(r.get("created_at")) or ""),
-                        csv_safe(r.get("virou_cliente")),
-                    ])
-                yield buf.getvalue()
-                buf.seek(0)
-                buf.truncate(0)
-        finally:
-            try:
-                if cur is not None:
-                    cur.close()
-            finally:
-                conn.close()
-
-    return Response(stream_with_context(generate_csv()), mimetype="text/csv")
+    fmt = (request.args.get("format") or FORMAT_CSV).strip().lower()
+    err = format_unavailable(fmt)
+    if err:
+        return json_err(err, 400, code="format_unavailable")
+
+    try:
+        filters = parse_export_filters(request.args)
+    except ValueError as exc:
+        return json_err(str(exc), 400, code="invalid_filter")
+
+    include_archived = (request.args.get("include_archived") or "").strip().lower() in ("1", "true", "yes")
+    # Gerado em streaming (COPY para CSV, lotes de cursor server-side nos demais): services/export.py.
+    mimetype, ext = FORMATS[fmt]
+    return Response(
+        stream_with_context(stream_export(client_id, fmt, include_archived, filters=filters)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="leads.{ext}"'},
+    )
+
+
+def _export_job_auth():
+    client_id = get_client_id_from_request()
+    if not client_id:
+        return None, json_err("client_id obrigatório", 400)
+    ok_auth, _, msg = require_client_auth(client_id)
+    if not ok_auth:
+        return None, json_err(msg, 403, code="auth_required")
+    return client_id, None
+
+
+@leads_bp.post("/export_jobs")
+@limiter.limit("30 per minute", key_func=rate_limit_client_id)
+def export_job_create():
+    client_id, err_resp = _export_job_auth()
+    if err_resp:
+        return err_resp
+
+    data = request.get_json(silent=True) or {}
+    fmt = str(data.get("format") or request.args.get("format") or FORMAT_CSV).strip().lower()
+    err = format_unavailable(fmt)
+    if err:
+        return json_err(err, 400, code="format_unavailable")
+    include_archived = str(data.get("include_archived") or request.args.get("include_archived") or "").strip().lower()
+    try:
+        filters = parse_export_filters({**request.args.to_dict(), **(data.get("filters") or {})})
+    except (ValueError, TypeError) as exc:
+        return json_err(str(exc), 400, code="invalid_filter")
+
+    job, reused = create_job(client_id, fmt, include_archived in ("1", "true", "yes"), filters)
+    if job is None:
+        return json_err(
+            "Muitos exports em andamento. Aguarde os atuais terminarem.", 429, code="too_many_export_jobs"
+        )
+    payload = job_payload(job)
+    payload["reused"] = reused
+    return json_ok(payload, 200 if job["status"] == STATUS_DONE else 202)
+
+
+@leads_bp.get("/export_jobs/<int:job_id>")
+@limiter.limit("600 per minute", key_func=rate_limit_client_id)
+def export_job_status(job_id: int):
+    client_id, err_resp = _export_job_auth()
+    if err_resp:
+        return err_resp
+    job = get_job(client_id, job_id)
+    if not job:
+        return json_err("Job não encontrado.", 404, code="not_found")
+    return json_ok(job_payload(job))
+
+
+@leads_bp.get("/export_jobs/<int:job_id>/download")
+@limiter.limit("600 per minute", key_func=rate_limit_client_id)
+def export_job_download(job_id: int):
+    client_id, err_resp = _export_job_auth()
+    if err_resp:
+        return err_resp
+    job = get_job(client_id, job_id)
+    if not job:
+        return json_err("Job não encontrado.", 404, code="not_found")
+    if job["status"] == STATUS_EXPIRED:
+        return json_err("Arquivo expirado. Crie um novo export.", 410, code="export_expired")
+    path = job_file(job)
+    if job["status"] != STATUS_DONE or not path.exists():
+        return json_err("Export ainda não está pronto.", 409, code="export_not_ready")
+    # conditional=True: Range/If-Range (retoma download) e If-None-Match com o ETag do arquivo.
+    response = send_file(
+        path.resolve(),
+        mimetype=FORMATS[job["format"]][0],
+        as_attachment=True,
+        download_name=path.name.replace(f"{job_id}.", f"leads_{job_id}.", 1),
+        conditional=True,
+        etag=job["etag"],
+        max_age=0,
+    )
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
 
 
 @leads_bp.post("/demo_public")
@@ -740,8 +697,9 @@ def demo_public():
                     cur.execute(
                         """
                         INSERT INTO leads (client_id, nome, email_lead, telefone, tempo_site, paginas_visitadas, clicou_preco,
-                                           payload, probabilidade, score, label, created_at, updated_at)
-                        VALUES (%s,%s,%s,%s,%s,%s,%s,%s::jsonb,%s,%s,%s,NOW(),NOW())
+                                           probabilidade, score, label, created_at, updated_at)
+                        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,NOW(),NOW())
+                        RETURNING id
                         """,
                         (
                             client_id,
@@ -751,12 +709,12 @@ def demo_public():
                             tempo_site,
                             paginas,
                             clicou_preco,
-                            json.dumps(data),
                             float(prob),
                             int(score),
                             label,
                         ),
                     )
+                    store_payload(cur, cur.fetchone()["id"], client_id, data)
         return json_ok({"client_id": client_id, "inserted": 6})
     finally:
         conn.close()
@@ -794,8 +752,9 @@ def seed_demo():
                     cur.execute(
                         """
                         INSERT INTO leads (client_id, nome, email_lead, telefone, tempo_site, paginas_visitadas, clicou_preco,
-                                           payload, probabilidade, score, label, created_at, updated_at)
-                        VALUES (%s,%s,%s,%s,%s,%s,%s,%s::jsonb,%s,%s,%s,NOW(),NOW())
+                                           probabilidade, score, label, created_at, updated_at)
+                        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,NOW(),NOW())
+                        RETURNING id
                         """,
                         (
                             client_id,
@@ -805,12 +764,14 @@ def seed_demo():
                             tempo_site,
                             paginas,
                             clicou_preco,
-                            json.dumps(data),
                             float(prob),
                             int(score),
                             label,
                         ),
                     )
+                    store_payload(cur, cur.fetchone()["id"], client_id, data)
+        note_client_write(client_id)
+        rank_invalidate(client_id)
         return json_ok({"client_id": client_id, "inserted": 6})
     finally:
         conn.close()
@@ -869,8 +830,9 @@ def seed_test_leads():
                     cur.execute(
                         """
                         INSERT INTO leads (client_id, nome, email_lead, telefone, tempo_site, paginas_visitadas, clicou_preco,
-                                           payload, probabilidade, score, label, virou_cliente, created_at, updated_at)
-                        VALUES (%s,%s,%s,%s,%s,%s,%s,%s::jsonb,%s,%s,%s,%s,NOW(),NOW())
+                                           probabilidade, score, label, virou_cliente, created_at, updated_at)
+                        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,NOW(),NOW())
+                        RETURNING id
                         """,
                         (
                             client_id,
@@ -880,13 +842,13 @@ def seed_test_leads():
                             tempo_site,
                             paginas,
                             clicou_preco,
-                            json.dumps(payload),
                             float(prob),
                             int(score),
                             label,
                             label_vc,
                         ),
                     )
+                    store_payload(cur, cur.fetchone()["id"], client_id, payload)
                     inserted += 1
 
             with conn.cursor() as cur:
@@ -895,7 +857,8 @@ def seed_test_leads():
                     (inserted, client_id),
                 )
 
-        cache_delete(f"acao_do_dia:{client_id}")
+        note_client_write(client_id)
+        rank_invalidate(client_id)
         cache_delete_prefix(f"insights:{client_id}:")
         return json_ok(
             {
@@ -921,7 +884,7 @@ def funnels():
     if not ok_auth:
         return json_err(msg, 403, code="auth_required")
 
-    conn = db()
+    conn = db(READ_ONLY, client_id)
     try:
         with conn:
             with conn.cursor(row_factory=dict_row) as cur:
@@ -964,51 +927,11 @@ def acao_do_dia():
     if not ok_auth:
         return json_err(msg, 403, code="auth_required")
 
-    cache_key = f"acao_do_dia:{client_id}"
-    cached = cache_get_json(cache_key)
-    if cached:
-        return json_ok(cached)
-
-    conn = db()
-    try:
-        with conn:
-            with conn.cursor(row_factory=dict_row) as cur:
-                active_leads_query = get_active_leads_query()
-                cur.execute(
-                    f"""
-                    SELECT id, nome, email_lead, telefone, origem,
-                           score, probabilidade, created_at, virou_cliente
-                    {active_leads_query}
-                      AND client_id=%s
-                    ORDER BY COALESCE(probabilidade, score / 100.0) DESC NULLS LAST,
-                             created_at DESC
-                    LIMIT 30
-                    """,
-                    (client_id,),
-                )
-                rows = cur.fetchall() or []
-        res = []
-        for item in rows:
-            res.append(
-                {
-                    "id": item.get("id"),
-                    "nome": item.get("nome"),
-                    "email": item.get("email_lead"),
-                    "telefone": item.get("telefone"),
-                    "origem": item.get("origem"),
-                    "score": safe_int(item.get("score"), 0) if item.get("score") is not None else None,
-                    "probabilidade": safe_float(item.get("probabilidade"), 0.0),
-                    "created_at": iso(item.get("created_at")),
-                    "virou_cliente": item.get("virou_cliente"),
-                    "temperatura": lead_temperature(item.get("probabilidade"), item.get("score")),
-                }
-            )
-        # Compatibilidade: "rows" é o formato novo; "action_list"/"items" suportam versões antigas do front.
-        payload = {"client_id": client_id, "rows": res, "action_list": res, "items": res}
-        cache_set_json(cache_key, payload)
-        return json_ok(payload)
-    finally:
-        conn.close()
+    res = rank_top(client_id, ACTION_LIST_LIMIT)
+    if res is None:
+        res = [action_item(r) for r in fetch_action_candidates(client_id, ACTION_LIST_LIMIT)]
+    # Compatibilidade: "rows" é o formato novo; "action_list"/"items" suportam versões antigas do front.
+    return json_ok({"client_id": client_id, "rows": res, "action_list": res, "items": res})
 
 
 @leads_bp.get("/lead_explain")
@@ -1026,35 +949,31 @@ def lead_explain():
     if not lead_id:
         return json_err("lead_id obrigatório", 400)
 
+    include_payload = (request.args.get("include_payload") or "").strip().lower() in ("1", "true", "yes")
+
     conn = db()
     try:
         with conn:
             with conn.cursor(row_factory=dict_row) as cur:
-                active_leads_query = get_active_leads_query()
-                cur.execute(
-                    f"""
-                    SELECT tempo_site, paginas_visitadas, clicou_preco, probabilidade
-                    {active_leads_query}
-                      AND client_id=%s
-                      AND id=%s
-                    """,
-                    (client_id, lead_id),
-                )
+                execute_statement(cur, "lead_explain_features", (client_id, lead_id))
                 lead = cur.fetchone()
+                # Payload bruto só sob demanda (fica fora da linha quente, em lead_payloads).
+                raw_payload = fetch_payload(cur, client_id, lead_id) if lead and include_payload else None
         if not lead:
             return json_err("Lead não encontrado", 404)
 
         score = float(lead.get("probabilidade") or 0.0)
-        return json_ok(
-            {
-                "client_id": client_id,
-                "lead_id": lead_id,
-                "tempo_site": lead.get("tempo_site"),
-                "paginas_visitadas": lead.get("paginas_visitadas"),
-                "clicou_preco": lead.get("clicou_preco"),
-                "probabilidade": score,
-                "note": "Explicação do score heurístico (antes do treino).",
-            }
-        )
+        out = {
+            "client_id": client_id,
+            "lead_id": lead_id,
+            "tempo_site": lead.get("tempo_site"),
+            "paginas_visitadas": lead.get("paginas_visitadas"),
+            "clicou_preco": lead.get("clicou_preco"),
+            "probabilidade": score,
+            "note": "Explicação do score heurístico (antes do treino).",
+        }
+        if include_payload:
+            out["payload"] = raw_payload or {}
+        return json_ok(out)
     finally:
         conn.close()
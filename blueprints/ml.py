@@ -5,6 +5,7 @@ from services.auth_service import require_client_auth
 from services.db import get_active_leads_query
 from services.lead_service import get_labeled_rows, get_threshold, set_threshold, update_probabilities
 from services.ml_service import HAS_ML, best_threshold, can_train, compute_precision_recall, features_from_row, predict_for_rows, train_pipeline
+from services.ranking import rank_update_probabilities
 from services.utils import get_client_id_from_request, json_err, json_ok, rate_limit_client_id, safe_int
 
 ml_bp = Blueprint("ml", __name__)
@@ -80,6 +81,7 @@ def recalc_pending():
     ids = [int(r["id"]) for r in pending]
     probs = predict_for_rows(pipe, pending)
     updated = update_probabilities(client_id, ids, probs)
+    rank_update_probabilities(client_id, ids, probs)
 
     return json_ok(
         {
@@ -149,6 +151,7 @@ def auto_threshold():
         ids = [int(r["id"]) for r in missing]
         probs = predict_for_rows(pipe, missing)
         update_probabilities(client_id, ids, probs)
+        rank_update_probabilities(client_id, ids, probs)
         labeled = get_labeled_rows(client_id)
 
     best_t = best_threshold(labeled)
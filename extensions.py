@@ -2,9 +2,11 @@ from flask_limiter import Limiter
 from flask_login import LoginManager
 
 from services import settings
+from services.rate_limit_storage import batched_uri
 from services.utils import client_ip
 
-storage_uri = settings.RATELIMIT_STORAGE_URI or "memory://"
+# batched+redis:// registra o storage em lote (services/rate_limit_storage.py) ao importar o módulo.
+storage_uri = batched_uri(settings.RATELIMIT_STORAGE_URI or "memory://")
 limiter = Limiter(
     key_func=client_ip,
     default_limits=["100 per minute"],
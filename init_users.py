@@ -23,6 +23,8 @@ except Exception as e:
         "ERRO: instale psycopg[binary]. Ex.: pip install 'psycopg[binary]'\n" + repr(e)
     )
 
+from services.migrations import migrate
+
 try:
     from werkzeug.security import generate_password_hash
 except Exception as e:
@@ -60,66 +62,18 @@ def _gen_api_key(client_id: str) -> str:
 
 def _hash_password(password: str) -> str:
     return generate_password_hash(password, method=f"pbkdf2:sha256:{PBKDF2_ITERATIONS}")
-def ensure_schema(conn):
-    with conn.cursor() as cur:
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS clients (
-                client_id TEXT PRIMARY KEY,
-                api_key TEXT,
-                plan TEXT NOT NULL DEFAULT 'trial',
-                status TEXT NOT NULL DEFAULT 'active',
-                usage_month TEXT NOT NULL DEFAULT '',
-                leads_used_month INTEGER NOT NULL DEFAULT 0,
-                nome TEXT,
-                email TEXT,
-                empresa TEXT,
-                valid_until TIMESTAMPTZ,
-                password_hash TEXT,
-                last_login_at TIMESTAMPTZ,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-            );
-            """
-        )
-        # compat
-        cur.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS api_key TEXT;")
-        cur.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS plan TEXT NOT NULL DEFAULT 'trial';")
-        cur.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'active';")
-        cur.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS usage_month TEXT;")
-        cur.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS leads_used_month INTEGER NOT NULL DEFAULT 0;")
-        cur.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS nome TEXT;")
-        cur.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS email TEXT;")
-        cur.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS empresa TEXT;")
-        cur.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS valid_until TIMESTAMPTZ;")
-        cur.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS password_hash TEXT;")
-        cur.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS last_login_at TIMESTAMPTZ;")
-        cur.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT NOW();")
-        cur.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();")
-
-        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_clients_api_key ON clients(api_key) WHERE api_key <> '';")
-        try:
-            cur.execute(
-                "CREATE UNIQUE INDEX IF NOT EXISTS idx_clients_email_unique "
-                "ON clients(email) WHERE email IS NOT NULL AND email<>'';"
-            )
-        except Exception:
-            pass
-
-        mk = _month_key()
-        cur.execute("UPDATE clients SET usage_month=%s WHERE usage_month IS NULL OR usage_month='';", (mk,))
-        cur.execute("UPDATE clients SET api_key='' WHERE api_key IS NULL;")
 
 
 def main():
     if not DATABASE_URL:
         raise SystemExit("DATABASE_URL ausente. Configure DATABASE_URL para inicializar usuário no Postgres.")
 
+    # Schema vem do motor único de migrations (mesmo caminho do deploy).
+    migrate(DATABASE_URL)
+
     conn = psycopg.connect(DATABASE_URL)
     try:
         with conn:
-            ensure_schema(conn)
-
             with conn.cursor() as cur:
                 cur.execute("SELECT client_id, api_key, password_hash FROM clients WHERE email=%s", (INIT_USER_EMAIL,))
                 row = cur.fetchone()
@@ -0,0 +1,33 @@
+-- Índices parciais alinhados com get_active_leads_query() (deleted_at IS NULL).
+-- Roda fora de transação (CONCURRENTLY) para não bloquear escrita em leads.
+
+-- Listagem/contagem/janelas de tempo por cliente: dashboard, top_origens, insights, funnels, export.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_leads_active_client_created
+ON leads (client_id, created_at DESC)
+WHERE deleted_at IS NULL;
+
+-- acao_do_dia / rebuild do ranking: mesma expressão do ORDER BY.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_leads_active_client_rank
+ON leads (client_id, (COALESCE(probabilidade, score / 100.0)) DESC NULLS LAST, created_at DESC)
+WHERE deleted_at IS NULL;
+
+-- recalc_pending: leads sem rótulo, mais recentes primeiro.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_leads_active_client_pending
+ON leads (client_id, created_at DESC)
+WHERE deleted_at IS NULL AND virou_cliente IS NULL;
+
+-- get_labeled_rows (treino/auto_threshold).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_leads_active_client_labeled
+ON leads (client_id, created_at DESC)
+WHERE deleted_at IS NULL AND virou_cliente IS NOT NULL;
+
+-- hot_leads_today: predicado idêntico ao da query para o planner provar a implicação.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_leads_active_client_hot
+ON leads (client_id, created_at DESC)
+WHERE deleted_at IS NULL
+  AND ((probabilidade IS NOT NULL AND probabilidade >= 0.70) OR (score IS NOT NULL AND score >= 70));
+
+-- Substituídos pelos parciais acima (só custavam escrita).
+DROP INDEX CONCURRENTLY IF EXISTS idx_leads_client_deleted_at;
+DROP INDEX CONCURRENTLY IF EXISTS idx_leads_client_created_prob;
+DROP INDEX CONCURRENTLY IF EXISTS idx_leads_client_label;
@@ -0,0 +1,28 @@
+-- Destino da retenção (services/retention.py): leads soft-deleted e além do horizonte do plano.
+-- Mesmas colunas de leads + quando/por que saiu da tabela quente.
+CREATE TABLE IF NOT EXISTS leads_archive (
+    id BIGINT PRIMARY KEY,
+    client_id TEXT NOT NULL,
+    nome TEXT,
+    email_lead TEXT,
+    telefone TEXT,
+    origem TEXT,
+    tempo_site INTEGER,
+    paginas_visitadas INTEGER,
+    clicou_preco INTEGER,
+    probabilidade DOUBLE PRECISION,
+    virou_cliente DOUBLE PRECISION,
+    payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+    score INTEGER,
+    label INTEGER,
+    created_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL,
+    deleted_at TIMESTAMPTZ,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    archive_reason TEXT NOT NULL
+);
+
+-- Export com include_archived=1 (só os não deletados).
+CREATE INDEX IF NOT EXISTS idx_leads_archive_client_created
+ON leads_archive (client_id, created_at DESC)
+WHERE deleted_at IS NULL;
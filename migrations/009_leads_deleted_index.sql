@@ -0,0 +1,4 @@
+-- Retenção: acha os soft-deleted sem varrer leads. Parcial, então só ocupa o tamanho da lixeira.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_leads_deleted_at
+ON leads (deleted_at)
+WHERE deleted_at IS NOT NULL;
@@ -0,0 +1,10 @@
+-- Payload bruto do /prever fora da linha quente de leads (services/payloads.py).
+-- Sem FK: com leads particionada a PK é (id, created_at).
+CREATE TABLE IF NOT EXISTS lead_payloads (
+    lead_id BIGINT PRIMARY KEY,
+    client_id TEXT NOT NULL,
+    encoding TEXT NOT NULL DEFAULT 'json',
+    payload JSONB,
+    payload_z BYTEA,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
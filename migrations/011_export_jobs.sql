@@ -0,0 +1,32 @@
+-- Jobs de export assíncrono (services/export_jobs.py + python -m worker).
+CREATE TABLE IF NOT EXISTS export_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    client_id TEXT NOT NULL,
+    format TEXT NOT NULL,
+    include_archived BOOLEAN NOT NULL DEFAULT FALSE,
+    window_start TIMESTAMPTZ NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    rows_total BIGINT,
+    rows_done BIGINT NOT NULL DEFAULT 0,
+    bytes_done BIGINT NOT NULL DEFAULT 0,
+    etag TEXT,
+    error TEXT,
+    worker_id TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    heartbeat_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    expires_at TIMESTAMPTZ
+);
+
+-- Um artefato por (cliente, formato, janela): pedidos repetidos reaproveitam o job.
+-- failed/expired saem do índice para permitir um novo job na mesma janela.
+CREATE UNIQUE INDEX IF NOT EXISTS uq_export_jobs_window
+ON export_jobs (client_id, format, include_archived, window_start)
+WHERE status IN ('queued', 'running', 'done');
+
+-- Fila do worker (FOR UPDATE SKIP LOCKED).
+CREATE INDEX IF NOT EXISTS idx_export_jobs_pending
+ON export_jobs (created_at)
+WHERE status IN ('queued', 'running');
@@ -0,0 +1,8 @@
+-- Change feed (/leads_changes): seek por (updated_at, id) dentro do cliente, em ordem.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_leads_client_updated_id
+ON leads (client_id, updated_at, id);
+
+-- Tombstones de leads já expurgados da tabela quente pela retenção.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_leads_archive_deleted_feed
+ON leads_archive (client_id, updated_at, id)
+WHERE archive_reason = 'deleted';
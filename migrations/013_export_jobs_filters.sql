@@ -0,0 +1,7 @@
+-- Filtros do export (query string canônica de ExportFilters) entram na chave de reaproveitamento.
+ALTER TABLE export_jobs ADD COLUMN IF NOT EXISTS filters TEXT NOT NULL DEFAULT '';
+
+DROP INDEX IF EXISTS uq_export_jobs_window;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_export_jobs_window_filters
+ON export_jobs (client_id, format, include_archived, filters, window_start)
+WHERE status IN ('queued', 'running', 'done');
@@ -0,0 +1,40 @@
+-- Stream de leads quentes (/leads_stream, services/live.py): NOTIFY quando um lead entra quente
+-- ou quando um rescoring mexe num lead que era/ficou quente. O NOTIFY só é entregue no COMMIT.
+-- Payload: os campos da lista de ação (cabe folgado no limite de 8000 bytes do NOTIFY).
+CREATE OR REPLACE FUNCTION leads_notify_hot() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('leads_hot', json_build_object(
+        'client_id', NEW.client_id,
+        'id', NEW.id,
+        'nome', left(NEW.nome, 200),
+        'email', left(NEW.email_lead, 200),
+        'telefone', left(NEW.telefone, 40),
+        'origem', left(NEW.origem, 80),
+        'probabilidade', NEW.probabilidade,
+        'score', NEW.score,
+        'virou_cliente', NEW.virou_cliente,
+        'created_at', NEW.created_at,
+        'updated_at', NEW.updated_at
+    )::text);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_leads_notify_hot_insert ON leads;
+CREATE TRIGGER trg_leads_notify_hot_insert
+AFTER INSERT ON leads
+FOR EACH ROW
+WHEN (NEW.deleted_at IS NULL
+      AND ((NEW.probabilidade IS NOT NULL AND NEW.probabilidade >= 0.70) OR (NEW.score IS NOT NULL AND NEW.score >= 70)))
+EXECUTE FUNCTION leads_notify_hot();
+
+-- Rescoring: também avisa quando o lead deixa de ser quente, para o dashboard tirá-lo da lista.
+DROP TRIGGER IF EXISTS trg_leads_notify_hot_update ON leads;
+CREATE TRIGGER trg_leads_notify_hot_update
+AFTER UPDATE OF probabilidade, score ON leads
+FOR EACH ROW
+WHEN (NEW.deleted_at IS NULL
+      AND (OLD.probabilidade IS DISTINCT FROM NEW.probabilidade OR OLD.score IS DISTINCT FROM NEW.score)
+      AND ((OLD.probabilidade IS NOT NULL AND OLD.probabilidade >= 0.70) OR (OLD.score IS NOT NULL AND OLD.score >= 70)
+           OR (NEW.probabilidade IS NOT NULL AND NEW.probabilidade >= 0.70) OR (NEW.score IS NOT NULL AND NEW.score >= 70)))
+EXECUTE FUNCTION leads_notify_hot();
@@ -0,0 +1,4 @@
+-- Quando o lead recebeu o rótulo atual (/confirmar_venda, /negar_venda): latência até a venda nas coortes
+-- (services/cohorts.py). Coluna nula sem default: ALTER só no catálogo, sem reescrever a tabela.
+-- Linhas antigas ficam NULL; as coortes usam updated_at como aproximação para elas.
+ALTER TABLE leads ADD COLUMN IF NOT EXISTS labeled_at TIMESTAMPTZ;
@@ -0,0 +1,13 @@
+-- API keys com hash (services/api_keys.py): key_hash = HMAC-SHA256(API_KEY_PEPPER, chave).
+-- A PK em key_hash é o índice único do lookup da auth. Várias chaves por cliente (signup, cada login,
+-- /criar_cliente); last_used_at decide quais sobram acima de API_KEYS_PER_CLIENT.
+-- clients.api_key (texto) fica só para chaves antigas: migram no primeiro uso ou via
+-- python -m services.api_keys migrate, e o texto é apagado.
+CREATE TABLE IF NOT EXISTS api_keys (
+    key_hash TEXT PRIMARY KEY,
+    client_id TEXT NOT NULL REFERENCES clients(client_id) ON DELETE CASCADE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_used_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_api_keys_client_used ON api_keys(client_id, last_used_at DESC);
@@ -0,0 +1,3 @@
+-- Revogação dos access tokens (services/session_tokens.py): token com epoch diferente do atual é recusado.
+-- Default constante: só catálogo, sem reescrever clients.
+ALTER TABLE clients ADD COLUMN IF NOT EXISTS token_epoch INTEGER NOT NULL DEFAULT 0;
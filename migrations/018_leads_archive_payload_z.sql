@@ -0,0 +1,12 @@
+-- Payload compactado (lead_payloads.encoding = 'zlib') acompanha o lead no arquivo (services/retention.py).
+-- JSON continua em leads_archive.payload.
+ALTER TABLE leads_archive ADD COLUMN IF NOT EXISTS payload_encoding TEXT NOT NULL DEFAULT 'json';
+ALTER TABLE leads_archive ADD COLUMN IF NOT EXISTS payload_z BYTEA;
+
+-- Reparo: leads arquivados antes desta versão deixaram o payload em lead_payloads.
+UPDATE leads_archive a
+SET payload = COALESCE(p.payload, a.payload), payload_encoding = p.encoding, payload_z = p.payload_z
+FROM lead_payloads p
+WHERE p.lead_id = a.id;
+
+DELETE FROM lead_payloads p USING leads_archive a WHERE p.lead_id = a.id;
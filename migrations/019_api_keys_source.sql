@@ -0,0 +1,8 @@
+-- Origem da chave (services/api_keys.py): 'login' (uma por login do dashboard) ou 'integration'
+-- (signup, /criar_cliente, migradas). A poda de API_KEYS_PER_CLIENT só apaga chaves de login, pela
+-- data de emissão: chave de integração nunca é revogada por login.
+ALTER TABLE api_keys ADD COLUMN IF NOT EXISTS source TEXT NOT NULL DEFAULT 'integration';
+
+CREATE INDEX IF NOT EXISTS idx_api_keys_client_login
+ON api_keys (client_id, created_at DESC)
+WHERE source = 'login';
@@ -0,0 +1,20 @@
+-- Soft delete ao vivo no /leads_stream (services/live.py): o trigger da 014 só olha probabilidade/score.
+-- Mesmo canal; o payload com deleted_at vira evento "delete".
+CREATE OR REPLACE FUNCTION leads_notify_deleted() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('leads_hot', json_build_object(
+        'client_id', NEW.client_id,
+        'id', NEW.id,
+        'updated_at', NEW.updated_at,
+        'deleted_at', NEW.deleted_at
+    )::text);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_leads_notify_deleted ON leads;
+CREATE TRIGGER trg_leads_notify_deleted
+AFTER UPDATE OF deleted_at ON leads
+FOR EACH ROW
+WHEN (OLD.deleted_at IS NULL AND NEW.deleted_at IS NOT NULL)
+EXECUTE FUNCTION leads_notify_deleted();
@@ -1,55 +0,0 @@
-from __future__ import annotations
-
-import os
-from logging.config import fileConfig
-
-from sqlalchemy import engine_from_config, pool
-
-from alembic import context
-
-config = context.config
-
-if config.config_file_name is not None:
-    fileConfig(config.config_file_name)
-
-
-def get_url() -> str:
-    return os.getenv("DATABASE_URL", "")
-
-
-def run_migrations_offline() -> None:
-    url = get_url()
-    if url:
-        config.set_main_option("sqlalchemy.url", url)
-    context.configure(
-        url=url,
-        target_metadata=None,
-        literal_binds=True,
-        dialect_opts={"paramstyle": "named"},
-    )
-
-    with context.begin_transaction():
-        context.run_migrations()
-
-
-def run_migrations_online() -> None:
-    url = get_url()
-    if url:
-        config.set_main_option("sqlalchemy.url", url)
-    connectable = engine_from_config(
-        config.get_section(config.config_ini_section, {}),
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
-
-    with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=None)
-
-        with context.begin_transaction():
-            context.run_migrations()
-
-
-if context.is_offline_mode():
-    run_migrations_offline()
-else:
-    run_migrations_online()
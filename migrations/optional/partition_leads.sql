@@ -0,0 +1,151 @@
+-- Opt-in: converte leads em tabela particionada por mês de created_at (UTC).
+-- Não é aplicado pelo runner automático. Rode numa janela de manutenção:
+--   python -m services.partitions convert
+-- A tabela original fica como leads_unpartitioned (para rollback); apague manualmente depois.
+
+CREATE OR REPLACE FUNCTION leads_create_month_partition(month_start date) RETURNS text AS $$
+DECLARE
+    part_name text := format('leads_p%s', to_char(month_start, 'YYYYMM'));
+    range_start timestamptz := date_trunc('month', month_start)::timestamp AT TIME ZONE 'UTC';
+    range_end timestamptz := (date_trunc('month', month_start) + interval '1 month')::timestamp AT TIME ZONE 'UTC';
+BEGIN
+    IF to_regclass(part_name) IS NOT NULL THEN
+        RETURN part_name;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE leads INCLUDING DEFAULTS)', part_name);
+    -- Linhas que caíram na partição default (mês sem partição) migram antes do ATTACH.
+    IF to_regclass('leads_default') IS NOT NULL THEN
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM leads_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+            'INSERT INTO %I SELECT * FROM moved',
+            range_start, range_end, part_name
+        );
+    END IF;
+    EXECUTE format(
+        'ALTER TABLE leads ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        part_name, range_start, range_end
+    );
+    RETURN part_name;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION leads_ensure_partitions(months_ahead int) RETURNS int AS $$
+DECLARE
+    first_month date := date_trunc('month', now() AT TIME ZONE 'UTC')::date;
+    created int := 0;
+    i int;
+BEGIN
+    FOR i IN 0..GREATEST(months_ahead, 0) LOOP
+        IF to_regclass(format('leads_p%s', to_char(first_month + make_interval(months => i), 'YYYYMM'))) IS NULL THEN
+            PERFORM leads_create_month_partition((first_month + make_interval(months => i))::date);
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END
+$$ LANGUAGE plpgsql;
+
+-- Partições antigas quase só recebem scans por faixa de tempo: um BRIN em created_at é minúsculo
+-- e atende insights/top_origens quando o filtro de cliente não é seletivo.
+CREATE OR REPLACE FUNCTION leads_brin_old_partitions(older_than_months int) RETURNS int AS $$
+DECLARE
+    cutoff date := (date_trunc('month', now() AT TIME ZONE 'UTC') - make_interval(months => older_than_months))::date;
+    created int := 0;
+    r record;
+BEGIN
+    FOR r IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'leads'::regclass
+          AND c.relname ~ '^leads_p[0-9]{6}$'
+    LOOP
+        IF to_date(substr(r.relname, 8), 'YYYYMM') < cutoff
+           AND to_regclass(r.relname || '_created_brin') IS NULL THEN
+            EXECUTE format('CREATE INDEX %I ON %I USING brin (created_at)', r.relname || '_created_brin', r.relname);
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    m date;
+    last_month date;
+    r record;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'leads'::regclass) THEN
+        RETURN;
+    END IF;
+
+    LOCK TABLE leads IN ACCESS EXCLUSIVE MODE;
+    ALTER TABLE leads RENAME TO leads_unpartitioned;
+    -- Nomes de índice são globais no schema: libera os nomes para a tabela nova.
+    FOR r IN
+        SELECT indexname FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = 'leads_unpartitioned'
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', r.indexname, left(r.indexname, 50) || '_unpart');
+    END LOOP;
+
+    CREATE TABLE leads (LIKE leads_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+        PARTITION BY RANGE (created_at);
+    -- A chave de partição precisa estar na PK; id continua único via sequence.
+    ALTER TABLE leads ADD PRIMARY KEY (id, created_at);
+    ALTER SEQUENCE IF EXISTS leads_id_seq OWNED BY leads.id;
+
+    CREATE TABLE leads_default PARTITION OF leads DEFAULT;
+
+    m := COALESCE(
+        (SELECT date_trunc('month', MIN(created_at) AT TIME ZONE 'UTC')::date FROM leads_unpartitioned),
+        date_trunc('month', now() AT TIME ZONE 'UTC')::date
+    );
+    last_month := date_trunc('month', now() AT TIME ZONE 'UTC')::date;
+    WHILE m <= last_month LOOP
+        PERFORM leads_create_month_partition(m);
+        m := (m + interval '1 month')::date;
+    END LOOP;
+    PERFORM leads_ensure_partitions(3);
+
+    -- Mesmos índices de 003/007/009, criados no pai (propagam para cada partição).
+    CREATE INDEX idx_leads_client_created ON leads (client_id, created_at DESC);
+    CREATE INDEX idx_leads_active_client_created ON leads (client_id, created_at DESC)
+        WHERE deleted_at IS NULL;
+    CREATE INDEX idx_leads_active_client_rank
+        ON leads (client_id, (COALESCE(probabilidade, score / 100.0)) DESC NULLS LAST, created_at DESC)
+        WHERE deleted_at IS NULL;
+    CREATE INDEX idx_leads_active_client_pending ON leads (client_id, created_at DESC)
+        WHERE deleted_at IS NULL AND virou_cliente IS NULL;
+    CREATE INDEX idx_leads_active_client_labeled ON leads (client_id, created_at DESC)
+        WHERE deleted_at IS NULL AND virou_cliente IS NOT NULL;
+    CREATE INDEX idx_leads_active_client_hot ON leads (client_id, created_at DESC)
+        WHERE deleted_at IS NULL
+          AND ((probabilidade IS NOT NULL AND probabilidade >= 0.70) OR (score IS NOT NULL AND score >= 70));
+    CREATE INDEX idx_leads_deleted_at ON leads (deleted_at) WHERE deleted_at IS NOT NULL;
+    CREATE INDEX idx_leads_client_updated_id ON leads (client_id, updated_at, id);
+
+    INSERT INTO leads SELECT * FROM leads_unpartitioned;
+
+    -- Triggers de 014 só depois da cópia (senão cada lead quente copiado vira um NOTIFY).
+    DROP TRIGGER IF EXISTS trg_leads_notify_hot_insert ON leads_unpartitioned;
+    DROP TRIGGER IF EXISTS trg_leads_notify_hot_update ON leads_unpartitioned;
+    IF to_regprocedure('leads_notify_hot()') IS NOT NULL THEN
+        CREATE TRIGGER trg_leads_notify_hot_insert
+        AFTER INSERT ON leads
+        FOR EACH ROW
+        WHEN (NEW.deleted_at IS NULL
+              AND ((NEW.probabilidade IS NOT NULL AND NEW.probabilidade >= 0.70) OR (NEW.score IS NOT NULL AND NEW.score >= 70)))
+        EXECUTE FUNCTION leads_notify_hot();
+        CREATE TRIGGER trg_leads_notify_hot_update
+        AFTER UPDATE OF probabilidade, score ON leads
+        FOR EACH ROW
+        WHEN (NEW.deleted_at IS NULL
+              AND (OLD.probabilidade IS DISTINCT FROM NEW.probabilidade OR OLD.score IS DISTINCT FROM NEW.score)
+              AND ((OLD.probabilidade IS NOT NULL AND OLD.probabilidade >= 0.70) OR (OLD.score IS NOT NULL AND OLD.score >= 70)
+                   OR (NEW.probabilidade IS NOT NULL AND NEW.probabilidade >= 0.70) OR (NEW.score IS NOT NULL AND NEW.score >= 70)))
+        EXECUTE FUNCTION leads_notify_hot();
+    END IF;
+END
+$$;
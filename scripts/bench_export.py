@@ -0,0 +1,212 @@
+"""Benchmark do export de leads.
+
+- legacy x copy: implementação antiga do CSV (cursor client-side + csv.writer) x COPY TO STDOUT.
+- csv/ndjson/parquet/arrow (--formats): tamanho do arquivo, tempo de geração e tempo de carga
+  num DataFrame do pandas (parquet/arrow precisam de pyarrow; sem ele são pulados).
+
+Uso (banco descartável ou de staging):
+  python -m scripts.bench_export <client_id> [--seed 2000000] [--formats]
+
+Cada modo roda num subprocesso separado para medir o pico de RSS isoladamente.
+"""
+
+import argparse
+import csv
+import io
+import json
+import resource
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Iterator
+
+import psycopg
+
+from services import settings
+
+SEED_SQL = """
+INSERT INTO leads (client_id, nome, email_lead, telefone, origem, tempo_site, paginas_visitadas, clicou_preco,
+                   probabilidade, score, virou_cliente, created_at, updated_at)
+SELECT %s, 'Lead ' || g, 'lead' || g || '@example.com', '1199999' || lpad((g %% 10000)::text, 4, '0'),
+       (ARRAY['site', 'ads', 'indicacao', 'whatsapp'])[1 + g %% 4],
+       g %% 400, g %% 10, g %% 2, (g %% 100) / 100.0, g %% 100,
+       CASE WHEN g %% 5 = 0 THEN 1 WHEN g %% 7 = 0 THEN 0 END,
+       NOW() - ((g %% 720) || ' days')::interval, NOW()
+FROM generate_series(1, %s) AS g
+"""
+
+
+def _legacy(client_id: str) -> Iterator[str]:
+    """Cópia do export anterior (para comparação)."""
+
+    from services.utils import iso
+
+    def csv_safe(value: Any) -> str:
+        s = "" if value is None else str(value)
+        if s.startswith(("=", "+", "-", "@")):
+            return "'" + s
+        return s
+
+    conn = psycopg.connect(settings.DATABASE_URL, row_factory=psycopg.rows.dict_row)
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT nome, email_lead, telefone, tempo_site, paginas_visitadas, clicou_preco,
+                   probabilidade, score, created_at, virou_cliente
+            FROM leads WHERE deleted_at IS NULL AND client_id=%s
+            ORDER BY created_at DESC
+            """,
+            (client_id,),
+        )
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        while True:
+            rows = cur.fetchmany(1000)
+            if not rows:
+                break
+            for r in rows:
+                writer.writerow([
+                    csv_safe(r.get("nome")), csv_safe(r.get("email_lead")), csv_safe(r.get("telefone")),
+                    csv_safe(r.get("tempo_site")), csv_safe(r.get("paginas_visitadas")),
+                    csv_safe(r.get("clicou_preco")), csv_safe(r.get("probabilidade")), csv_safe(r.get("score")),
+                    csv_safe(iso(r.get("created_at")) or ""), csv_safe(r.get("virou_cliente")),
+                ])
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+    finally:
+        conn.close()
+
+
+def _peak_rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _run_mode(mode: str, client_id: str) -> None:
+    if mode == "legacy":
+        chunks: Iterator[Any] = _legacy(client_id)
+    else:
+        from services.export import stream_csv
+
+        chunks = stream_csv(client_id)
+    start = time.perf_counter()
+    total = 0
+    lines = 0
+    for chunk in chunks:
+        data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        total += len(data)
+        lines += data.count(b"\n")
+    elapsed = time.perf_counter() - start
+    print(
+        json.dumps(
+            {
+                "mode": mode,
+                "rows": lines,
+                "bytes": total,
+                "seconds": round(elapsed, 2),
+                "mb_per_s": round(total / 1_048_576 / elapsed, 1) if elapsed else None,
+                "rows_per_s": int(lines / elapsed) if elapsed else None,
+                "peak_rss_mb": _peak_rss_mb(),
+            }
+        )
+    )
+
+
+def _load_dataframe(fmt: str, path: str):
+    import pandas as pd
+
+    if fmt == "csv":
+        return pd.read_csv(path)
+    if fmt == "ndjson":
+        return pd.read_json(path, lines=True)
+    if fmt == "parquet":
+        return pd.read_parquet(path)
+    import pyarrow.ipc as pa_ipc
+
+    with open(path, "rb") as fh:
+        return pa_ipc.open_stream(fh).read_all().to_pandas()
+
+
+def _run_format(fmt: str, client_id: str) -> None:
+    from services.export import stream_export
+
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    try:
+        start = time.perf_counter()
+        with os.fdopen(fd, "wb") as fh:
+            for chunk in stream_export(client_id, fmt):
+                fh.write(chunk)
+        export_s = time.perf_counter() - start
+        export_rss = _peak_rss_mb()
+        start = time.perf_counter()
+        df = _load_dataframe(fmt, path)
+        load_s = time.perf_counter() - start
+        print(
+            json.dumps(
+                {
+                    "format": fmt,
+                    "rows": len(df),
+                    "bytes": os.path.getsize(path),
+                    "export_seconds": round(export_s, 2),
+                    "export_peak_rss_mb": export_rss,
+                    "dataframe_load_seconds": round(load_s, 2),
+                    "created_at_dtype": str(df["created_at"].dtype),
+                }
+            )
+        )
+    finally:
+        os.unlink(path)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("client_id")
+    parser.add_argument("--seed", type=int, default=0, help="insere N leads para o client_id antes de medir")
+    parser.add_argument("--formats", action="store_true", help="compara csv/ndjson/parquet/arrow")
+    parser.add_argument("--mode", choices=["legacy", "copy"], help=argparse.SUPPRESS)
+    parser.add_argument("--format", dest="fmt", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        _run_mode(args.mode, args.client_id)
+        return 0
+    if args.fmt:
+        _run_format(args.fmt, args.client_id)
+        return 0
+
+    if args.seed:
+        with psycopg.connect(settings.DATABASE_URL, autocommit=True) as conn:
+            conn.execute(SEED_SQL, (args.client_id, args.seed))
+            conn.execute("ANALYZE leads")
+
+    for mode in ("legacy", "copy"):
+        out = subprocess.run(
+            [sys.executable, "-m", "scripts.bench_export", args.client_id, "--mode", mode],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        print(out.stdout.strip().splitlines()[-1])
+
+    if args.formats:
+        from services.export import FORMATS, format_unavailable
+
+        for fmt in FORMATS:
+            if format_unavailable(fmt):
+                print(json.dumps({"format": fmt, "skipped": format_unavailable(fmt)}))
+                continue
+            out = subprocess.run(
+                [sys.executable, "-m", "scripts.bench_export", args.client_id, "--format", fmt],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            print(out.stdout.strip().splitlines()[-1])
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,134 @@
+"""Benchmark do catálogo de statements: planejamento por execução vs. statement preparado.
+
+Uso (banco com dados; os INSERT/UPDATE rodam dentro de transação com ROLLBACK):
+  python -m scripts.bench_statements [client_id] [iteracoes]
+
+Para cada statement mede:
+  - plan_ms: "Planning Time" do EXPLAIN (SUMMARY) = custo pago a cada execução sem PREPARE;
+  - unprepared_us / prepared_us: latência mediana no cliente com prepare=False / prepare=True.
+No fim, soma por endpoint o planejamento economizado por request.
+"""
+
+import json
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import psycopg
+from psycopg.rows import dict_row
+
+from services import settings
+from services.api_keys import hash_api_key
+from services.lead_service import sp_today_bounds_utc
+from services.payloads import encode_payload
+from services.statements import catalog
+from services.utils import month_key
+
+# Auth por api_key não entra: é cache em memória (api_key_profile só roda no miss).
+ENDPOINTS: Dict[str, List[str]] = {
+    "auth (miss do cache de api_key)": ["api_key_profile"],
+    "/prever": ["prever_lock_usage", "prever_insert_lead", "prever_bump_usage"],
+    "/dashboard_data": [
+        "dashboard_recent_leads",
+        "dashboard_count_leads",
+        "dashboard_top_origens",
+        "dashboard_hot_today",
+        "threshold_by_client",
+    ],
+    "/acao_do_dia (fallback SQL)": ["acao_do_dia_candidates"],
+    "/lead_explain": ["lead_explain_features"],
+}
+
+
+def _params(client_id: str, lead_id: int) -> Dict[str, Tuple[Any, ...]]:
+    start_utc, end_utc = sp_today_bounds_utc()
+    return {
+        "client_insert_if_missing": (client_id, "trial", month_key()),
+        "client_lock": (client_id,),
+        "api_key_profile": (hash_api_key("bench"),),
+        "prever_lock_usage": (month_key(), client_id),
+        "prever_insert_lead": (
+            client_id, "Bench", "bench@example.com", "11999999999", "bench", 120, 3, 1,
+            0.5, 50, None, *encode_payload({"bench": True}),
+        ),
+        "prever_bump_usage": (month_key(), month_key(), client_id),
+        "dashboard_recent_leads": (client_id, settings.DEFAULT_LIMIT, 0),
+        "dashboard_count_leads": (client_id,),
+        "dashboard_top_origens": (client_id, 30, 6),
+        "dashboard_hot_today": (client_id, start_utc, end_utc, 20),
+        "threshold_by_client": (client_id,),
+        "acao_do_dia_candidates": (client_id, 30),
+        "lead_explain_features": (client_id, lead_id),
+    }
+
+
+def _planning_ms(conn: psycopg.Connection, sql: str, params: Tuple[Any, ...]) -> float:
+    cur = psycopg.ClientCursor(conn)
+    try:
+        cur.execute("EXPLAIN (SUMMARY, FORMAT JSON) " + sql, params)
+        raw = cur.fetchone()[0]
+        plan = (raw if isinstance(raw, list) else json.loads(raw))[0]
+        return float(plan.get("Planning Time") or 0.0)
+    finally:
+        conn.rollback()
+
+
+def _timed(conn: psycopg.Connection, run: Callable[[], None], iterations: int) -> float:
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - t0) * 1_000_000)
+        conn.rollback()
+    return statistics.median(samples)
+
+
+def _pick_client(conn: psycopg.Connection) -> Tuple[str, int]:
+    with conn.cursor(row_factory=dict_row) as cur:
+        cur.execute(
+            "SELECT client_id, MAX(id) AS lead_id FROM leads WHERE deleted_at IS NULL "
+            "GROUP BY client_id ORDER BY COUNT(*) DESC LIMIT 1"
+        )
+        row = cur.fetchone() or {}
+    conn.rollback()
+    return str(row.get("client_id") or "bench"), int(row.get("lead_id") or 0)
+
+
+def main(argv: List[str]) -> int:
+    if not settings.DATABASE_URL:
+        print("DATABASE_URL não configurada", file=sys.stderr)
+        return 2
+    iterations = int(argv[2]) if len(argv) > 2 else 200
+
+    with psycopg.connect(settings.DATABASE_URL, prepare_threshold=None) as conn:
+        client_id, lead_id = (argv[1], 0) if len(argv) > 1 and argv[1] else _pick_client(conn)
+        params = _params(client_id, lead_id)
+        stmts = catalog()
+
+        results: Dict[str, Dict[str, float]] = {}
+        for name, sql in stmts.items():
+            p = params[name]
+            plan_ms = _planning_ms(conn, sql, p)
+            unprepared = _timed(conn, lambda: conn.execute(sql, p, prepare=False), iterations)
+            conn.execute(sql, p, prepare=True)  # aquece: PREPARE fica no cache da conexão
+            conn.rollback()
+            prepared = _timed(conn, lambda: conn.execute(sql, p, prepare=True), iterations)
+            results[name] = {"plan_ms": plan_ms, "unprepared_us": unprepared, "prepared_us": prepared}
+
+    print(f"client_id={client_id} iteracoes={iterations}")
+    print(f"{'statement':28} {'plan_ms':>8} {'sem_prepare_us':>15} {'preparado_us':>13} {'ganho_us':>9}")
+    for name, r in results.items():
+        gain = r["unprepared_us"] - r["prepared_us"]
+        print(f"{name:28} {r['plan_ms']:8.3f} {r['unprepared_us']:15.1f} {r['prepared_us']:13.1f} {gain:9.1f}")
+
+    print("\nPlanejamento economizado por request:")
+    for endpoint, names in ENDPOINTS.items():
+        plan_ms = sum(results[n]["plan_ms"] for n in names)
+        gain_us = sum(results[n]["unprepared_us"] - results[n]["prepared_us"] for n in names)
+        print(f"  {endpoint:30} planning={plan_ms:.3f} ms  latência medida={gain_us / 1000:.3f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv))
@@ -0,0 +1,131 @@
+"""Teste de carga simples para comparar o deploy sync (gunicorn app:app) com o ASGI (asgi:app).
+
+Exemplo (mesmo banco, mesmo número de workers):
+  gunicorn -w 2 -b :8001 app:app &
+  gunicorn -w 2 -k uvicorn.workers.UvicornWorker -b :8002 asgi:app &
+  python -m scripts.load_test --url http://localhost:8001 --client-id c1 --api-key sk_live_x --pid <pid master sync>
+  python -m scripts.load_test --url http://localhost:8002 --client-id c1 --api-key sk_live_x --pid <pid master asgi>
+
+Mede requests/s, latência p50/p95/p99 e, com --pid, o RSS do servidor (master + workers)
+antes e no pico da carga: (pico - ocioso) / concorrência = memória por request simultânea.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+
+def _rss_kb(pid: int) -> int:
+    """RSS do processo e filhos diretos (workers do gunicorn), via /proc."""
+
+    pids = [pid]
+    children = f"/proc/{pid}/task/{pid}/children"
+    if os.path.exists(children):
+        with open(children, encoding="utf-8") as fh:
+            pids += [int(p) for p in fh.read().split()]
+    total = 0
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status", encoding="utf-8") as fh:
+                for line in fh:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except FileNotFoundError:
+            continue
+    return total
+
+
+def _worker(args, stop: threading.Event, latencies: List[float], errors: Dict[str, int], lock: threading.Lock):
+    session = requests.Session()
+    headers = {"X-CLIENT-ID": args.client_id, "Content-Type": "application/json"}
+    if args.api_key:
+        headers["X-API-KEY"] = args.api_key
+    body = json.dumps({"nome": "Carga", "tempo_site": 120, "paginas_visitadas": 3, "clicou_preco": 1})
+    i = 0
+    while not stop.is_set():
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            if args.mix == "prever" or (args.mix == "mixed" and i % 4 == 0):
+                r = session.post(f"{args.url}/prever", data=body, headers=headers, timeout=30)
+            else:
+                r = session.get(f"{args.url}/dashboard_data", headers=headers, timeout=30)
+            status: Optional[int] = r.status_code
+        except requests.RequestException:
+            status = None
+        elapsed = (time.perf_counter() - t0) * 1000
+        with lock:
+            if status == 200:
+                latencies.append(elapsed)
+            else:
+                key = str(status or "network")
+                errors[key] = errors.get(key, 0) + 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--client-id", required=True)
+    parser.add_argument("--api-key", default="")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--mix", choices=["dashboard", "prever", "mixed"], default="mixed")
+    parser.add_argument("--pid", type=int, default=0, help="PID do master do servidor (mede RSS)")
+    args = parser.parse_args()
+
+    rss_idle = _rss_kb(args.pid) if args.pid else 0
+    rss_peak = rss_idle
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=_worker, args=(args, stop, latencies, errors, lock), daemon=True)
+        for _ in range(args.concurrency)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    while time.perf_counter() - start < args.duration:
+        time.sleep(0.5)
+        if args.pid:
+            rss_peak = max(rss_peak, _rss_kb(args.pid))
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    ordered = sorted(latencies)
+
+    def pct(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+    result = {
+        "url": args.url,
+        "mix": args.mix,
+        "concurrency": args.concurrency,
+        "requests_ok": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(pct(0.50), 1),
+            "p95": round(pct(0.95), 1),
+            "p99": round(pct(0.99), 1),
+            "mean": round(statistics.mean(latencies), 1) if latencies else 0.0,
+        },
+    }
+    if args.pid:
+        result["rss_kb"] = {"idle": rss_idle, "peak": rss_peak}
+        result["kb_per_concurrent_request"] = round((rss_peak - rss_idle) / max(1, args.concurrency), 1)
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,431 @@
+"""API keys guardadas como HMAC-SHA256 com pepper do servidor (tabela api_keys, migration 016).
+
+A chave em texto só aparece na resposta que a cria (signup, login, /criar_cliente); o banco guarda
+HMAC(API_KEY_PEPPER, chave). As chaves são aleatórias (128 bits), então um hash rápido basta e dispensa
+salt por linha: o hash é determinístico e a auth vira um lookup direto pela PK de key_hash, que já traz
+o perfil do cliente (plano, status, uso do mês). Sem o pepper, um dump do banco não autentica ninguém.
+
+O perfil fica num LRU por processo (API_KEY_CACHE_MAX entradas, TTL de API_KEY_CACHE_TTL_SECONDS):
+request repetido com a mesma chave não toca o banco. Mudança de plano/status feita em outro processo
+aparece em até um TTL; no processo que fez a mudança, forget_client() limpa na hora. Chave desconhecida no
+tier do rate limit fica num cache negativo à parte (API_KEY_NEGATIVE_CACHE_SECONDS), que a auth não consulta.
+
+Cada login emite uma chave de login (source='login'); acima de API_KEYS_PER_CLIENT, as de login mais antigas
+são apagadas. Chaves de integração (signup, /criar_cliente) não entram na poda. Chave apagada sai do cache
+de todos os processos: o hash vai para um ZSET no Redis que cada processo consulta no máximo a cada
+API_KEY_REVOCATION_POLL_MS (sem Redis, vale o TTL do cache).
+
+Chaves antigas (clients.api_key em texto) migram no primeiro uso: achadas pelo índice antigo
+(idx_clients_api_key), ganham o hash e o texto é apagado. `python -m services.api_keys migrate` faz o
+mesmo para todas, em lotes.
+"""
+
+import hashlib
+import hmac
+import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+from psycopg.rows import dict_row, tuple_row
+from structlog import get_logger
+
+from services import settings
+from services.cache import get_async_redis_client, get_redis_client
+from services.db import READ_ONLY, db
+from services.statements import execute as execute_statement
+from services.utils import month_key, now_utc
+
+logger = get_logger()
+
+KEY_PREFIX = "sk_live_"
+REVOKED_ZSET = "api_keys:revoked"
+
+INSERT_KEY_SQL = "INSERT INTO api_keys (key_hash, client_id) VALUES (%s, %s) ON CONFLICT (key_hash) DO NOTHING"
+INSERT_LOGIN_KEY_SQL = (
+    "INSERT INTO api_keys (key_hash, client_id, source) VALUES (%s, %s, 'login') ON CONFLICT (key_hash) DO NOTHING"
+)
+
+# Mantém as API_KEYS_PER_CLIENT chaves de login emitidas mais recentemente (migration 019).
+PRUNE_KEYS_SQL = """
+    DELETE FROM api_keys
+    WHERE client_id = %(client_id)s AND source = 'login'
+      AND key_hash NOT IN (
+          SELECT key_hash FROM api_keys WHERE client_id = %(client_id)s AND source = 'login'
+          ORDER BY created_at DESC LIMIT %(keep)s
+      )
+    RETURNING key_hash
+"""
+
+HAS_KEY_SQL = "SELECT 1 FROM api_keys WHERE client_id = %s LIMIT 1"
+
+_LEGACY_SQL = "SELECT client_id FROM clients WHERE api_key = %s AND api_key <> '' FOR UPDATE"
+_CLEAR_LEGACY_SQL = "UPDATE clients SET api_key = '' WHERE client_id = %s"
+_TOUCH_SQL = "UPDATE api_keys SET last_used_at = NOW() WHERE key_hash = %s"
+# last_used_at é informativo (chaves paradas): no máximo uma vez por hora, e só no miss do cache.
+_TOUCH_AFTER = timedelta(hours=1)
+# Margem para relógio diferente entre máquinas na leitura do ZSET de revogadas.
+_REVOKED_SKEW_S = 5.0
+
+_LOCK = threading.Lock()
+# hash -> (expira em, perfil ou None para chave desconhecida)
+_CACHE: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+_MISSES: "OrderedDict[str, float]" = OrderedDict()  # hash -> monotonic de expiração (só read_api_key_profile)
+_REVOKED_POLLED_AT = 0.0  # monotonic da última leitura do ZSET
+_REVOKED_SINCE = 0.0  # relógio (score) a partir do qual ler na próxima
+_PEPPER_WARNED = False
+
+
+def gen_api_key(client_id: str) -> str:
+    raw = f"{client_id}:{secrets.token_urlsafe(24)}:{secrets.token_hex(4)}"
+    return KEY_PREFIX + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def hash_api_key(api_key: str) -> str:
+    return hmac.new(settings.API_KEY_PEPPER.encode("utf-8"), api_key.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def new_api_key(client_id: str) -> Tuple[str, str]:
+    """(chave em texto para devolver uma vez, hash para gravar com INSERT_KEY_SQL)."""
+
+    api_key = gen_api_key(client_id)
+    return api_key, hash_api_key(api_key)
+
+
+def _cache_get(key_hash: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    with _LOCK:
+        hit = _CACHE.get(key_hash)
+        if hit is None:
+            return False, None
+        if hit[0] < time.monotonic():
+            del _CACHE[key_hash]
+            return False, None
+        _CACHE.move_to_end(key_hash)
+        return True, hit[1]
+
+
+def _cache_put(key_hash: str, profile: Optional[Dict[str, Any]]) -> None:
+    with _LOCK:
+        _CACHE[key_hash] = (time.monotonic() + settings.API_KEY_CACHE_TTL_SECONDS, profile)
+        _CACHE.move_to_end(key_hash)
+        while len(_CACHE) > settings.API_KEY_CACHE_MAX:
+            _CACHE.popitem(last=False)
+
+
+def _miss_cached(key_hash: str) -> bool:
+    with _LOCK:
+        expires_at = _MISSES.get(key_hash)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del _MISSES[key_hash]
+            return False
+        return True
+
+
+def _miss_put(key_hash: str) -> None:
+    if not settings.API_KEY_NEGATIVE_CACHE_SECONDS:
+        return
+    with _LOCK:
+        _MISSES[key_hash] = time.monotonic() + settings.API_KEY_NEGATIVE_CACHE_SECONDS
+        _MISSES.move_to_end(key_hash)
+        while len(_MISSES) > settings.API_KEY_CACHE_MAX:
+            _MISSES.popitem(last=False)
+
+
+def _cache_drop(key_hashes: List[str]) -> None:
+    with _LOCK:
+        for key_hash in key_hashes:
+            _CACHE.pop(key_hash, None)
+
+
+def _revoked_poll_due() -> Optional[float]:
+    """Score mínimo a ler do ZSET de revogadas, ou None se ainda não é hora (API_KEY_REVOCATION_POLL_MS)."""
+
+    global _REVOKED_POLLED_AT, _REVOKED_SINCE
+    now = time.monotonic()
+    with _LOCK:
+        if now - _REVOKED_POLLED_AT < settings.API_KEY_REVOCATION_POLL_MS / 1000:
+            return None
+        _REVOKED_POLLED_AT = now
+        since, _REVOKED_SINCE = _REVOKED_SINCE, time.time() - _REVOKED_SKEW_S
+        return since
+
+
+def _sync_revoked() -> None:
+    since = _revoked_poll_due()
+    client = get_redis_client() if since is not None else None
+    if client is None:
+        return
+    try:
+        _cache_drop(client.zrangebyscore(REVOKED_ZSET, since, "+inf"))
+    except redis.RedisError:
+        logger.warning("api_key_revoked_poll_failed")
+
+
+async def _sync_revoked_async() -> None:
+    since = _revoked_poll_due()
+    client = get_async_redis_client() if since is not None else None
+    if client is None:
+        return
+    try:
+        _cache_drop(await client.zrangebyscore(REVOKED_ZSET, since, "+inf"))
+    except redis.RedisError:
+        logger.warning("api_key_revoked_poll_failed")
+
+
+def revoke_cached(key_hashes: List[str]) -> None:
+    """Chaves apagadas do banco: saem do cache deste processo na hora e dos demais no próximo poll."""
+
+    if not key_hashes:
+        return
+    _cache_drop(key_hashes)
+    client = get_redis_client()
+    if client is None:
+        return
+    now = time.time()
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.zadd(REVOKED_ZSET, {h: now for h in key_hashes})
+        # Depois de um TTL do cache, nenhum processo tem mais a chave: pode sair do ZSET.
+        pipe.zremrangebyscore(REVOKED_ZSET, "-inf", now - settings.API_KEY_CACHE_TTL_SECONDS - _REVOKED_SKEW_S)
+        pipe.execute()
+    except redis.RedisError:
+        logger.warning("api_key_revoke_publish_failed", keys=len(key_hashes))
+
+
+def warn_if_no_pepper() -> None:
+    """Aviso de startup (uma vez por processo): sem API_KEY_PEPPER, o hash das chaves não protege um dump."""
+
+    global _PEPPER_WARNED
+    if not settings.API_KEY_PEPPER and not _PEPPER_WARNED:
+        _PEPPER_WARNED = True
+        logger.warning("api_key_pepper_missing", hint="defina API_KEY_PEPPER (igual em todos os processos)")
+
+
+def forget_client(client_id: str) -> None:
+    """Tira do cache deste processo os perfis do cliente (depois de mudar plano/status)."""
+
+    with _LOCK:
+        for key_hash in [h for h, (_, p) in _CACHE.items() if p and p["client_id"] == client_id]:
+            del _CACHE[key_hash]
+
+
+def read_api_key_profile(api_key: str) -> Optional[Dict[str, Any]]:
+    """Perfil da chave sem escrita no banco (tier do rate limit, antes do handler).
+
+    Cache primeiro; no miss, uma leitura na réplica (READ_ONLY), que vai para o cache e serve a auth do mesmo
+    request. Chave desconhecida (ou ainda não replicada, ou em texto antigo) não fica no cache como None: a auth
+    no primário decide. Ela vai para _MISSES, e requests repetidos com ela (inclusive os já barrados pelo
+    limite) não voltam ao banco até API_KEY_NEGATIVE_CACHE_SECONDS; se a auth achar a chave, o _CACHE passa na
+    frente.
+    """
+
+    if not api_key:
+        return None
+    _sync_revoked()
+    key_hash = hash_api_key(api_key)
+    hit, profile = _cache_get(key_hash)
+    if hit:
+        return _current(profile)
+    if _miss_cached(key_hash):
+        return None
+
+    conn = db(READ_ONLY)
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                execute_statement(cur, "api_key_profile", (key_hash,))
+                profile = _profile(cur.fetchone())
+    finally:
+        conn.close()
+    if profile is not None:
+        _cache_put(key_hash, profile)
+    else:
+        _miss_put(key_hash)
+    return _current(profile)
+
+
+def cache_stats() -> Dict[str, int]:
+    with _LOCK:
+        return {"entries": len(_CACHE), "max": settings.API_KEY_CACHE_MAX, "misses": len(_MISSES)}
+
+
+def _profile(row: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not row:
+        return None
+    return {k: row.get(k) for k in ("client_id", "plan", "status", "usage_month", "leads_used_month")}
+
+
+def _current(profile: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    # Cópia por request; uso de outro mês conta como 0 (a virada é gravada no bump do /prever).
+    if profile is None:
+        return None
+    mk = month_key()
+    if (profile.get("usage_month") or "") != mk:
+        return {**profile, "usage_month": mk, "leads_used_month": 0}
+    return dict(profile)
+
+
+def _needs_touch(row: Dict[str, Any]) -> bool:
+    last = row.get("last_used_at")
+    return last is None or now_utc() - last > _TOUCH_AFTER
+
+
+def lookup_api_key(api_key: str) -> Optional[Dict[str, Any]]:
+    """Perfil (client_id, plan, status, usage_month, leads_used_month) do dono da chave, ou None."""
+
+    if not api_key:
+        return None
+    _sync_revoked()
+    key_hash = hash_api_key(api_key)
+    hit, profile = _cache_get(key_hash)
+    if hit:
+        return _current(profile)
+
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                execute_statement(cur, "api_key_profile", (key_hash,))
+                row = cur.fetchone()
+                if row is None:
+                    cur.execute(_LEGACY_SQL, (api_key,))
+                    legacy = cur.fetchone()
+                    if legacy:
+                        cur.execute(INSERT_KEY_SQL, (key_hash, legacy["client_id"]))
+                        cur.execute(_CLEAR_LEGACY_SQL, (legacy["client_id"],))
+                        execute_statement(cur, "api_key_profile", (key_hash,))
+                        row = cur.fetchone()
+                elif _needs_touch(row):
+                    cur.execute(_TOUCH_SQL, (key_hash,))
+    finally:
+        conn.close()
+
+    profile = _profile(row)
+    _cache_put(key_hash, profile)
+    return _current(profile)
+
+
+async def lookup_api_key_async(api_key: str) -> Optional[Dict[str, Any]]:
+    """lookup_api_key para o modo ASGI (mesmo cache)."""
+
+    from services.async_db import adb
+
+    if not api_key:
+        return None
+    await _sync_revoked_async()
+    key_hash = hash_api_key(api_key)
+    hit, profile = _cache_get(key_hash)
+    if hit:
+        return _current(profile)
+
+    async with adb() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await execute_statement(cur, "api_key_profile", (key_hash,))
+            row = await cur.fetchone()
+            if row is None:
+                await cur.execute(_LEGACY_SQL, (api_key,))
+                legacy = await cur.fetchone()
+                if legacy:
+                    await cur.execute(INSERT_KEY_SQL, (key_hash, legacy["client_id"]))
+                    await cur.execute(_CLEAR_LEGACY_SQL, (legacy["client_id"],))
+                    await execute_statement(cur, "api_key_profile", (key_hash,))
+                    row = await cur.fetchone()
+            elif _needs_touch(row):
+                await cur.execute(_TOUCH_SQL, (key_hash,))
+
+    profile = _profile(row)
+    _cache_put(key_hash, profile)
+    return _current(profile)
+
+
+def issue_api_key(cur, client_id: str) -> str:
+    """Emite uma chave de integração na transação do chamador. Retorna a chave em texto."""
+
+    api_key, key_hash = new_api_key(client_id)
+    cur.execute(INSERT_KEY_SQL, (key_hash, client_id))
+    return api_key
+
+
+def issue_login_key(cur, client_id: str) -> Tuple[str, List[str]]:
+    """Chave de login na transação do chamador + hashes das de login podadas.
+
+    Passe os hashes para revoke_cached() depois do commit: antes, outro processo ainda acharia a chave no banco.
+    """
+
+    api_key, key_hash = new_api_key(client_id)
+    cur.execute(INSERT_LOGIN_KEY_SQL, (key_hash, client_id))
+    cur.execute(PRUNE_KEYS_SQL, {"client_id": client_id, "keep": settings.API_KEYS_PER_CLIENT})
+    return api_key, [row["key_hash"] if isinstance(row, dict) else row[0] for row in cur.fetchall()]
+
+
+def client_has_api_key(client_id: str, row: Dict[str, Any]) -> bool:
+    """Se o cliente tem alguma chave (hash em api_keys ou texto antigo em clients.api_key)."""
+
+    if (row.get("api_key") or "").strip():
+        return True
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor(row_factory=tuple_row) as cur:
+                cur.execute(HAS_KEY_SQL, (client_id,))
+                return cur.fetchone() is not None
+    finally:
+        conn.close()
+
+
+async def client_has_api_key_async(client_id: str, row: Dict[str, Any]) -> bool:
+    from services.async_db import adb
+
+    if (row.get("api_key") or "").strip():
+        return True
+    async with adb() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(HAS_KEY_SQL, (client_id,))
+            return await cur.fetchone() is not None
+
+
+def migrate_plaintext_keys(batch_size: int = 500) -> int:
+    """Passa todas as chaves em texto de clients.api_key para api_keys. Retorna quantas migrou."""
+
+    migrated = 0
+    conn = db()
+    try:
+        while True:
+            with conn.transaction():
+                with conn.cursor(row_factory=tuple_row) as cur:
+                    cur.execute(
+                        "SELECT client_id, api_key FROM clients WHERE api_key <> '' LIMIT %s FOR UPDATE SKIP LOCKED",
+                        (batch_size,),
+                    )
+                    rows = cur.fetchall()
+                    if not rows:
+                        return migrated
+                    cur.executemany(INSERT_KEY_SQL, [(hash_api_key(key.strip()), client_id) for client_id, key in rows])
+                    cur.execute(
+                        "UPDATE clients SET api_key = '' WHERE client_id = ANY(%s)",
+                        ([client_id for client_id, _ in rows],),
+                    )
+            migrated += len(rows)
+    finally:
+        conn.close()
+
+
+def main(argv: List[str]) -> int:
+    cmd = argv[1] if len(argv) > 1 else ""
+    if cmd == "migrate":
+        if not settings.API_KEY_PEPPER:
+            print("Aviso: API_KEY_PEPPER vazio; as chaves migradas ficam atreladas ao pepper vazio.")
+        print(f"Chaves migradas: {migrate_plaintext_keys()}")
+        return 0
+    print("Uso: python -m services.api_keys migrate")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,177 @@
+"""Acesso ao Postgres para o modo ASGI (asgi.py), com psycopg AsyncConnectionPool.
+
+Mesmas variáveis de ambiente do pool síncrono (DB_POOL_*, DB_STATEMENT_TIMEOUT_MS, réplica,
+statements preparados). O pool async é aberto no lifespan do ASGI; as rotas Flask montadas
+no mesmo processo continuam usando services.db.
+"""
+
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import psycopg
+from psycopg.rows import dict_row
+try:
+    from psycopg_pool import AsyncConnectionPool, PoolTimeout
+except Exception:  # pragma: no cover - fallback para ambientes sem pacote
+    AsyncConnectionPool = None
+    PoolTimeout = None
+
+from services import settings
+from services.db import (
+    READ_ONLY,
+    READ_WRITE,
+    REPLICA_LAG_SQL,
+    _REPLICA_STATE,
+    _current_endpoint,
+    _pool_kwargs,
+    _pool_min,
+    _pool_timeout,
+    _record_checkout,
+    _record_release,
+    _replica_check_interval_s,
+    _replica_max_lag_s,
+    _wrote_recently,
+    require_env_db,
+)
+from services.statements import execute as execute_statement
+from services.utils import month_key
+
+_ASYNC_POOL: "AsyncConnectionPool | None" = None
+_ASYNC_REPLICA_POOL: "AsyncConnectionPool | None" = None
+
+
+def _async_pool_max() -> int:
+    # Sem GIL bloqueado em I/O, um worker async atende muito mais requests que um sync:
+    # o teto de conexões por worker costuma precisar ser maior que DB_POOL_MAX.
+    try:
+        return max(_pool_min(), int(os.getenv("DB_ASYNC_POOL_MAX", os.getenv("DB_POOL_MAX", "10"))))
+    except Exception:
+        return max(_pool_min(), 10)
+
+
+async def open_async_pools() -> None:
+    global _ASYNC_POOL, _ASYNC_REPLICA_POOL
+    require_env_db()
+    if AsyncConnectionPool is None:
+        raise RuntimeError("psycopg_pool não instalado: modo ASGI indisponível.")
+    if _ASYNC_POOL is None:
+        _ASYNC_POOL = AsyncConnectionPool(
+            conninfo=settings.DATABASE_URL,
+            min_size=_pool_min(),
+            max_size=_async_pool_max(),
+            timeout=_pool_timeout(),
+            kwargs=_pool_kwargs(),
+            open=False,
+        )
+        await _ASYNC_POOL.open()
+    if _ASYNC_REPLICA_POOL is None and settings.DATABASE_REPLICA_URL:
+        _ASYNC_REPLICA_POOL = AsyncConnectionPool(
+            conninfo=settings.DATABASE_REPLICA_URL,
+            min_size=_pool_min(),
+            max_size=_async_pool_max(),
+            timeout=_pool_timeout(),
+            kwargs=_pool_kwargs(read_only=True),
+            open=False,
+        )
+        await _ASYNC_REPLICA_POOL.open()
+
+
+async def close_async_pools() -> None:
+    global _ASYNC_POOL, _ASYNC_REPLICA_POOL
+    try:
+        if _ASYNC_POOL is not None:
+            await _ASYNC_POOL.close()
+        if _ASYNC_REPLICA_POOL is not None:
+            await _ASYNC_REPLICA_POOL.close()
+    finally:
+        _ASYNC_POOL = None
+        _ASYNC_REPLICA_POOL = None
+
+
+async def _replica_usable_async(pool) -> bool:
+    now = time.monotonic()
+    if now < _REPLICA_STATE["down_until"]:
+        return False
+    if now - _REPLICA_STATE["checked_at"] >= _replica_check_interval_s():
+        _REPLICA_STATE["checked_at"] = now
+        try:
+            async with pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(REPLICA_LAG_SQL)
+                    row = await cur.fetchone() or {}
+            _REPLICA_STATE["lag_s"] = float(row.get("lag_s") or 0.0)
+        except Exception:
+            _REPLICA_STATE["down_until"] = now + _replica_check_interval_s()
+            return False
+    return _REPLICA_STATE["lag_s"] <= _replica_max_lag_s()
+
+
+async def _pick_pool(intent: str, client_id: str):
+    if (
+        intent == READ_ONLY
+        and _ASYNC_REPLICA_POOL is not None
+        and not _wrote_recently(client_id)
+        and await _replica_usable_async(_ASYNC_REPLICA_POOL)
+    ):
+        return _ASYNC_REPLICA_POOL, "async_replica"
+    if _ASYNC_POOL is None:
+        await open_async_pools()
+    return _ASYNC_POOL, "async_primary"
+
+
+@asynccontextmanager
+async def adb(intent: str = READ_WRITE, client_id: str = "") -> AsyncIterator[psycopg.AsyncConnection]:
+    """Conexão async numa transação: commit ao sair do bloco, rollback em exceção."""
+
+    pool, pool_name = await _pick_pool(intent, client_id)
+    t0 = time.perf_counter()
+    try:
+        conn = await pool.getconn()
+    except Exception as exc:
+        if PoolTimeout is not None and isinstance(exc, PoolTimeout):
+            _record_checkout(pool_name, (time.perf_counter() - t0) * 1000, timed_out=True)
+        raise
+    _record_checkout(pool_name, (time.perf_counter() - t0) * 1000)
+    endpoint = _current_endpoint()
+    checked_out_at = time.perf_counter()
+    try:
+        yield conn
+        await conn.commit()
+    except BaseException:
+        await conn.rollback()
+        raise
+    finally:
+        await pool.putconn(conn)
+        _record_release(pool_name, endpoint, (time.perf_counter() - checked_out_at) * 1000)
+
+
+async def ensure_client_row_async(client_id: str, plan: str = "trial") -> Dict[str, Any]:
+    """Versão async de services.db.ensure_client_row."""
+
+    plan = (plan or "trial").strip().lower()
+    if plan not in settings.PLAN_CATALOG:
+        plan = "trial"
+    mk = month_key()
+
+    async with adb() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await execute_statement(cur, "client_insert_if_missing", (client_id, plan, mk))
+            await execute_statement(cur, "client_lock", (client_id,))
+            row: Optional[Dict[str, Any]] = await cur.fetchone() or {}
+
+            if (row.get("usage_month") or "").strip() != mk:
+                await cur.execute(
+                    "UPDATE clients SET usage_month=%s, leads_used_month=0, updated_at=NOW() WHERE client_id=%s",
+                    (mk, client_id),
+                )
+                await execute_statement(cur, "client_lock", (client_id,))
+                row = await cur.fetchone() or row
+
+            if row.get("api_key") is None:
+                await cur.execute("UPDATE clients SET api_key='' WHERE client_id=%s", (client_id,))
+                await execute_statement(cur, "client_lock", (client_id,))
+                row = await cur.fetchone() or row
+
+    return dict(row)
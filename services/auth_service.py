@@ -1,12 +1,17 @@
-import hashlib
-import secrets
+import hmac
 from typing import Any, Dict, Optional, Tuple
 
-from werkzeug.security import check_password_hash, generate_password_hash
-
 from models.user import AuthUser
 from services import settings
+from services.api_keys import (
+    client_has_api_key,
+    client_has_api_key_async,
+    lookup_api_key,
+    lookup_api_key_async,
+)
 from services.db import db, ensure_client_row
+from services.password_pool import hash_password, hash_password_async, verify_password
+from services.session_tokens import is_token, verify_token, verify_token_async
 from services.utils import get_api_key_from_headers
 
 
@@ -24,8 +29,31 @@ def validate_password_strength(password: str) -> Tuple[bool, str]:
     return True, ""
 
 
-def hash_password(password: str) -> str:
-    return generate_password_hash(password, method=f"pbkdf2:sha256:{settings.PBKDF2_ITERATIONS}")
+def signup_fields(data: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "nome": (data.get("nome") or "").strip(),
+        "email": (data.get("email") or "").strip().lower(),
+        "empresa": (data.get("empresa") or "").strip(),
+        "telefone": (data.get("telefone") or "").strip(),
+        "password": (data.get("password") or data.get("senha") or "").strip(),
+        "honeypot": (data.get("company_site") or data.get("website") or "").strip(),
+        "captcha_token": str(
+            data.get("captcha_token")
+            or data.get("cf_turnstile_response")
+            or data.get("cf-turnstile-response")
+            or data.get("cf_turnstile")
+            or ""
+        ).strip(),
+    }
+
+
+SIGNUP_INSERT_SQL = """
+    INSERT INTO clients (
+        client_id, nome, email, empresa, telefone, valid_until,
+        api_key, plan, status, usage_month, leads_used_month,
+        password_hash, created_at, updated_at
+    ) VALUES (%s,%s,%s,%s,%s,%s,'','trial','active',%s,0,%s,NOW(),NOW())
+"""
 
 
 def needs_rehash(stored: str) -> bool:
@@ -38,39 +66,55 @@ def needs_rehash(stored: str) -> bool:
     return True
 
 
-def verify_password(stored: str, password: str) -> bool:
-    return check_password_hash(stored, password)
+_MISSING_API_KEY_MSG = "api_key necessária. Faça login para gerar uma chave e envie no header."
+_INVALID_API_KEY_MSG = "api_key inválida ou ausente."
+_INVALID_TOKEN_MSG = "Token expirado ou revogado. Gere outro em /token."
+
+
+def _key_owner_auth(client_id: str, profile: Dict[str, Any]) -> Tuple[bool, Dict[str, Any], str]:
+    # compare_digest: o tempo da comparação não depende de quanto do client_id bate.
+    if hmac.compare_digest(str(profile.get("client_id") or "").encode("utf-8"), client_id.encode("utf-8")):
+        return True, profile, ""
+    return False, {}, _INVALID_API_KEY_MSG
 
 
-def gen_api_key(client_id: str) -> str:
-    raw = f"{client_id}:{secrets.token_urlsafe(24)}:{secrets.token_hex(4)}"
-    return "sk_live_" + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+def _no_key_auth(row: Dict[str, Any], has_key: bool) -> Tuple[bool, Dict[str, Any], str]:
+    # Chave ausente/desconhecida: só passa cliente sem chave nenhuma, e com REQUIRE_API_KEY desligado.
+    if has_key:
+        return False, row, _INVALID_API_KEY_MSG
+    if settings.REQUIRE_API_KEY:
+        return False, row, _MISSING_API_KEY_MSG
+    return True, row, ""
 
 
 def require_client_auth(client_id: str) -> Tuple[bool, Dict[str, Any], str]:
-    row = ensure_client_row(client_id, plan="trial")
-    expected = (row.get("api_key") or "").strip()
-    if not expected:
-        if settings.REQUIRE_API_KEY:
-            api_key = gen_api_key(client_id)
-            conn = db()
-            try:
-                with conn:
-                    with conn.cursor() as cur:
-                        cur.execute(
-                            "UPDATE clients SET api_key=%s, updated_at=NOW() WHERE client_id=%s",
-                            (api_key, client_id),
-                        )
-                row["api_key"] = api_key
-            finally:
-                conn.close()
-            return False, row, "api_key necessária. Gere/recupere uma chave e envie no header."
-        return True, row, ""
+    """(ok, perfil do cliente, erro). Access token: sem banco; api_key: um lookup em cache (services/api_keys.py)."""
 
     got = get_api_key_from_headers()
-    if got != expected:
-        return False, row, "api_key inválida ou ausente."
-    return True, row, ""
+    if is_token(got):
+        # Access token assinado: verificação em memória (services/session_tokens.py).
+        profile = verify_token(got)
+        return _key_owner_auth(client_id, profile) if profile else (False, {}, _INVALID_TOKEN_MSG)
+    profile = lookup_api_key(got) if got else None
+    if profile is not None:
+        return _key_owner_auth(client_id, profile)
+    row = ensure_client_row(client_id, plan="trial")
+    return _no_key_auth(row, client_has_api_key(client_id, row))
+
+
+async def require_client_auth_async(client_id: str, got: str) -> Tuple[bool, Dict[str, Any], str]:
+    """require_client_auth para o modo ASGI (a api_key vem já extraída dos headers)."""
+
+    from services.async_db import ensure_client_row_async
+
+    if is_token(got):
+        profile = await verify_token_async(got)
+        return _key_owner_auth(client_id, profile) if profile else (False, {}, _INVALID_TOKEN_MSG)
+    profile = await lookup_api_key_async(got) if got else None
+    if profile is not None:
+        return _key_owner_auth(client_id, profile)
+    row = await ensure_client_row_async(client_id, plan="trial")
+    return _no_key_auth(row, await client_has_api_key_async(client_id, row))
 
 
 def load_user(client_id: str) -> Optional[AuthUser]:
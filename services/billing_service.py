@@ -1,12 +1,14 @@
 import json
 import time
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from psycopg.rows import dict_row
 
 from services import settings
+from services.api_keys import forget_client
 from services.db import db
+from services.session_tokens import forget_epoch
 
 _KIWIFY_OAUTH_CACHE = {"token": "", "expires_at": 0}
 
@@ -21,6 +23,39 @@ def stripe_price_id(plan: str) -> Optional[str]:
         return None
 
 
+_UPSERT_SUBSCRIPTION_SQL = """
+    INSERT INTO subscriptions (client_id, provider, status, plan, current_period_start, current_period_end, cancel_at_period_end, updated_at)
+    VALUES (%s,%s,%s,%s,%s,%s,%s,NOW())
+    ON CONFLICT (client_id) DO UPDATE SET
+      provider=EXCLUDED.provider,
+      status=EXCLUDED.status,
+      plan=EXCLUDED.plan,
+      current_period_start=EXCLUDED.current_period_start,
+      current_period_end=EXCLUDED.current_period_end,
+      cancel_at_period_end=EXCLUDED.cancel_at_period_end,
+      updated_at=NOW()
+"""
+
+_INSERT_BILLING_EVENT_SQL = (
+    "INSERT INTO billing_events (provider, event_type, client_id, payload) VALUES (%s,%s,%s,%s::jsonb)"
+)
+
+
+def _client_status_update(client_id: str, plan: str, status: str) -> Optional[Tuple[str, Tuple[Any, ...]]]:
+    # token_epoch + 1: access tokens carregam plano/status, os antigos deixam de valer.
+    if status == "active":
+        return (
+            "UPDATE clients SET plan=%s, status='active', token_epoch=token_epoch + 1, updated_at=NOW() WHERE client_id=%s",
+            (plan, client_id),
+        )
+    if status in ("past_due", "canceled", "inactive"):
+        return (
+            "UPDATE clients SET status='inactive', token_epoch=token_epoch + 1, updated_at=NOW() WHERE client_id=%s",
+            (client_id,),
+        )
+    return None
+
+
 def upsert_subscription(
     client_id: str,
     plan: str,
@@ -37,35 +72,61 @@ def upsert_subscription(
         with conn:
             with conn.cursor(row_factory=dict_row) as cur:
                 cur.execute(
-                    """
-                    INSERT INTO subscriptions (client_id, provider, status, plan, current_period_start, current_period_end, cancel_at_period_end, updated_at)
-                    VALUES (%s,%s,%s,%s,%s,%s,%s,NOW())
-                    ON CONFLICT (client_id) DO UPDATE SET
-                      provider=EXCLUDED.provider,
-                      status=EXCLUDED.status,
-                      plan=EXCLUDED.plan,
-                      current_period_start=EXCLUDED.current_period_start,
-                      current_period_end=EXCLUDED.current_period_end,
-                      cancel_at_period_end=EXCLUDED.cancel_at_period_end,
-                      updated_at=NOW()
-                    """,
+                    _UPSERT_SUBSCRIPTION_SQL,
                     (client_id, provider, status, plan, period_start, period_end, cancel_at_period_end),
                 )
+                client_update = _client_status_update(client_id, plan, status)
+                if client_update:
+                    cur.execute(*client_update)
+        forget_client(client_id)
+        forget_epoch(client_id)
+    finally:
+        conn.close()
+
 
-                if status == "active":
-                    cur.execute(
-                        "UPDATE clients SET plan=%s, status='active', updated_at=NOW() WHERE client_id=%s",
-                        (plan, client_id),
-                    )
-                elif status in ("past_due", "canceled", "inactive"):
-                    cur.execute(
-                        "UPDATE clients SET status='inactive', updated_at=NOW() WHERE client_id=%s",
-                        (client_id,),
-                    )
+async def upsert_subscription_async(
+    client_id: str,
+    plan: str,
+    status: str,
+    provider: str = "manual",
+    period_start: Optional[datetime] = None,
+    period_end: Optional[datetime] = None,
+    cancel_at_period_end: bool = False,
+):
+    from services.async_db import adb
+
+    if plan not in settings.PLAN_CATALOG:
+        plan = "trial"
+    async with adb() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                _UPSERT_SUBSCRIPTION_SQL,
+                (client_id, provider, status, plan, period_start, period_end, cancel_at_period_end),
+            )
+            client_update = _client_status_update(client_id, plan, status)
+            if client_update:
+                await cur.execute(*client_update)
+    forget_client(client_id)
+    forget_epoch(client_id)
+
+
+def record_billing_event(provider: str, event_type: str, client_id: str, payload: Dict[str, Any]) -> None:
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(_INSERT_BILLING_EVENT_SQL, (provider, event_type, client_id or None, json.dumps(payload)))
     finally:
         conn.close()
 
 
+async def record_billing_event_async(provider: str, event_type: str, client_id: str, payload: Dict[str, Any]) -> None:
+    from services.async_db import adb
+
+    async with adb() as conn:
+        await conn.execute(_INSERT_BILLING_EVENT_SQL, (provider, event_type, client_id or None, json.dumps(payload)))
+
+
 def kiwify_get_token() -> Optional[str]:
     if not (settings.KIWIFY_API_KEY and settings.KIWIFY_CLIENT_SECRET and settings.KIWIFY_ACCOUNT_ID):
         return None
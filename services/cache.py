@@ -2,10 +2,12 @@ import json
 from typing import Any, Optional
 
 import redis
+import redis.asyncio
 
 from services import settings
 
 _redis_client: Optional[redis.Redis] = None
+_async_redis_client: Optional[redis.asyncio.Redis] = None
 
 
 def _get_client() -> Optional[redis.Redis]:
@@ -18,6 +20,29 @@ def _get_client() -> Optional[redis.Redis]:
     return _redis_client
 
 
+def get_redis_client() -> Optional[redis.Redis]:
+    return _get_client()
+
+
+def get_async_redis_client() -> Optional[redis.asyncio.Redis]:
+    """Cliente redis.asyncio (modo ASGI). Um por processo, criado dentro do event loop."""
+
+    global _async_redis_client
+    if _async_redis_client is not None:
+        return _async_redis_client
+    if not settings.REDIS_URL:
+        return None
+    _async_redis_client = redis.asyncio.from_url(settings.REDIS_URL, decode_responses=True)
+    return _async_redis_client
+
+
+async def close_async_redis_client() -> None:
+    global _async_redis_client
+    if _async_redis_client is not None:
+        await _async_redis_client.aclose()
+        _async_redis_client = None
+
+
 def cache_get_json(key: str) -> Optional[Any]:
     client = _get_client()
     if not client:
@@ -60,3 +85,17 @@ def cache_delete_prefix(prefix: str) -> None:
             client.delete(*keys)
         if cursor == 0:
             break
+
+
+async def cache_delete_prefix_async(prefix: str) -> None:
+    client = get_async_redis_client()
+    if not client:
+        return
+    cursor = 0
+    pattern = f"{prefix}*"
+    while True:
+        cursor, keys = await client.scan(cursor=cursor, match=pattern, count=100)
+        if keys:
+            await client.delete(*keys)
+        if cursor == 0:
+            break
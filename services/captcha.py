@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from dataclasses import dataclass
 
 import requests
@@ -53,3 +54,9 @@ def verify_turnstile(token: str, remoteip: str | None = None) -> CaptchaResult:
         if settings.CAPTCHA_SOFT_FAIL:
             return CaptchaResult(ok=True, error="soft_fail")
         return CaptchaResult(ok=False, error="network_error")
+
+
+async def verify_turnstile_async(token: str, remoteip: str | None = None) -> CaptchaResult:
+    """verify_turnstile sem bloquear o event loop (modo ASGI): a chamada HTTP roda numa thread."""
+
+    return await asyncio.to_thread(verify_turnstile, token, remoteip)
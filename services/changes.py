@@ -0,0 +1,127 @@
+"""Change feed de leads (/leads_changes): o que mudou depois de um cursor opaco.
+
+Ordem total por (updated_at, id). Cada página é um seek no índice (client_id, updated_at, id), então o custo
+é proporcional às mudanças, não ao tamanho do cliente. Inserts, rescoring e labels aparecem como
+op="upsert"; soft delete (deleted_at preenchido) vira op="delete" (tombstone). Leads que a retenção já
+tirou da tabela quente por exclusão continuam saindo como tombstone a partir de leads_archive.
+
+Só entram mudanças com updated_at < NOW() - CHANGE_FEED_LAG_SECONDS: updated_at é o início da transação,
+e uma transação ainda aberta pode commitar depois com um updated_at menor que o do cursor já entregue.
+"""
+
+import base64
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg.rows import dict_row
+
+from services import settings
+from services.db import db
+from services.utils import iso
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+FEED_COLUMNS = (
+    "id, nome, email_lead AS email, telefone, origem, tempo_site, paginas_visitadas, clicou_preco, "
+    "probabilidade, score, label, virou_cliente, created_at, updated_at, deleted_at"
+)
+
+FEED_SQL = f"""
+    SELECT * FROM (
+        (SELECT {FEED_COLUMNS} FROM leads
+         WHERE client_id = %(client_id)s
+           AND (updated_at, id) > (%(updated_at)s, %(id)s)
+           AND updated_at < NOW() - make_interval(secs => %(lag)s)
+         ORDER BY updated_at, id
+         LIMIT %(limit)s)
+        UNION ALL
+        (SELECT {FEED_COLUMNS} FROM leads_archive
+         WHERE client_id = %(client_id)s AND archive_reason = 'deleted'
+           AND (updated_at, id) > (%(updated_at)s, %(id)s)
+           AND updated_at < NOW() - make_interval(secs => %(lag)s)
+         ORDER BY updated_at, id
+         LIMIT %(limit)s)
+    ) changes
+    ORDER BY updated_at, id
+    LIMIT %(limit)s
+"""
+
+# Soft delete (/excluir_lead): updated_at junto, para o tombstone entrar no feed depois do cursor do CRM.
+SOFT_DELETE_SQL = """
+    UPDATE leads SET deleted_at = NOW(), updated_at = NOW()
+    WHERE client_id = %s AND id = %s AND deleted_at IS NULL
+"""
+
+# Cursor inicial: tudo desde o começo (sincronização completa pelo próprio feed).
+START = (_EPOCH, 0)
+
+
+def encode_cursor(updated_at: datetime, lead_id: int) -> str:
+    micros = (updated_at - _EPOCH) // timedelta(microseconds=1)
+    return base64.urlsafe_b64encode(f"{micros}:{int(lead_id)}".encode("ascii")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """(updated_at, id) do cursor. ValueError se não for um cursor emitido por encode_cursor."""
+
+    cursor = (cursor or "").strip()
+    if not cursor:
+        return START
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        micros, lead_id = raw.split(":")
+        return _EPOCH + timedelta(microseconds=int(micros)), int(lead_id)
+    except Exception:
+        raise ValueError("cursor inválido") from None
+
+
+def change_item(row: Dict[str, Any]) -> Dict[str, Any]:
+    if row.get("deleted_at") is not None:
+        return {
+            "op": "delete",
+            "id": int(row["id"]),
+            "updated_at": iso(row["updated_at"]),
+            "deleted_at": iso(row["deleted_at"]),
+        }
+    lead = dict(row)
+    lead.pop("deleted_at", None)
+    lead["created_at"] = iso(lead.get("created_at"))
+    lead["updated_at"] = iso(lead.get("updated_at"))
+    return {"op": "upsert", "id": int(row["id"]), "updated_at": lead["updated_at"], "lead": lead}
+
+
+def fetch_changes(
+    client_id: str, cursor: str = "", limit: Optional[int] = None, lag: Optional[float] = None
+) -> Dict[str, Any]:
+    """Uma página do feed. next_cursor sempre vem preenchido (igual ao de entrada se não houve mudança).
+
+    lag=0 só para quem também recebe os NOTIFY (services/live.py): o que commitar depois chega por lá.
+    """
+
+    updated_at, lead_id = decode_cursor(cursor)
+    limit = max(1, min(int(limit or settings.CHANGE_FEED_PAGE_MAX), settings.CHANGE_FEED_PAGE_MAX))
+    # Primário: na réplica, uma mudança atrasada além do lag de segurança seria pulada de vez.
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(
+                    FEED_SQL,
+                    {
+                        "client_id": client_id,
+                        "updated_at": updated_at,
+                        "id": lead_id,
+                        "lag": settings.CHANGE_FEED_LAG_SECONDS if lag is None else lag,
+                        "limit": limit,
+                    },
+                )
+                rows: List[Dict[str, Any]] = cur.fetchall() or []
+    finally:
+        conn.close()
+
+    next_cursor = encode_cursor(rows[-1]["updated_at"], rows[-1]["id"]) if rows else (cursor or encode_cursor(*START))
+    return {
+        "changes": [change_item(r) for r in rows],
+        "next_cursor": next_cursor,
+        "has_more": len(rows) == limit,
+    }
@@ -0,0 +1,201 @@
+"""Coortes semanais e latência até o rótulo (/cohorts), calculadas em NumPy.
+
+Um cursor nomeado (server-side, binário) traz só quatro colunas por lead da janela (chegada, rótulo, momento
+do rótulo, origem) em lotes para arrays NumPy; a matriz de coortes e os percentis por origem
+saem vetorizados (bincount/cumsum/percentile), sem loop por lead em Python.
+
+Cache por (cliente, janela, geração). A geração é o MAX(updated_at) do cliente, um probe no índice
+(client_id, updated_at, id) do change feed: qualquer escrita em leads (inclusive soft delete) muda a
+geração, então um resultado em cache nunca fica velho e visitas repetidas não releem os leads.
+"""
+
+import time as _time
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from psycopg.rows import tuple_row
+
+from services import settings
+from services.cache import cache_get_json, cache_set_json
+from services.db import READ_ONLY, db, get_active_leads_query
+from services.utils import iso, now_utc
+
+try:
+    import numpy as np
+except Exception:  # pragma: no cover - numpy está no requirements, mas o resto do app não depende dele
+    np = None
+
+_SP_TZ = ZoneInfo("America/Sao_Paulo")
+_WEEK_S = 7 * 24 * 3600
+
+DEFAULT_WEEKS = 12
+MIN_WEEKS = 2
+MAX_WEEKS = 52
+PERCENTILES = (50, 75, 90)
+
+GENERATION_SQL = "SELECT MAX(updated_at) FROM leads WHERE client_id = %s"
+
+# Colunas mínimas e baratas de decodificar: epochs em float8 (semana e latência saem em NumPy) e a origem
+# só nos rotulados (nos demais vem NULL, que não custa objeto novo no Python).
+# labeled_at (migration 015) só existe para rótulos novos; antes disso, updated_at (leads rotulados não são
+# reescorados, então updated_at é o momento do rótulo).
+COHORT_SQL = f"""
+    SELECT date_part('epoch', created_at) AS created_s,
+           COALESCE(virou_cliente, -1)::int2 AS label,
+           CASE WHEN virou_cliente IS NOT NULL THEN date_part('epoch', COALESCE(labeled_at, updated_at)) END AS labeled_s,
+           CASE WHEN virou_cliente IS NOT NULL THEN COALESCE(origem, '') END AS origem
+    {get_active_leads_query()}
+      AND client_id = %(client_id)s
+      AND created_at >= %(t0)s
+"""
+
+
+def analytics_unavailable() -> Optional[str]:
+    return None if np is not None else "numpy não instalado"
+
+
+def window_start(weeks: int, now: Optional[datetime] = None) -> datetime:
+    """Segunda-feira 00:00 (São Paulo) de weeks-1 semanas atrás: a janela tem `weeks` semanas completas ou em curso."""
+
+    today = (now or now_utc()).astimezone(_SP_TZ).date()
+    monday = today - timedelta(days=today.weekday()) - timedelta(weeks=weeks - 1)
+    return datetime.combine(monday, time.min, tzinfo=_SP_TZ)
+
+
+def _load(cur, client_id: str, t0: datetime) -> Tuple[Any, Any, Any, Any, List[str]]:
+    """(semana, rótulo, horas até o rótulo, código da origem, nomes das origens) em arrays."""
+
+    created: List[Any] = []
+    labels: List[Any] = []
+    labeled: List[Any] = []
+    codes: List[Any] = []
+    origens: Dict[Optional[str], int] = {None: -1}
+    cur.execute(COHORT_SQL, {"client_id": client_id, "t0": t0})
+    while True:
+        rows = cur.fetchmany(settings.EXPORT_BATCH_ROWS)
+        if not rows:
+            break
+        c, lab, lab_s, orig = zip(*rows)
+        created.append(np.fromiter(c, dtype=np.float64, count=len(rows)))
+        labels.append(np.fromiter(lab, dtype=np.int8, count=len(rows)))
+        labeled.append(np.array(lab_s, dtype=np.float64))  # None -> NaN
+        for o in set(orig).difference(origens):
+            origens[o] = len(origens) - 1
+        codes.append(np.fromiter(map(origens.__getitem__, orig), dtype=np.int32, count=len(rows)))
+
+    names = [""] * (len(origens) - 1)
+    for name, code in origens.items():
+        if code >= 0:
+            names[code] = name
+    if not created:
+        return np.zeros(0, np.int64), np.zeros(0, np.int8), np.zeros(0, np.float64), np.zeros(0, np.int32), names
+    created_s = np.concatenate(created)
+    week = np.floor((created_s - t0.timestamp()) / _WEEK_S).astype(np.int64)
+    hours = (np.concatenate(labeled) - created_s) / 3600
+    return week, np.concatenate(labels), hours, np.concatenate(codes), names
+
+
+def _rate(num: Any, den: Any) -> float:
+    return round(float(num) / float(den), 4) if den else 0.0
+
+
+def _percentiles(values: Any) -> Dict[str, Optional[float]]:
+    if not len(values):
+        return {f"hours_p{p}": None for p in PERCENTILES}
+    return {f"hours_p{p}": round(float(v), 1) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def compute_cohorts(week: Any, label: Any, hours: Any, codes: Any, origens: List[str], n_weeks: int, t0: date) -> Dict[str, Any]:
+    """Matriz de coortes e percentis a partir dos arrays (sem banco; testável isolado)."""
+
+    # Leads criados depois de "agora" em relógio de outra máquina caem na última semana.
+    week = np.clip(week, 0, n_weeks - 1)
+    labeled = label >= 0
+    converted = label == 1
+
+    leads_per = np.bincount(week, minlength=n_weeks)
+    labeled_per = np.bincount(week[labeled], minlength=n_weeks)
+    converted_per = np.bincount(week[converted], minlength=n_weeks)
+
+    # Conversões por (semana de chegada, semanas até converter) -> acumulado / leads da coorte.
+    age = np.clip(np.floor(np.nan_to_num(hours[converted], nan=0.0) / (24 * 7)), 0, n_weeks - 1).astype(np.int64)
+    matrix = np.bincount(week[converted].astype(np.int64) * n_weeks + age, minlength=n_weeks * n_weeks)
+    cumulative = np.cumsum(matrix.reshape(n_weeks, n_weeks), axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cumulative_rate = np.where(leads_per[:, None] > 0, cumulative / leads_per[:, None], 0.0)
+
+    cohorts = []
+    for i in range(n_weeks):
+        # Coorte i só tem n_weeks - i semanas observadas até hoje.
+        observed = n_weeks - i
+        cohorts.append(
+            {
+                "week": (t0 + timedelta(weeks=i)).isoformat(),
+                "leads": int(leads_per[i]),
+                "labeled": int(labeled_per[i]),
+                "converted": int(converted_per[i]),
+                "conversion_rate": _rate(converted_per[i], labeled_per[i]),
+                "cumulative_conversion": [round(float(x), 4) for x in cumulative_rate[i, :observed]],
+            }
+        )
+
+    # Latência até o rótulo por origem: ordena uma vez por código e corta em fatias.
+    lab_codes = codes[labeled]
+    lab_hours = hours[labeled]
+    lab_conv = converted[labeled]
+    order = np.argsort(lab_codes, kind="stable")
+    lab_codes, lab_hours, lab_conv = lab_codes[order], lab_hours[order], lab_conv[order]
+    counts = np.bincount(lab_codes, minlength=len(origens))
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    latency = []
+    for code in np.argsort(-counts, kind="stable"):
+        lo, hi = bounds[code], bounds[code + 1]
+        latency.append(
+            {
+                "origem": origens[code] or None,
+                "labeled": int(hi - lo),
+                "converted": int(lab_conv[lo:hi].sum()),
+                **_percentiles(lab_hours[lo:hi]),
+            }
+        )
+
+    return {
+        "cohorts": cohorts,
+        "latency_by_origem": latency,
+        "latency_overall": {"labeled": int(labeled.sum()), **_percentiles(hours[labeled])},
+        "leads": int(len(week)),
+    }
+
+
+def fetch_cohorts(client_id: str, weeks: int) -> Dict[str, Any]:
+    """Payload do /cohorts (com "cached": se veio do cache da geração atual)."""
+
+    t0 = window_start(weeks)
+    conn = db(READ_ONLY, client_id)
+    try:
+        with conn:
+            with conn.cursor(row_factory=tuple_row) as cur:
+                cur.execute(GENERATION_SQL, (client_id,))
+                generation = iso((cur.fetchone() or [None])[0]) or "empty"
+            cache_key = f"cohorts:{client_id}:{t0.date().isoformat()}:{weeks}:{generation}"
+            cached = cache_get_json(cache_key)
+            if cached:
+                return {**cached, "cached": True}
+
+            started = _time.perf_counter()
+            with conn.cursor(name="cohorts", row_factory=tuple_row, binary=True) as cur:
+                week, label, hours, codes, origens = _load(cur, client_id, t0)
+    finally:
+        conn.close()
+
+    payload = {
+        "client_id": client_id,
+        "window_weeks": weeks,
+        "window_start": t0.date().isoformat(),
+        "generation": generation,
+        **compute_cohorts(week, label, hours, codes, origens, weeks, t0.date()),
+    }
+    payload["compute_ms"] = round((_time.perf_counter() - started) * 1000, 1)
+    cache_set_json(cache_key, payload, ttl=settings.COHORT_CACHE_TTL_SECONDS)
+    return {**payload, "cached": False}
@@ -0,0 +1,157 @@
+"""Compressão das respostas HTTP negociada pelo Accept-Encoding (zstd, br, gzip).
+
+- Corpo em memória (JSON): comprime se tiver pelo menos COMPRESS_MIN_BYTES.
+- Resposta em streaming (exports): comprime pedaço a pedaço, com flush a cada pedaço, sem bufferizar
+  o arquivo; o cliente começa a receber (e descompactar) assim que o primeiro bloco sai.
+- Só para COMPRESS_MIMETYPES (parquet já vem compactado). Rotas podem sair com @no_compress.
+
+zstd e br são opcionais (pip install zstandard brotli); sem eles, gzip.
+"""
+
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from services import settings
+
+try:
+    import zstandard
+except Exception:  # pragma: no cover - opcional
+    zstandard = None
+
+try:
+    import brotli
+except Exception:  # pragma: no cover - opcional
+    brotli = None
+
+
+def available_encodings() -> list:
+    available = {"gzip": True, "zstd": zstandard is not None, "br": brotli is not None}
+    return [enc for enc in settings.COMPRESS_ALGORITHMS if available.get(enc)]
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Melhor encoding aceito pelo cliente (maior q; empate decide a ordem de COMPRESS_ALGORITHMS)."""
+
+    accepted = {}
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+
+    best = None
+    best_q = 0.0
+    for enc in available_encodings():
+        q = accepted.get(enc, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=settings.COMPRESS_ZSTD_LEVEL).compressobj()
+        elif encoding == "br":
+            self._obj = brotli.Compressor(quality=settings.COMPRESS_BROTLI_QUALITY)
+        else:
+            # wbits=31: formato gzip (header + crc), não zlib cru.
+            self._obj = zlib.compressobj(settings.COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._obj.process(data)
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        """Fecha o bloco atual sem terminar o stream (o cliente já consegue descompactar o que veio)."""
+
+        if self.encoding == "zstd":
+            return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if self.encoding == "br":
+            return self._obj.flush()
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "zstd":
+            return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+        if self.encoding == "br":
+            return self._obj.finish()
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+def compress_bytes(encoding: str, data: bytes) -> bytes:
+    comp = _Compressor(encoding)
+    return comp.compress(data) + comp.finish()
+
+
+def compress_stream(encoding: str, chunks: Iterable) -> Iterator[bytes]:
+    comp = _Compressor(encoding)
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            out = comp.compress(chunk) + comp.flush()
+            if out:
+                yield out
+        yield comp.finish()
+    finally:
+        # Fecha o gerador original (conexão do export volta ao pool mesmo se o cliente cair).
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def no_compress(view):
+    """Rota que nunca deve ser comprimida (ex.: conteúdo já compactado, SSE atrás de proxy)."""
+
+    view._no_compress = True
+    return view
+
+
+def _eligible(response, view) -> bool:
+    if not settings.COMPRESS_ENABLED or getattr(view, "_no_compress", False):
+        return False
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or "Content-Encoding" in response.headers:
+        return False
+    if "no-transform" in (response.headers.get("Cache-Control") or ""):
+        return False
+    return (response.mimetype or "").lower() in settings.COMPRESS_MIMETYPES
+
+
+def compress_response(response):
+    """after_request do Flask."""
+
+    from flask import current_app, request
+
+    view = current_app.view_functions.get(request.endpoint or "")
+    if request.method == "HEAD" or not _eligible(response, view):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate(request.headers.get("Accept-Encoding", ""))
+    if not encoding:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(encoding, response.response)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < settings.COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(compress_bytes(encoding, data))
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -1,36 +1,233 @@
 import atexit
+import contextvars
 import os
-from pathlib import Path
-from typing import Any, Dict, Tuple
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
 
 import psycopg
 from psycopg.rows import dict_row
 try:
-    from psycopg_pool import ConnectionPool
+    from psycopg_pool import ConnectionPool, PoolTimeout
 except Exception:  # pragma: no cover - fallback para ambientes sem pacote
     ConnectionPool = None
+    PoolTimeout = None
 
 from services import settings
+from services.statements import execute as execute_statement, prepare_threshold
 from services.utils import month_key
 
 _SCHEMA_READY = False
 _SCHEMA_LOCK = None
-_MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
 
 _POOL: "ConnectionPool | None" = None
+_REPLICA_POOL: "ConnectionPool | None" = None
+
+READ_WRITE = "rw"
+READ_ONLY = "ro"
+
+# Estado da réplica (por worker): lag medido por último e até quando ela fica fora de rotação.
+_REPLICA_STATE: Dict[str, float] = {"checked_at": 0.0, "lag_s": 0.0, "down_until": 0.0}
+_REPLICA_LOCK = threading.Lock()
+# client_id -> instante da última escrita (read-your-writes local ao worker).
+_RECENT_WRITES: Dict[str, float] = {}
+_RECENT_WRITES_MAX = 10_000
+
+
+# Telemetria dos pools (por worker). Amostras recentes para percentis + agregados por endpoint.
+_STATS_LOCK = threading.Lock()
+_STATS_SAMPLES = 2048
+_POOL_STATS: Dict[str, Dict[str, Any]] = {}
+_ENDPOINT_STATS: Dict[str, Dict[str, float]] = {}
+# Acumulado da request atual (db_checkouts, db_wait_ms, ...) para a linha http_request.
+_REQUEST_STATS: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar(
+    "db_request_stats", default=None
+)
+
+
+def _pool_bucket(name: str) -> Dict[str, Any]:
+    bucket = _POOL_STATS.get(name)
+    if bucket is None:
+        bucket = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+            "hold_ms_total": 0.0,
+            "hold_ms_max": 0.0,
+            "wait_samples": deque(maxlen=_STATS_SAMPLES),
+            "hold_samples": deque(maxlen=_STATS_SAMPLES),
+        }
+        _POOL_STATS[name] = bucket
+    return bucket
+
+
+def _endpoint_bucket(endpoint: str) -> Dict[str, float]:
+    bucket = _ENDPOINT_STATS.get(endpoint)
+    if bucket is None:
+        bucket = {"checkouts": 0, "timeouts": 0, "wait_ms_total": 0.0, "hold_ms_total": 0.0, "hold_ms_max": 0.0}
+        _ENDPOINT_STATS[endpoint] = bucket
+    return bucket
+
+
+def begin_request_stats(endpoint: str) -> None:
+    _REQUEST_STATS.set(
+        {"endpoint": endpoint or "-", "db_checkouts": 0, "db_wait_ms": 0.0, "db_hold_ms": 0.0, "db_pool_timeouts": 0}
+    )
+
+
+def end_request_stats() -> Dict[str, Any]:
+    """Campos de pool da request atual (para o log http_request) e limpa o acumulado."""
+
+    current = _REQUEST_STATS.get()
+    _REQUEST_STATS.set(None)
+    if not current:
+        return {}
+    fields = {k: v for k, v in current.items() if k != "endpoint"}
+    fields["db_wait_ms"] = round(fields["db_wait_ms"], 2)
+    fields["db_hold_ms"] = round(fields["db_hold_ms"], 2)
+    if _POOL is not None:
+        pool_stats = _POOL.get_stats()
+        fields["db_pool_size"] = pool_stats.get("pool_size", 0)
+        fields["db_pool_idle"] = pool_stats.get("pool_available", 0)
+    return fields
+
+
+def _current_endpoint() -> str:
+    current = _REQUEST_STATS.get()
+    return current["endpoint"] if current else "-"
+
+
+def _record_checkout(pool_name: str, wait_ms: float, timed_out: bool = False) -> None:
+    endpoint = _current_endpoint()
+    with _STATS_LOCK:
+        bucket = _pool_bucket(pool_name)
+        per_endpoint = _endpoint_bucket(endpoint)
+        if timed_out:
+            bucket["timeouts"] += 1
+            per_endpoint["timeouts"] += 1
+        else:
+            bucket["checkouts"] += 1
+            per_endpoint["checkouts"] += 1
+        bucket["wait_ms_total"] += wait_ms
+        bucket["wait_ms_max"] = max(bucket["wait_ms_max"], wait_ms)
+        bucket["wait_samples"].append(wait_ms)
+        per_endpoint["wait_ms_total"] += wait_ms
+    current = _REQUEST_STATS.get()
+    if current is not None:
+        current["db_wait_ms"] += wait_ms
+        if timed_out:
+            current["db_pool_timeouts"] += 1
+        else:
+            current["db_checkouts"] += 1
+
+
+def _record_release(pool_name: str, endpoint: str, hold_ms: float) -> None:
+    with _STATS_LOCK:
+        bucket = _pool_bucket(pool_name)
+        per_endpoint = _endpoint_bucket(endpoint)
+        bucket["hold_ms_total"] += hold_ms
+        bucket["hold_ms_max"] = max(bucket["hold_ms_max"], hold_ms)
+        bucket["hold_samples"].append(hold_ms)
+        per_endpoint["hold_ms_total"] += hold_ms
+        per_endpoint["hold_ms_max"] = max(per_endpoint["hold_ms_max"], hold_ms)
+    current = _REQUEST_STATS.get()
+    if current is not None:
+        current["db_hold_ms"] += hold_ms
+
+
+def _percentiles(samples) -> Dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Snapshot da telemetria deste worker (pools + endpoints ordenados por tempo segurando conexão)."""
+
+    pools: Dict[str, Any] = {}
+    with _STATS_LOCK:
+        for name, bucket in _POOL_STATS.items():
+            checkouts = bucket["checkouts"] or 0
+            pools[name] = {
+                "checkouts": checkouts,
+                "timeouts": bucket["timeouts"],
+                "wait_ms_avg": round(bucket["wait_ms_total"] / checkouts, 2) if checkouts else 0.0,
+                "wait_ms_max": round(bucket["wait_ms_max"], 2),
+                "wait_ms": _percentiles(bucket["wait_samples"]),
+                "hold_ms_avg": round(bucket["hold_ms_total"] / checkouts, 2) if checkouts else 0.0,
+                "hold_ms_max": round(bucket["hold_ms_max"], 2),
+                "hold_ms": _percentiles(bucket["hold_samples"]),
+            }
+        endpoints = [
+            {
+                "endpoint": name,
+                "checkouts": int(b["checkouts"]),
+                "timeouts": int(b["timeouts"]),
+                "wait_ms_total": round(b["wait_ms_total"], 2),
+                "hold_ms_total": round(b["hold_ms_total"], 2),
+                "hold_ms_avg": round(b["hold_ms_total"] / b["checkouts"], 2) if b["checkouts"] else 0.0,
+                "hold_ms_max": round(b["hold_ms_max"], 2),
+            }
+            for name, b in _ENDPOINT_STATS.items()
+        ]
+    for name, pool in (("primary", _POOL), ("replica", _REPLICA_POOL)):
+        if pool is None:
+            continue
+        raw = pool.get_stats()
+        pools.setdefault(name, {}).update(
+            {
+                "pool_min": raw.get("pool_min"),
+                "pool_max": raw.get("pool_max"),
+                "pool_size": raw.get("pool_size"),
+                "pool_idle": raw.get("pool_available"),
+                "requests_waiting": raw.get("requests_waiting"),
+            }
+        )
+    endpoints.sort(key=lambda e: e["hold_ms_total"], reverse=True)
+    return {"pid": os.getpid(), "pools": pools, "endpoints": endpoints}
+
+
+def _checkout(pool, pool_name: str) -> "_PooledConn":
+    t0 = time.perf_counter()
+    try:
+        conn = pool.getconn()
+    except Exception as exc:
+        if PoolTimeout is not None and isinstance(exc, PoolTimeout):
+            _record_checkout(pool_name, (time.perf_counter() - t0) * 1000, timed_out=True)
+        raise
+    _record_checkout(pool_name, (time.perf_counter() - t0) * 1000)
+    return _PooledConn(pool, conn, pool_name)
 
 
 class _PooledConn:
     """Adapter para manter compatibilidade com o padrão atual conn.close()."""
 
-    def __init__(self, pool, conn: psycopg.Connection):
+    def __init__(self, pool, conn: psycopg.Connection, pool_name: str = "primary"):
         self._pool = pool
         self._conn = conn
         self._released = False
+        self._pool_name = pool_name
+        self._endpoint = _current_endpoint()
+        self._checked_out_at = time.perf_counter()
 
     def __getattr__(self, name):
         return getattr(self._conn, name)
 
+    @property
+    def autocommit(self) -> bool:
+        return self._conn.autocommit
+
+    @autocommit.setter
+    def autocommit(self, value: bool) -> None:
+        self._conn.autocommit = value
+
     def __enter__(self):
         return self._conn.__enter__()
 
@@ -47,6 +244,7 @@ class _PooledConn:
         except Exception:
             pass
         self._pool.putconn(self._conn)
+        _record_release(self._pool_name, self._endpoint, (time.perf_counter() - self._checked_out_at) * 1000)
 
 
 def require_env_db():
@@ -89,15 +287,42 @@ def _statement_timeout_ms() -> int:
         return 0
 
 
-def _pool_kwargs() -> dict:
+def _replica_max_lag_s() -> float:
+    try:
+        return max(0.0, float(os.getenv("DB_REPLICA_MAX_LAG_S", "10")))
+    except Exception:
+        return 10.0
+
+
+def _replica_check_interval_s() -> float:
+    try:
+        return max(1.0, float(os.getenv("DB_REPLICA_CHECK_INTERVAL_S", "5")))
+    except Exception:
+        return 5.0
+
+
+def _read_your_writes_s() -> float:
+    try:
+        return max(0.0, float(os.getenv("DB_READ_YOUR_WRITES_S", "5")))
+    except Exception:
+        return 5.0
+
+
+def _pool_kwargs(read_only: bool = False) -> dict:
     kwargs = {
         "autocommit": False,
         "row_factory": dict_row,
         "connect_timeout": _conn_timeout(),
+        "prepare_threshold": prepare_threshold(),
     }
+    options = []
     stmt_ms = _statement_timeout_ms()
     if stmt_ms > 0:
-        kwargs["options"] = f"-c statement_timeout={stmt_ms}"
+        options.append(f"-c statement_timeout={stmt_ms}")
+    if read_only:
+        options.append("-c default_transaction_read_only=on")
+    if options:
+        kwargs["options"] = " ".join(options)
     return kwargs
 
 
@@ -120,26 +345,153 @@ def _get_pool():
     return _POOL
 
 
+def _get_replica_pool():
+    global _REPLICA_POOL
+    if _REPLICA_POOL is not None:
+        return _REPLICA_POOL
+    if ConnectionPool is None or not settings.DATABASE_REPLICA_URL:
+        return None
+
+    _REPLICA_POOL = ConnectionPool(
+        conninfo=settings.DATABASE_REPLICA_URL,
+        min_size=_pool_min(),
+        max_size=_pool_max(),
+        timeout=_pool_timeout(),
+        kwargs=_pool_kwargs(read_only=True),
+        open=True,
+    )
+    return _REPLICA_POOL
+
+
 def close_db_pool():
-    global _POOL
-    if _POOL is None:
-        return
+    global _POOL, _REPLICA_POOL
     try:
-        _POOL.close()
+        if _POOL is not None:
+            _POOL.close()
+        if _REPLICA_POOL is not None:
+            _REPLICA_POOL.close()
     finally:
         _POOL = None
+        _REPLICA_POOL = None
 
 
 atexit.register(close_db_pool)
 
 
-def db():
+def note_client_write(client_id: str) -> None:
+    """Marca escrita recente do cliente: leituras dele vão ao primário por DB_READ_YOUR_WRITES_S."""
+
+    if not client_id or not settings.DATABASE_REPLICA_URL:
+        return
+    if len(_RECENT_WRITES) >= _RECENT_WRITES_MAX:
+        cutoff = time.monotonic() - _read_your_writes_s()
+        for key in [k for k, ts in list(_RECENT_WRITES.items()) if ts < cutoff]:
+            _RECENT_WRITES.pop(key, None)
+        if len(_RECENT_WRITES) >= _RECENT_WRITES_MAX:
+            _RECENT_WRITES.clear()
+    _RECENT_WRITES[client_id] = time.monotonic()
+
+
+def _wrote_recently(client_id: str) -> bool:
+    ts = _RECENT_WRITES.get(client_id) if client_id else None
+    return ts is not None and (time.monotonic() - ts) < _read_your_writes_s()
+
+
+# Réplica ociosa tem pg_last_xact_replay_timestamp() antigo: se já aplicou tudo que recebeu, lag = 0.
+REPLICA_LAG_SQL = """
+    SELECT CASE
+             WHEN NOT pg_is_in_recovery() THEN 0
+             WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+             ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END AS lag_s
+"""
+
+
+def _measure_replica_lag(pool) -> float:
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(REPLICA_LAG_SQL)
+            row = cur.fetchone() or {}
+        conn.rollback()
+        return float(row.get("lag_s") or 0.0)
+    finally:
+        pool.putconn(conn)
+
+
+def _replica_usable(pool) -> bool:
+    now = time.monotonic()
+    if now < _REPLICA_STATE["down_until"]:
+        return False
+    if now - _REPLICA_STATE["checked_at"] >= _replica_check_interval_s() and _REPLICA_LOCK.acquire(blocking=False):
+        try:
+            _REPLICA_STATE["lag_s"] = _measure_replica_lag(pool)
+        except Exception:
+            _REPLICA_STATE["down_until"] = now + _replica_check_interval_s()
+            return False
+        finally:
+            _REPLICA_STATE["checked_at"] = now
+            _REPLICA_LOCK.release()
+    return _REPLICA_STATE["lag_s"] <= _replica_max_lag_s()
+
+
+def replica_status() -> Dict[str, Any]:
+    return {
+        "configured": bool(settings.DATABASE_REPLICA_URL),
+        "lag_s": _REPLICA_STATE["lag_s"],
+        "max_lag_s": _replica_max_lag_s(),
+        "in_rotation": time.monotonic() >= _REPLICA_STATE["down_until"]
+        and _REPLICA_STATE["lag_s"] <= _replica_max_lag_s(),
+    }
+
+
+def _replica_conn(client_id: str):
+    """Conexão na réplica, ou None quando a leitura deve ir ao primário."""
+
+    if not settings.DATABASE_REPLICA_URL or _wrote_recently(client_id):
+        return None
+    pool = _get_replica_pool()
+    if pool is None:
+        try:
+            return psycopg.connect(settings.DATABASE_REPLICA_URL, **_pool_kwargs(read_only=True))
+        except Exception:
+            return None
+    if not _replica_usable(pool):
+        return None
+    try:
+        return _checkout(pool, "replica")
+    except Exception:
+        # Réplica fora/saturada: tira de rotação por um intervalo e lê do primário.
+        _REPLICA_STATE["down_until"] = time.monotonic() + _replica_check_interval_s()
+        return None
+
+
+def db(intent: str = READ_WRITE, client_id: str = ""):
+    """Conexão do pool.
+
+    intent=READ_ONLY roteia para DATABASE_REPLICA_URL quando configurada, com fallback ao primário
+    se a réplica estiver fora, atrasada além de DB_REPLICA_MAX_LAG_S, ou se client_id escreveu há pouco.
+    """
+
     require_env_db()
+    if intent == READ_ONLY:
+        conn = _replica_conn(client_id)
+        if conn is not None:
+            return conn
     pool = _get_pool()
     if pool is None:
         return psycopg.connect(settings.DATABASE_URL, **_pool_kwargs())
-    conn = pool.getconn()
-    return _PooledConn(pool, conn)
+    return _checkout(pool, "primary")
+
+
+def listen_connection() -> psycopg.Connection:
+    """Conexão dedicada (fora do pool, autocommit, sem statement_timeout) para LISTEN/NOTIFY.
+
+    Atrás de PgBouncer em transaction mode o LISTEN não funciona: use DATABASE_LISTEN_URL direto no Postgres.
+    """
+
+    require_env_db()
+    return psycopg.connect(settings.DATABASE_LISTEN_URL, autocommit=True, connect_timeout=_conn_timeout())
 
 
 def get_active_leads_query(alias: str | None = None) -> str:
@@ -167,38 +519,11 @@ def ensure_schema_once() -> Tuple[bool, str]:
 
 
 def ensure_schema():
-    conn = db()
-    try:
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS schema_migrations (
-                        version TEXT PRIMARY KEY,
-                        applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                    );
-                    """
-                )
-                cur.execute("SELECT version FROM schema_migrations;")
-                applied = {row[0] for row in (cur.fetchall() or [])}
-
-                if not _MIGRATIONS_DIR.exists():
-                    raise RuntimeError("Diretório migrations/ não encontrado.")
-
-                for path in sorted(_MIGRATIONS_DIR.glob("*.sql")):
-                    version = path.stem.split("_", 1)[0]
-                    if version in applied:
-                        continue
-                    sql_text = path.read_text(encoding="utf-8")
-                    statements = [stmt.strip() for stmt in sql_text.split(";") if stmt.strip()]
-                    for stmt in statements:
-                        cur.execute(stmt)
-                    cur.execute(
-                        "INSERT INTO schema_migrations (version) VALUES (%s)",
-                        (version,),
-                    )
-    finally:
-        conn.close()
+    # Motor único em services/migrations.py (advisory lock, CONCURRENTLY fora de transação).
+    from services.migrations import migrate
+
+    require_env_db()
+    migrate()
 
 
 def ensure_client_row(client_id: str, plan: str = "trial") -> Dict[str, Any]:
@@ -212,16 +537,8 @@ def ensure_client_row(client_id: str, plan: str = "trial") -> Dict[str, Any]:
     try:
         with conn:
             with conn.cursor(row_factory=dict_row) as cur:
-                cur.execute(
-                    """
-                    INSERT INTO clients (client_id, api_key, plan, status, usage_month, leads_used_month, updated_at)
-                    VALUES (%s, '', %s, 'active', %s, 0, NOW())
-                    ON CONFLICT (client_id) DO NOTHING
-                    """,
-                    (client_id, plan, mk),
-                )
-
-                cur.execute("SELECT * FROM clients WHERE client_id=%s FOR UPDATE", (client_id,))
+                execute_statement(cur, "client_insert_if_missing", (client_id, plan, mk))
+                execute_statement(cur, "client_lock", (client_id,))
                 row = cur.fetchone() or {}
 
                 if (row.get("usage_month") or "").strip() != mk:
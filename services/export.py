@@ -0,0 +1,518 @@
+"""Export de leads (/leads_export.csv, /leads_export?format=...).
+
+CSV sai direto do Postgres com COPY (SELECT ...) TO STDOUT: escape contra fórmulas
+(CSV injection) e timestamps ISO são feitos no SQL, e os blocos do COPY são repassados
+à resposta em pedaços de EXPORT_CHUNK_BYTES, com memória constante no worker.
+
+parquet/arrow/ndjson são tipados (timestamps como timestamp UTC, probabilidade float64) e montados
+em lotes de EXPORT_BATCH_ROWS linhas a partir de um cursor server-side. parquet/arrow precisam de pyarrow.
+"""
+
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+from urllib.parse import urlencode
+from zoneinfo import ZoneInfo
+
+from psycopg.rows import tuple_row
+
+from services import settings
+from services.db import READ_ONLY, db
+from services.retention import archived_parquet_leads
+from services.lead_service import lead_temperature
+from services.utils import iso, safe_float
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except Exception:  # pragma: no cover - pyarrow é opcional (só para format=parquet|arrow)
+    pa = None
+    pa_ipc = None
+    pq = None
+
+FORMAT_CSV = "csv"
+FORMAT_PARQUET = "parquet"
+FORMAT_ARROW = "arrow"
+FORMAT_NDJSON = "ndjson"
+
+# formato -> (mimetype, extensão)
+FORMATS: Dict[str, Tuple[str, str]] = {
+    FORMAT_CSV: ("text/csv", "csv"),
+    FORMAT_PARQUET: ("application/vnd.apache.parquet", "parquet"),
+    FORMAT_ARROW: ("application/vnd.apache.arrow.stream", "arrow"),
+    FORMAT_NDJSON: ("application/x-ndjson", "ndjson"),
+}
+
+# (coluna no arquivo, expressão SQL). Mesmo cabeçalho do export antigo.
+EXPORT_COLUMNS: List[Tuple[str, str]] = [
+    ("nome", "nome"),
+    ("email", "email_lead"),
+    ("telefone", "telefone"),
+    ("tempo_site", "tempo_site"),
+    ("paginas_visitadas", "paginas_visitadas"),
+    ("clicou_preco", "clicou_preco"),
+    ("probabilidade", "probabilidade"),
+    ("score", "score"),
+    ("created_at", "created_at"),
+    ("virou_cliente", "virou_cliente"),
+]
+
+_ISO_UTC = "to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS.US\"Z\"')"
+
+
+_SP_TZ = ZoneInfo("America/Sao_Paulo")
+
+TEMPERATURES = ("hot", "warm", "cold", "unknown")
+LABELS = ("pending", "labeled", "converted", "lost")
+
+# Mesmas regras de lead_temperature(). O texto de "hot" é idêntico ao predicado do índice
+# idx_leads_active_client_hot, para o planner provar a implicação e usar o parcial.
+_HOT_SQL = "((probabilidade IS NOT NULL AND probabilidade >= 0.70) OR (score IS NOT NULL AND score >= 70))"
+_WARM_SQL = "((probabilidade IS NOT NULL AND probabilidade >= 0.35) OR (score IS NOT NULL AND score >= 35))"
+_TEMPERATURE_SQL = {
+    "hot": _HOT_SQL,
+    "warm": f"(NOT {_HOT_SQL} AND {_WARM_SQL})",
+    "cold": f"(NOT {_WARM_SQL} AND (probabilidade IS NOT NULL OR score IS NOT NULL))",
+    "unknown": "(probabilidade IS NULL AND score IS NULL)",
+}
+# pending/labeled batem com idx_leads_active_client_pending/_labeled.
+_LABEL_SQL = {
+    "pending": "virou_cliente IS NULL",
+    "labeled": "virou_cliente IS NOT NULL",
+    "converted": "virou_cliente = 1",
+    "lost": "virou_cliente = 0",
+}
+
+
+@dataclass
+class ExportFilters:
+    """Filtros do export, aplicados como predicados SQL (cada um com índice, ver tests/test_query_plans.py)."""
+
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+    temperatures: List[str] = field(default_factory=list)
+    label: str = ""
+    origens: List[str] = field(default_factory=list)
+    min_prob: Optional[float] = None
+
+    def sql(self) -> Tuple[str, List[Any]]:
+        """(" AND ..." para depois de WHERE client_id=%s AND deleted_at IS NULL, params)."""
+
+        parts: List[str] = []
+        params: List[Any] = []
+        if self.created_from is not None:
+            parts.append("created_at >= %s")
+            params.append(self.created_from)
+        if self.created_to is not None:
+            parts.append("created_at < %s")
+            params.append(self.created_to)
+        if self.temperatures:
+            parts.append("(" + " OR ".join(_TEMPERATURE_SQL[t] for t in self.temperatures) + ")")
+        if self.label:
+            parts.append(_LABEL_SQL[self.label])
+        if self.origens:
+            parts.append("origem = ANY(%s)")
+            params.append(list(self.origens))
+        if self.min_prob is not None:
+            parts.append("probabilidade >= %s")
+            params.append(self.min_prob)
+        return "".join(f" AND {p}" for p in parts), params
+
+    def matches(self, row: Mapping[str, Any]) -> bool:
+        """Mesmo filtro em Python, só para o arquivo em Parquet (RETENTION_SINK=parquet)."""
+
+        created = row.get("created_at")
+        if self.created_from is not None and (created is None or created < self.created_from):
+            return False
+        if self.created_to is not None and (created is None or created >= self.created_to):
+            return False
+        if self.temperatures and lead_temperature(row.get("probabilidade"), row.get("score")) not in self.temperatures:
+            return False
+        label = row.get("virou_cliente")
+        if self.label == "pending" and label is not None:
+            return False
+        if self.label == "labeled" and label is None:
+            return False
+        if self.label in ("converted", "lost") and label != (1 if self.label == "converted" else 0):
+            return False
+        if self.origens and row.get("origem") not in self.origens:
+            return False
+        prob = row.get("probabilidade")
+        if self.min_prob is not None and (prob is None or prob < self.min_prob):
+            return False
+        return True
+
+    def query_string(self) -> str:
+        """Forma canônica (ordem fixa): chave de reaproveitamento dos jobs de export."""
+
+        items = []
+        if self.created_from is not None:
+            items.append(("from", iso(self.created_from)))
+        if self.created_to is not None:
+            items.append(("to", iso(self.created_to)))
+        if self.temperatures:
+            items.append(("temperature", ",".join(self.temperatures)))
+        if self.label:
+            items.append(("label", self.label))
+        if self.origens:
+            items.append(("origem", ",".join(self.origens)))
+        if self.min_prob is not None:
+            items.append(("min_prob", repr(self.min_prob)))
+        return urlencode(items)
+
+
+def _parse_bound(value: str, end: bool) -> datetime:
+    """Data (AAAA-MM-DD, dia inteiro no fuso de São Paulo) ou datetime ISO; sem fuso = São Paulo."""
+
+    value = value.strip()
+    if len(value) == 10:
+        day = date.fromisoformat(value)
+        if end:
+            day += timedelta(days=1)
+        return datetime.combine(day, time.min, tzinfo=_SP_TZ).astimezone(timezone.utc)
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=_SP_TZ)
+    return dt.astimezone(timezone.utc)
+
+
+def _csv_list(value: Any) -> List[str]:
+    if isinstance(value, (list, tuple)):
+        items = [str(v) for v in value]
+    else:
+        items = str(value or "").split(",")
+    return [item.strip() for item in items if item.strip()]
+
+
+def parse_export_filters(args: Mapping[str, Any]) -> ExportFilters:
+    """Filtros a partir da query string (ou JSON). ValueError com mensagem para o cliente."""
+
+    filters = ExportFilters()
+    try:
+        if args.get("from"):
+            filters.created_from = _parse_bound(str(args["from"]), end=False)
+        if args.get("to"):
+            filters.created_to = _parse_bound(str(args["to"]), end=True)
+    except ValueError:
+        raise ValueError("from/to inválidos. Use AAAA-MM-DD ou data/hora ISO 8601.") from None
+
+    temperatures = [t.lower() for t in _csv_list(args.get("temperature"))]
+    if any(t not in TEMPERATURES for t in temperatures):
+        raise ValueError(f"temperature inválida. Use: {', '.join(TEMPERATURES)}.")
+    filters.temperatures = sorted(set(temperatures), key=TEMPERATURES.index)
+
+    label = str(args.get("label") or "").strip().lower()
+    if label and label not in LABELS:
+        raise ValueError(f"label inválido. Use: {', '.join(LABELS)}.")
+    filters.label = label
+
+    filters.origens = sorted(set(_csv_list(args.get("origem"))))[:50]
+
+    if args.get("min_prob") not in (None, ""):
+        min_prob = safe_float(args.get("min_prob"), None)
+        if min_prob is None or not 0.0 <= min_prob <= 1.0:
+            raise ValueError("min_prob deve estar entre 0 e 1.")
+        filters.min_prob = min_prob
+    return filters
+
+
+_ACTIVE_WHERE = "WHERE client_id=%s AND deleted_at IS NULL"
+
+
+def export_where(client_id: str, filters: Optional[ExportFilters]) -> Tuple[str, Tuple[Any, ...]]:
+    extra, params = filters.sql() if filters else ("", [])
+    return _ACTIVE_WHERE + extra, (client_id, *params)
+
+
+def csv_safe(value: Any) -> str:
+    s = "" if value is None else str(value)
+    # Protege contra fórmulas maliciosas ao abrir em planilhas.
+    if s.startswith(("=", "+", "-", "@")):
+        return "'" + s
+    return s
+
+
+def _csv_safe_sql(expr: str) -> str:
+    # Mesma regra de csv_safe, no SQL.
+    return f"CASE WHEN ({expr})::text ~ '^[=+@-]' THEN '''' || ({expr})::text ELSE ({expr})::text END"
+
+
+def csv_select_sql(table: str, where: str = _ACTIVE_WHERE) -> str:
+    cols = []
+    for name, expr in EXPORT_COLUMNS:
+        source = _ISO_UTC if name == "created_at" else expr
+        cols.append(f"{_csv_safe_sql(source)} AS {name}")
+    return f"""
+        SELECT {", ".join(cols)}
+        FROM {table}
+        {where}
+        ORDER BY created_at DESC
+    """
+
+
+def _coalesce(chunks: Iterable[Any], size: int) -> Iterator[bytes]:
+    # O COPY entrega ~1 linha por bloco; juntar evita um write por linha no socket.
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        if len(buf) >= size:
+            yield bytes(buf)
+            buf.clear()
+    if buf:
+        yield bytes(buf)
+
+
+# Progresso opcional (jobs de export): recebe o número de linhas de cada pedaço gerado.
+OnRows = Optional[Callable[[int], None]]
+
+
+def _copy_csv(cur, table: str, where: Tuple[str, Tuple[Any, ...]], header: bool, on_rows: OnRows) -> Iterator[bytes]:
+    options = "FORMAT csv, HEADER true" if header else "FORMAT csv"
+    with cur.copy(f"COPY ({csv_select_sql(table, where[0])}) TO STDOUT WITH ({options})", where[1]) as copy:
+        for chunk in _coalesce(copy, settings.EXPORT_CHUNK_BYTES):
+            if on_rows is not None:
+                # Aproximado (campo com quebra de linha conta 2), suficiente para barra de progresso.
+                on_rows(chunk.count(b"\n") - (1 if header else 0))
+                header = False
+            yield chunk
+
+
+def _python_csv(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    # Só para o arquivo em Parquet (RETENTION_SINK=parquet), que não passa pelo Postgres.
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    for i, r in enumerate(rows, 1):
+        writer.writerow(
+            [
+                csv_safe(iso(r.get("created_at")) if name == "created_at" else r.get(expr))
+                for name, expr in EXPORT_COLUMNS
+            ]
+        )
+        if i % 1000 == 0:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def stream_csv(
+    client_id: str,
+    include_archived: bool = False,
+    on_rows: OnRows = None,
+    filters: Optional[ExportFilters] = None,
+) -> Iterator[bytes]:
+    """Leads ativos (mais recentes primeiro) e, com include_archived, os arquivados por horizonte."""
+
+    where = export_where(client_id, filters)
+    conn = db(READ_ONLY, client_id)
+    try:
+        with conn:
+            cur = conn.cursor()
+            yield from _copy_csv(cur, "leads", where, True, on_rows)
+            if include_archived:
+                yield from _copy_csv(cur, "leads_archive", where, False, on_rows)
+    finally:
+        conn.close()
+    if include_archived:
+        for chunk in _python_csv(_archived_parquet_rows(client_id, filters)):
+            if on_rows is not None:
+                on_rows(chunk.count(b"\n"))
+            yield chunk
+
+
+# Formatos tipados: (coluna no arquivo, coluna no banco, tipo pyarrow).
+TYPED_COLUMNS: List[Tuple[str, str, str]] = [
+    ("id", "id", "int64"),
+    ("nome", "nome", "string"),
+    ("email", "email_lead", "string"),
+    ("telefone", "telefone", "string"),
+    ("origem", "origem", "string"),
+    ("tempo_site", "tempo_site", "int32"),
+    ("paginas_visitadas", "paginas_visitadas", "int32"),
+    ("clicou_preco", "clicou_preco", "int32"),
+    ("probabilidade", "probabilidade", "float64"),
+    ("score", "score", "int32"),
+    ("created_at", "created_at", "timestamp"),
+    ("virou_cliente", "virou_cliente", "float64"),
+]
+
+
+def format_unavailable(fmt: str) -> Optional[str]:
+    """Mensagem de erro se o formato não puder ser gerado neste deploy."""
+
+    if fmt not in FORMATS:
+        return f"format inválido. Use: {', '.join(FORMATS)}."
+    if fmt in (FORMAT_PARQUET, FORMAT_ARROW) and pa is None:
+        return f"format={fmt} indisponível neste servidor (pyarrow não instalado)."
+    return None
+
+
+def arrow_schema():
+    types = {
+        "int64": pa.int64(),
+        "int32": pa.int32(),
+        "float64": pa.float64(),
+        "string": pa.string(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+    }
+    return pa.schema([(name, types[kind]) for name, _, kind in TYPED_COLUMNS])
+
+
+def typed_select_sql(table: str, where: str = _ACTIVE_WHERE) -> str:
+    return f"""
+        SELECT {", ".join(f"{col} AS {name}" for name, col, _ in TYPED_COLUMNS)}
+        FROM {table}
+        {where}
+        ORDER BY created_at DESC
+    """
+
+
+def _ndjson_select_sql(table: str, where: str) -> str:
+    # Uma linha JSON pronta por registro, serializada pelo Postgres (timestamps em ISO UTC).
+    cols = ", ".join(f"{_ISO_UTC if name == 'created_at' else col} AS {name}" for name, col, _ in TYPED_COLUMNS)
+    return f"""
+        SELECT row_to_json(t)::text AS line
+        FROM (
+            SELECT {cols}
+            FROM {table}
+            {where}
+            ORDER BY created_at DESC
+        ) t
+    """
+
+
+def _batches(conn, sql: str, params: Tuple[Any, ...]) -> Iterator[List[Tuple[Any, ...]]]:
+    # Cursor server-side: o Postgres entrega EXPORT_BATCH_ROWS linhas (tuplas) por vez.
+    with conn.cursor(name="leads_export_batches", row_factory=tuple_row) as cur:
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(settings.EXPORT_BATCH_ROWS)
+            if not rows:
+                return
+            yield rows
+
+
+def _archived_parquet_rows(client_id: str, filters: Optional[ExportFilters]) -> Iterator[Dict[str, Any]]:
+    for row in archived_parquet_leads(client_id):
+        if filters is None or filters.matches(row):
+            yield row
+
+
+def _archived_parquet_batches(client_id: str, filters: Optional[ExportFilters]) -> Iterator[List[Tuple[Any, ...]]]:
+    batch: List[Tuple[Any, ...]] = []
+    for row in _archived_parquet_rows(client_id, filters):
+        batch.append(tuple(row.get(col) for _, col, _ in TYPED_COLUMNS))
+        if len(batch) >= settings.EXPORT_BATCH_ROWS:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _typed_batches(
+    client_id: str, include_archived: bool, filters: Optional[ExportFilters]
+) -> Iterator[List[Tuple[Any, ...]]]:
+    where, params = export_where(client_id, filters)
+    conn = db(READ_ONLY, client_id)
+    try:
+        with conn:
+            tables = ["leads", "leads_archive"] if include_archived else ["leads"]
+            for table in tables:
+                yield from _batches(conn, typed_select_sql(table, where), params)
+    finally:
+        conn.close()
+    if include_archived:
+        yield from _archived_parquet_batches(client_id, filters)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Destino dos writers do pyarrow: acumula bytes até o próximo yield (não guarda o arquivo todo)."""
+
+    def __init__(self):
+        super().__init__()
+        self._buf = bytearray()
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buf += data
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = bytes(self._buf)
+        self._buf.clear()
+        return out
+
+
+def _stream_arrow(
+    client_id: str, include_archived: bool, fmt: str, on_rows: OnRows, filters: Optional[ExportFilters]
+) -> Iterator[bytes]:
+    schema = arrow_schema()
+    sink = _ChunkSink()
+    if fmt == FORMAT_PARQUET:
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pa_ipc.new_stream(sink, schema)
+    try:
+        for rows in _typed_batches(client_id, include_archived, filters):
+            # Cada lote vira um row group (parquet) / record batch (arrow), montado por coluna.
+            columns = [pa.array(values, type=col.type) for values, col in zip(zip(*rows), schema)]
+            writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=schema))
+            if on_rows is not None:
+                on_rows(len(rows))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def _stream_ndjson(
+    client_id: str, include_archived: bool, on_rows: OnRows, filters: Optional[ExportFilters]
+) -> Iterator[bytes]:
+    where, params = export_where(client_id, filters)
+    conn = db(READ_ONLY, client_id)
+    try:
+        with conn:
+            tables = ["leads", "leads_archive"] if include_archived else ["leads"]
+            for table in tables:
+                for rows in _batches(conn, _ndjson_select_sql(table, where), params):
+                    if on_rows is not None:
+                        on_rows(len(rows))
+                    yield ("\n".join(r[0] for r in rows) + "\n").encode("utf-8")
+    finally:
+        conn.close()
+    if include_archived:
+        for rows in _archived_parquet_batches(client_id, filters):
+            lines = []
+            for values in rows:
+                item = {name: value for (name, _, _), value in zip(TYPED_COLUMNS, values)}
+                item["created_at"] = iso(item["created_at"])
+                lines.append(json.dumps(item, ensure_ascii=False, separators=(",", ":")) + "\n")
+            if on_rows is not None:
+                on_rows(len(rows))
+            yield "".join(lines).encode("utf-8")
+
+
+def stream_export(
+    client_id: str,
+    fmt: str = FORMAT_CSV,
+    include_archived: bool = False,
+    on_rows: OnRows = None,
+    filters: Optional[ExportFilters] = None,
+) -> Iterator[bytes]:
+    if fmt == FORMAT_CSV:
+        return stream_csv(client_id, include_archived, on_rows, filters)
+    if fmt == FORMAT_NDJSON:
+        return _stream_ndjson(client_id, include_archived, on_rows, filters)
+    return _stream_arrow(client_id, include_archived, fmt, on_rows, filters)
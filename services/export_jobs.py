@@ -0,0 +1,327 @@
+"""Export assíncrono: o web só cria o job; o arquivo é gerado pelo worker (python -m worker).
+
+Fluxo:
+  POST /export_jobs                     -> cria (ou reaproveita) o job da janela atual
+  GET  /export_jobs/<id>                -> status + progresso (rows_done / rows_total)
+  GET  /export_jobs/<id>/download       -> arquivo pronto, com ETag e Range (retoma download)
+
+O worker pega jobs com FOR UPDATE SKIP LOCKED (vários workers não disputam o mesmo job), grava em
+EXPORT_JOBS_DIR/<cliente>/<id>.<ext>.part em pedaços e renomeia no fim. Heartbeat a cada atualização de
+progresso; job de worker morto (sem heartbeat por EXPORT_JOB_STALE_SECONDS) volta para a fila.
+Pedidos iguais (cliente, formato, include_archived, filtros) na mesma janela de EXPORT_JOB_WINDOW_SECONDS
+reaproveitam o mesmo job/arquivo até expirar (EXPORT_JOB_TTL_SECONDS).
+"""
+
+import hashlib
+import os
+import re
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from psycopg.rows import dict_row
+from structlog import get_logger
+
+from services import settings
+from services.db import READ_ONLY, db
+from services.export import FORMATS, ExportFilters, export_where, parse_export_filters, stream_export
+from services.utils import iso
+
+logger = get_logger()
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_EXPIRED = "expired"
+
+_JOB_COLUMNS = """
+    id, client_id, format, include_archived, filters, window_start, status, attempts, rows_total, rows_done,
+    bytes_done, etag, error, created_at, started_at, finished_at, expires_at
+"""
+
+_CREATE_JOB_SQL = f"""
+    INSERT INTO export_jobs (client_id, format, include_archived, filters, window_start)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (client_id, format, include_archived, filters, window_start)
+        WHERE status IN ('queued', 'running', 'done')
+    DO NOTHING
+    RETURNING {_JOB_COLUMNS}
+"""
+
+_SAME_WINDOW_SQL = f"""
+    SELECT {_JOB_COLUMNS} FROM export_jobs
+    WHERE client_id=%s AND format=%s AND include_archived=%s AND filters=%s AND window_start=%s
+      AND status IN ('queued', 'running', 'done')
+"""
+
+_PENDING_COUNT_SQL = """
+    SELECT COUNT(*) AS n FROM export_jobs
+    WHERE client_id=%s AND status IN ('queued', 'running')
+"""
+
+# Fila: próximo job pendente, ou um "running" cujo worker parou de dar heartbeat.
+_CLAIM_SQL = f"""
+    UPDATE export_jobs
+    SET status='running', attempts=attempts + 1, worker_id=%(worker_id)s,
+        started_at=NOW(), heartbeat_at=NOW(), rows_done=0, bytes_done=0, error=NULL
+    WHERE id = (
+        SELECT id FROM export_jobs
+        WHERE (status='queued'
+               OR (status='running' AND heartbeat_at < NOW() - make_interval(secs => %(stale)s)))
+          AND attempts < %(max_attempts)s
+        ORDER BY created_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING {_JOB_COLUMNS}
+"""
+
+# worker_id no WHERE: se o job foi retomado por outro worker, o antigo para de escrever status.
+_PROGRESS_SQL = """
+    UPDATE export_jobs SET rows_done=%s, bytes_done=%s, heartbeat_at=NOW()
+    WHERE id=%s AND worker_id=%s AND status='running'
+"""
+
+_FINISH_SQL = """
+    UPDATE export_jobs
+    SET status='done', rows_done=%s, bytes_done=%s, etag=%s, finished_at=NOW(), heartbeat_at=NOW(),
+        expires_at=NOW() + make_interval(secs => %s)
+    WHERE id=%s AND worker_id=%s AND status='running'
+"""
+
+_FAIL_SQL = """
+    UPDATE export_jobs
+    SET status=CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END, error=%s, heartbeat_at=NOW()
+    WHERE id=%s AND worker_id=%s AND status='running'
+"""
+
+_REQUEUE_SQL = """
+    UPDATE export_jobs SET status='queued', attempts=GREATEST(attempts - 1, 0), heartbeat_at=NOW()
+    WHERE id=%s AND worker_id=%s AND status='running'
+"""
+
+_EXPIRE_SQL = """
+    UPDATE export_jobs
+    SET status=CASE WHEN status='done' THEN 'expired' ELSE 'failed' END,
+        error=CASE WHEN status='done' THEN error ELSE 'tentativas esgotadas' END
+    WHERE (status='done' AND expires_at < NOW())
+       OR (status IN ('queued', 'running') AND attempts >= %s
+           AND COALESCE(heartbeat_at, created_at) < NOW() - make_interval(secs => %s))
+    RETURNING id, client_id, format, status
+"""
+
+
+class JobStopped(Exception):
+    """Worker recebeu SIGTERM no meio do job: o job volta para a fila."""
+
+
+def window_start(now: Optional[datetime] = None) -> datetime:
+    now = now or datetime.now(timezone.utc)
+    step = settings.EXPORT_JOB_WINDOW_SECONDS
+    return datetime.fromtimestamp(int(now.timestamp()) // step * step, tz=timezone.utc)
+
+
+def job_file(job: Dict[str, Any]) -> Path:
+    safe = re.sub(r"[^\w.-]", "_", job["client_id"])[:120] or "_"
+    ext = FORMATS[job["format"]][1]
+    return Path(settings.EXPORT_JOBS_DIR) / safe / f"{int(job['id'])}.{ext}"
+
+
+def job_payload(job: Dict[str, Any]) -> Dict[str, Any]:
+    total = job.get("rows_total")
+    done = int(job.get("rows_done") or 0)
+    if job["status"] == STATUS_DONE:
+        progress = 1.0
+    elif total:
+        progress = round(min(0.99, done / total), 3)
+    else:
+        progress = 0.0
+    payload = {
+        "id": int(job["id"]),
+        "status": job["status"],
+        "format": job["format"],
+        "include_archived": bool(job["include_archived"]),
+        "filters": dict(parse_qsl(job.get("filters") or "")),
+        "rows_total": total,
+        "rows_done": done,
+        "bytes": int(job.get("bytes_done") or 0),
+        "progress": progress,
+        "created_at": iso(job.get("created_at")),
+        "finished_at": iso(job.get("finished_at")),
+        "expires_at": iso(job.get("expires_at")),
+    }
+    if job["status"] == STATUS_DONE:
+        payload["download_url"] = f"/export_jobs/{int(job['id'])}/download"
+        payload["etag"] = job.get("etag")
+    if job["status"] == STATUS_FAILED:
+        payload["error"] = job.get("error") or "falha no export"
+    return payload
+
+
+def create_job(
+    client_id: str, fmt: str, include_archived: bool, filters: Optional[ExportFilters] = None
+) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """(job, reaproveitado). (None, False) se o cliente já tem EXPORT_JOBS_MAX_PENDING jobs na fila."""
+
+    window = window_start()
+    params = (client_id, fmt, include_archived, filters.query_string() if filters else "", window)
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(_SAME_WINDOW_SQL, params)
+                row = cur.fetchone()
+                if row and (row["status"] != STATUS_DONE or job_file(row).exists()):
+                    return row, True
+                if row:
+                    # Arquivo sumiu do disco (deploy sem volume persistente): gera de novo.
+                    cur.execute("UPDATE export_jobs SET status='expired' WHERE id=%s", (row["id"],))
+                cur.execute(_PENDING_COUNT_SQL, (client_id,))
+                if int((cur.fetchone() or {}).get("n") or 0) >= settings.EXPORT_JOBS_MAX_PENDING:
+                    return None, False
+                cur.execute(_CREATE_JOB_SQL, params)
+                row = cur.fetchone()
+                if row:
+                    logger.info("export_job_created", job_id=row["id"], client_id=client_id, format=fmt)
+                    return row, False
+                # Corrida com outro request da mesma janela: fica com o dele.
+                cur.execute(_SAME_WINDOW_SQL, params)
+                return cur.fetchone(), True
+    finally:
+        conn.close()
+
+
+def get_job(client_id: str, job_id: int) -> Optional[Dict[str, Any]]:
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(f"SELECT {_JOB_COLUMNS} FROM export_jobs WHERE id=%s AND client_id=%s", (job_id, client_id))
+                return cur.fetchone()
+    finally:
+        conn.close()
+
+
+def _execute(sql: str, params) -> None:
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+    finally:
+        conn.close()
+
+
+def claim_job(worker_id: str) -> Optional[Dict[str, Any]]:
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(
+                    _CLAIM_SQL,
+                    {
+                        "worker_id": worker_id,
+                        "stale": settings.EXPORT_JOB_STALE_SECONDS,
+                        "max_attempts": settings.EXPORT_JOB_MAX_ATTEMPTS,
+                    },
+                )
+                return cur.fetchone()
+    finally:
+        conn.close()
+
+
+def _count_rows(job: Dict[str, Any], filters: ExportFilters) -> int:
+    tables = ["leads", "leads_archive"] if job["include_archived"] else ["leads"]
+    where, params = export_where(job["client_id"], filters)
+    conn = db(READ_ONLY, job["client_id"])
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                total = 0
+                for table in tables:
+                    cur.execute(f"SELECT COUNT(*) AS n FROM {table} {where}", params)
+                    total += int((cur.fetchone() or {}).get("n") or 0)
+                return total
+    finally:
+        conn.close()
+
+
+def run_job(job: Dict[str, Any], worker_id: str, should_stop: Callable[[], bool] = lambda: False) -> bool:
+    """Gera o arquivo do job. True = concluído; False = falhou ou foi devolvido à fila."""
+
+    job_id = int(job["id"])
+    path = job_file(job)
+    part = path.with_name(path.name + ".part")
+    start = time.perf_counter()
+    state = {"rows": 0, "bytes": 0, "last": 0.0}
+
+    def on_rows(n: int) -> None:
+        state["rows"] += max(0, n)
+
+    try:
+        filters = parse_export_filters(dict(parse_qsl(job.get("filters") or "")))
+        rows_total = _count_rows(job, filters)
+        _execute("UPDATE export_jobs SET rows_total=%s WHERE id=%s AND worker_id=%s", (rows_total, job_id, worker_id))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        with open(part, "wb") as fh:
+            chunks = stream_export(job["client_id"], job["format"], bool(job["include_archived"]), on_rows, filters)
+            for chunk in chunks:
+                fh.write(chunk)
+                digest.update(chunk)
+                state["bytes"] += len(chunk)
+                if should_stop():
+                    raise JobStopped()
+                now = time.monotonic()
+                if now - state["last"] >= 1.0:
+                    state["last"] = now
+                    _execute(_PROGRESS_SQL, (state["rows"], state["bytes"], job_id, worker_id))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(part, path)
+        _execute(
+            _FINISH_SQL,
+            (state["rows"], state["bytes"], digest.hexdigest()[:32], settings.EXPORT_JOB_TTL_SECONDS, job_id, worker_id),
+        )
+        logger.info(
+            "export_job_done",
+            job_id=job_id,
+            client_id=job["client_id"],
+            format=job["format"],
+            rows=state["rows"],
+            bytes=state["bytes"],
+            duration_ms=int((time.perf_counter() - start) * 1000),
+        )
+        return True
+    except JobStopped:
+        part.unlink(missing_ok=True)
+        _execute(_REQUEUE_SQL, (job_id, worker_id))
+        logger.info("export_job_requeued", job_id=job_id)
+        return False
+    except Exception as exc:
+        part.unlink(missing_ok=True)
+        logger.exception("export_job_failed", job_id=job_id, client_id=job["client_id"])
+        _execute(_FAIL_SQL, (settings.EXPORT_JOB_MAX_ATTEMPTS, repr(exc)[:500], job_id, worker_id))
+        return False
+
+
+def expire_jobs() -> int:
+    """Apaga arquivos vencidos e marca como failed os jobs que esgotaram as tentativas."""
+
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(_EXPIRE_SQL, (settings.EXPORT_JOB_MAX_ATTEMPTS, settings.EXPORT_JOB_STALE_SECONDS))
+                rows = cur.fetchall() or []
+    finally:
+        conn.close()
+    for row in rows:
+        if row["status"] == STATUS_EXPIRED:
+            job_file(row).unlink(missing_ok=True)
+    if rows:
+        logger.info("export_jobs_expired", count=len(rows))
+    return len(rows)
@@ -0,0 +1,179 @@
+"""Agregado do /insights numa única passada pelos leads da janela.
+
+Faixas de probabilidade (calibração), histograma de score e série diária saem do mesmo scan:
+width_bucket() dá o índice da faixa de cada linha e GROUPING SETS agrupa pelas três dimensões de uma vez.
+Mais faixas não alargam a query nem aumentam o custo por linha (antes: dois COUNT FILTER por faixa).
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Tuple
+
+from psycopg.rows import dict_row
+
+from services.db import READ_ONLY, db, get_active_leads_query
+
+DEFAULT_BANDS = 5
+MAX_BANDS = 50
+DEFAULT_SCORE_BINS = 10
+MAX_SCORE_BINS = 100
+
+# Faixa/bin fora do intervalo (p >= 1.0, score >= 100) cai no último, como no agregado antigo (p < 1.01);
+# score negativo cai no primeiro bin. Probabilidade negativa (band 0) fica só nos totais, como antes.
+# LEAST/GREATEST ignoram NULL: sem o CASE, lead sem probabilidade/score cairia na última faixa/bin.
+INSIGHTS_SQL = f"""
+    SELECT GROUPING(band, score_bin, day) AS grp, band, score_bin, day,
+           COUNT(*) AS total,
+           COUNT(*) FILTER (WHERE virou_cliente IS NOT NULL) AS labeled,
+           COUNT(*) FILTER (WHERE virou_cliente = 1) AS converted,
+           COUNT(*) FILTER (WHERE virou_cliente = 0) AS denied
+    FROM (
+        SELECT CASE WHEN probabilidade IS NOT NULL
+                    THEN LEAST(width_bucket(probabilidade, %(edges)s::float8[]), %(bands)s) END AS band,
+               CASE WHEN score IS NOT NULL
+                    THEN GREATEST(LEAST(width_bucket(score::float8, 0, 100, %(score_bins)s), %(score_bins)s), 1)
+               END AS score_bin,
+               DATE(created_at) AS day,
+               virou_cliente
+        {get_active_leads_query()}
+          AND client_id = %(client_id)s
+          AND created_at >= %(since)s
+    ) l
+    GROUP BY GROUPING SETS ((band), (score_bin), (day))
+"""
+
+# GROUPING(band, score_bin, day): bit ligado = coluna agregada (fora do grupo da linha).
+_GRP_BAND = 0b011
+_GRP_SCORE = 0b101
+_GRP_DAY = 0b110
+
+
+def _num(value: float) -> str:
+    return "1.0" if value == 1.0 else f"{value:g}"
+
+
+def band_label(lo: float, hi: float) -> str:
+    """Mesmo rótulo das faixas fixas antigas: "0-0.2", ..., "0.8-1.0"."""
+
+    return f"{_num(lo)}-{_num(hi)}"
+
+
+def parse_bins(args: Mapping[str, Any]) -> Tuple[List[float], int]:
+    """(bordas das faixas de probabilidade, bins de score) a partir de ?bands=N ou ?edges=0,0.5,...,1 e ?score_bins=N.
+
+    ValueError com a mensagem para o 400.
+    """
+
+    raw_edges = (args.get("edges") or "").strip()
+    raw_bands = (args.get("bands") or "").strip()
+    if raw_edges:
+        try:
+            edges = [float(x) for x in raw_edges.split(",") if x.strip()]
+        except ValueError:
+            raise ValueError("edges: lista de números separados por vírgula") from None
+        if len(edges) < 2 or len(edges) - 1 > MAX_BANDS:
+            raise ValueError(f"edges: entre 2 e {MAX_BANDS + 1} valores")
+        if edges[0] != 0.0 or edges[-1] != 1.0 or any(b <= a for a, b in zip(edges, edges[1:])):
+            raise ValueError("edges: crescentes, começando em 0 e terminando em 1")
+    else:
+        try:
+            n = int(raw_bands or DEFAULT_BANDS)
+        except ValueError:
+            raise ValueError("bands: inteiro") from None
+        if not 1 <= n <= MAX_BANDS:
+            raise ValueError(f"bands: entre 1 e {MAX_BANDS}")
+        edges = [round(i / n, 6) for i in range(n + 1)]
+
+    try:
+        score_bins = int((args.get("score_bins") or "").strip() or DEFAULT_SCORE_BINS)
+    except ValueError:
+        raise ValueError("score_bins: inteiro") from None
+    if not 1 <= score_bins <= MAX_SCORE_BINS:
+        raise ValueError(f"score_bins: entre 1 e {MAX_SCORE_BINS}")
+    return edges, score_bins
+
+
+def bins_key(edges: List[float], score_bins: int) -> str:
+    """Parte da chave de cache (insights:<cliente>:<dias>:<bins>)."""
+
+    return ",".join(_num(e) for e in edges) + f"|{score_bins}"
+
+
+def _rate(converted: int, labeled: int) -> float:
+    return round(float((converted / labeled) if labeled else 0.0), 4)
+
+
+def fetch_insights(client_id: str, since: datetime, edges: List[float], score_bins: int) -> Dict[str, Any]:
+    """overall, bands, score_histogram e series (formato do /insights)."""
+
+    n_bands = len(edges) - 1
+    conn = db(READ_ONLY, client_id)
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(
+                    INSIGHTS_SQL,
+                    {"edges": edges, "bands": n_bands, "score_bins": score_bins, "client_id": client_id, "since": since},
+                )
+                rows = cur.fetchall() or []
+    finally:
+        conn.close()
+
+    band_rows = {r["band"]: r for r in rows if r["grp"] == _GRP_BAND}
+    score_rows = {r["score_bin"]: r for r in rows if r["grp"] == _GRP_SCORE}
+    day_rows = sorted((r for r in rows if r["grp"] == _GRP_DAY and r["day"] is not None), key=lambda r: r["day"])
+
+    # Totais = soma do grouping set das faixas (inclui o grupo sem probabilidade, band NULL).
+    totals = {k: sum(int(r[k] or 0) for r in band_rows.values()) for k in ("total", "labeled", "converted", "denied")}
+
+    bands = []
+    for i in range(n_bands):
+        r = band_rows.get(i + 1) or {}
+        labeled, converted = int(r.get("labeled") or 0), int(r.get("converted") or 0)
+        bands.append(
+            {
+                "band": band_label(edges[i], edges[i + 1]),
+                "labeled": labeled,
+                "converted": converted,
+                "conversion_rate": _rate(converted, labeled),
+                "total": int(r.get("total") or 0),
+            }
+        )
+
+    width = 100 / score_bins
+    score_histogram = []
+    for i in range(score_bins):
+        r = score_rows.get(i + 1) or {}
+        labeled, converted = int(r.get("labeled") or 0), int(r.get("converted") or 0)
+        score_histogram.append(
+            {
+                "bin": f"{i * width:g}-{(i + 1) * width:g}",
+                "total": int(r.get("total") or 0),
+                "labeled": labeled,
+                "converted": converted,
+                "conversion_rate": _rate(converted, labeled),
+            }
+        )
+
+    series = [
+        {
+            "day": r["day"].isoformat(),
+            "total": int(r["total"] or 0),
+            "converted": int(r["converted"] or 0),
+            "denied": int(r["denied"] or 0),
+            "pending": int(r["total"] or 0) - int(r["labeled"] or 0),
+        }
+        for r in day_rows
+    ]
+
+    return {
+        "overall": {
+            "window_total": totals["total"],
+            "labeled": totals["labeled"],
+            "converted": totals["converted"],
+            "denied": totals["denied"],
+            "conversion_rate": _rate(totals["converted"], totals["labeled"]),
+        },
+        "bands": bands,
+        "score_histogram": score_histogram,
+        "series": series,
+    }
@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime, timezone
 from typing import Any, Dict, List, Tuple, Optional
 from zoneinfo import ZoneInfo
@@ -5,11 +6,19 @@ from zoneinfo import ZoneInfo
 from psycopg.rows import dict_row
 
 from services import settings
-from services.db import db, ensure_client_row, get_active_leads_query
-from services.utils import iso, safe_float, safe_int
+from services.api_keys import read_api_key_profile
+from services.async_db import adb
+from services.db import READ_ONLY, db, get_active_leads_query, note_client_write
+from services.payloads import encode_payload
+from services.session_tokens import decode_token, is_token
+from services.statements import execute as execute_statement
+from services.utils import iso, month_key, safe_float, safe_int
+from services.validation import sanitize_name, sanitize_origin, sanitize_phone
 
 _SP_TZ = ZoneInfo("America/Sao_Paulo")
 
+ACTION_LIST_LIMIT = 30
+
 
 def sp_today_bounds_utc() -> tuple[datetime, datetime]:
     now_sp = datetime.now(_SP_TZ)
@@ -32,24 +41,11 @@ def lead_temperature(probabilidade: Optional[float], score: Optional[int]) -> st
 
 
 def top_origens(client_id: str, days: int = 30, limit: int = 6):
-    conn = db()
+    conn = db(READ_ONLY, client_id)
     try:
         with conn:
             with conn.cursor(row_factory=dict_row) as cur:
-                active_leads_query = get_active_leads_query()
-                cur.execute(
-                    f"""
-                    SELECT COALESCE(NULLIF(TRIM(origem), ''), 'desconhecida') AS origem,
-                           COUNT(*)::int AS total
-                    {active_leads_query}
-                      AND client_id=%s
-                      AND created_at >= (NOW() - (%s || ' days')::interval)
-                    GROUP BY 1
-                    ORDER BY total DESC, origem ASC
-                    LIMIT %s
-                    """,
-                    (client_id, int(days), int(limit)),
-                )
+                execute_statement(cur, "dashboard_top_origens", (client_id, int(days), int(limit)))
                 return cur.fetchall()
     finally:
         conn.close()
@@ -57,28 +53,11 @@ def top_origens(client_id: str, days: int = 30, limit: int = 6):
 
 def hot_leads_today(client_id: str, limit: int = 20):
     start_utc, end_utc = sp_today_bounds_utc()
-    conn = db()
+    conn = db(READ_ONLY, client_id)
     try:
         with conn:
             with conn.cursor(row_factory=dict_row) as cur:
-                active_leads_query = get_active_leads_query()
-                cur.execute(
-                    f"""
-                    SELECT id, nome, telefone, email_lead, origem,
-                           probabilidade, score, created_at, virou_cliente
-                    {active_leads_query}
-                      AND client_id=%s
-                      AND created_at >= %s AND created_at <= %s
-                      AND (
-                            (probabilidade IS NOT NULL AND probabilidade >= 0.70)
-                            OR (score IS NOT NULL AND score >= 70)
-                          )
-                    ORDER BY COALESCE(probabilidade, score/100.0) DESC NULLS LAST,
-                             created_at DESC
-                    LIMIT %s
-                    """,
-                    (client_id, start_utc, end_utc, int(limit)),
-                )
+                execute_statement(cur, "dashboard_hot_today", (client_id, start_utc, end_utc, int(limit)))
                 rows = cur.fetchall()
                 for r in rows:
                     r["created_at"] = iso(r.get("created_at"))
@@ -87,12 +66,38 @@ def hot_leads_today(client_id: str, limit: int = 20):
         conn.close()
 
 
-def get_threshold(client_id: str) -> float:
+def fetch_action_candidates(client_id: str, limit: int = ACTION_LIST_LIMIT) -> List[Dict[str, Any]]:
     conn = db()
     try:
         with conn:
             with conn.cursor(row_factory=dict_row) as cur:
-                cur.execute("SELECT threshold FROM thresholds WHERE client_id=%s", (client_id,))
+                execute_statement(cur, "acao_do_dia_candidates", (client_id, int(limit)))
+                return [dict(r) for r in (cur.fetchall() or [])]
+    finally:
+        conn.close()
+
+
+def action_item(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": row.get("id"),
+        "nome": row.get("nome"),
+        "email": row.get("email_lead"),
+        "telefone": row.get("telefone"),
+        "origem": row.get("origem"),
+        "score": safe_int(row.get("score"), 0) if row.get("score") is not None else None,
+        "probabilidade": safe_float(row.get("probabilidade"), 0.0),
+        "created_at": iso(row.get("created_at")),
+        "virou_cliente": row.get("virou_cliente"),
+        "temperatura": lead_temperature(row.get("probabilidade"), row.get("score")),
+    }
+
+
+def get_threshold(client_id: str) -> float:
+    conn = db(READ_ONLY, client_id)
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                execute_statement(cur, "threshold_by_client", (client_id,))
                 row = cur.fetchone()
                 if row and row.get("threshold") is not None:
                     return float(row["threshold"])
@@ -115,6 +120,7 @@ def set_threshold(client_id: str, threshold: float):
                     """,
                     (client_id, float(threshold)),
                 )
+        note_client_write(client_id)
     finally:
         conn.close()
 
@@ -124,42 +130,22 @@ def fetch_recent_leads(
     limit: int = settings.DEFAULT_LIMIT,
     offset: int = 0,
 ) -> List[Dict[str, Any]]:
-    conn = db()
+    conn = db(READ_ONLY, client_id)
     try:
         with conn:
             with conn.cursor(row_factory=dict_row) as cur:
-                active_leads_query = get_active_leads_query()
-                cur.execute(
-                    f"""
-                    SELECT id, client_id, nome, email_lead, telefone, tempo_site, paginas_visitadas, clicou_preco,
-                           probabilidade, virou_cliente, created_at
-                    {active_leads_query}
-                      AND client_id=%s
-                    ORDER BY created_at DESC
-                    LIMIT %s
-                    OFFSET %s
-                    """,
-                    (client_id, int(limit), int(offset)),
-                )
+                execute_statement(cur, "dashboard_recent_leads", (client_id, int(limit), int(offset)))
                 return [dict(r) for r in (cur.fetchall() or [])]
     finally:
         conn.close()
 
 
 def count_leads(client_id: str) -> int:
-    conn = db()
+    conn = db(READ_ONLY, client_id)
     try:
         with conn:
             with conn.cursor(row_factory=dict_row) as cur:
-                active_leads_query = get_active_leads_query()
-                cur.execute(
-                    f"""
-                    SELECT COUNT(*)::int AS total
-                    {active_leads_query}
-                      AND client_id=%s
-                    """,
-                    (client_id,),
-                )
+                execute_statement(cur, "dashboard_count_leads", (client_id,))
                 row = cur.fetchone() or {}
                 return int(row.get("total") or 0)
     finally:
@@ -206,48 +192,251 @@ def update_probabilities(client_id: str, ids: List[int], probs: List[float]) ->
                         "UPDATE leads SET probabilidade=%s, updated_at=NOW() WHERE client_id=%s AND id=%s AND deleted_at IS NULL",
                         (float(p), client_id, int(lead_id)),
                     )
+        note_client_write(client_id)
         return len(ids)
     finally:
         conn.close()
 
 
 def check_quota_and_bump(client_id: str, client_row: Dict[str, Any]) -> Tuple[bool, str, Dict[str, Any]]:
-    plan = (client_row.get("plan") or "trial").strip().lower()
-    meta = settings.PLAN_CATALOG.get(plan, settings.PLAN_CATALOG["trial"])
-    used = int(client_row.get("leads_used_month") or 0)
-    limit = int(meta.get("lead_limit_month") or 0)
-
-    if limit > 0 and used >= limit:
-        return False, "Limite mensal atingido. Faça upgrade para continuar.", {
-            "code": "plan_limit",
-            "plan": plan,
-            "used": used,
-            "limit": limit,
-            "price_brl_month": meta.get("price_brl_month"),
-            "setup_fee_brl": meta.get("setup_fee_brl", 0),
-        }
-
+    # Uso lido com a linha travada: o perfil da auth (cache/token) pode estar atrasado ou nem ter o uso.
     conn = db()
     try:
         with conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "UPDATE clients SET leads_used_month = leads_used_month + 1, updated_at=NOW() WHERE client_id=%s",
-                    (client_id,),
-                )
+            with conn.cursor(row_factory=dict_row) as cur:
+                mk = month_key()
+                execute_statement(cur, "prever_lock_usage", (mk, client_id))
+                locked = cur.fetchone() or {}
+                plan = (locked.get("plan") or client_row.get("plan") or "trial").strip().lower()
+                limit_err = plan_limit_error(plan, int(locked.get("leads_used_month") or 0))
+                if limit_err:
+                    return False, "Limite mensal atingido. Faça upgrade para continuar.", limit_err
+                execute_statement(cur, "prever_bump_usage", (mk, mk, client_id))
         return True, "", {}
     finally:
         conn.close()
 
 
-def prever_rate_limit(client_id: str) -> str:
-    if not client_id:
-        return "20 per minute"
-    try:
-        row = ensure_client_row(client_id, plan="trial")
-        plan = (row.get("plan") or "trial").strip().lower()
-    except Exception:
-        plan = "trial"
-    if plan in ("trial", "demo"):
+def client_usage(client_id: str, client_row: Dict[str, Any]) -> Tuple[str, int]:
+    """(mês, leads usados no mês) para exibir. Perfil vindo de token não traz o uso: lê do banco."""
+
+    mk = month_key()
+    if client_row.get("leads_used_month") is None:
+        conn = db(READ_ONLY, client_id)
+        try:
+            with conn:
+                with conn.cursor(row_factory=dict_row) as cur:
+                    cur.execute("SELECT usage_month, leads_used_month FROM clients WHERE client_id=%s", (client_id,))
+                    client_row = cur.fetchone() or {}
+        finally:
+            conn.close()
+    if (client_row.get("usage_month") or "") != mk:
+        return mk, 0
+    return mk, int(client_row.get("leads_used_month") or 0)
+
+
+def prever_limit_for_plan(plan: str) -> str:
+    if (plan or "trial").strip().lower() in ("trial", "demo"):
         return "20 per minute"
     return "600 per minute"
+
+
+def prever_rate_limit(client_id: str, credential: str = "") -> str:
+    """Limite do /prever pelo plano, sem escrita no banco (roda no callback do limiter, antes do handler).
+
+    O plano vem do access token (claims assinados) ou do perfil da API key: cache, ou no miss uma leitura na
+    réplica que enche o cache usado pela auth logo em seguida. Cliente desconhecido fica no limite do trial.
+    """
+
+    if not client_id or not credential:
+        return prever_limit_for_plan("trial")
+    if is_token(credential):
+        claims = decode_token(credential)
+        profile = {"client_id": claims["c"], "plan": claims.get("p")} if claims else None
+    else:
+        profile = read_api_key_profile(credential)
+    if not profile or profile.get("client_id") != client_id:
+        return prever_limit_for_plan("trial")
+    return prever_limit_for_plan(profile.get("plan") or "trial")
+
+
+def plan_limit_error(plan: str, used: int) -> Optional[Dict[str, Any]]:
+    """Campos do erro 402 quando o plano já bateu o limite mensal; None se ainda pode inserir."""
+
+    cat = settings.PLAN_CATALOG.get(plan, settings.PLAN_CATALOG["trial"])
+    limit = int(cat.get("lead_limit_month") or 0)
+    if limit > 0 and used >= limit:
+        return {
+            "code": "plan_limit",
+            "plan": plan,
+            "used": used,
+            "limit": limit,
+            "price_brl_month": cat.get("price_brl_month"),
+            "setup_fee_brl": cat.get("setup_fee_brl", 0),
+        }
+    return None
+
+
+def prever_fields(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Normaliza o corpo do /prever (campos na raiz ou dentro de "lead")."""
+
+    lead = data.get("lead") or {}
+    nome = sanitize_name(data.get("nome") or lead.get("nome") or "")
+    email = (data.get("email_lead") or data.get("email") or lead.get("email_lead") or lead.get("email") or "").strip()
+    telefone = sanitize_phone(data.get("telefone") or lead.get("telefone") or "")
+
+    origem = sanitize_origin(data.get("origem") or lead.get("origem") or lead.get("source") or "")
+
+    tempo_site = safe_int(data.get("tempo_site") if "tempo_site" in data else lead.get("tempo_site"), 0)
+    paginas_visitadas = safe_int(data.get("paginas_visitadas") if "paginas_visitadas" in data else lead.get("paginas_visitadas"), 0)
+    clicou_preco = safe_int(data.get("clicou_preco") if "clicou_preco" in data else lead.get("clicou_preco"), 0)
+
+    payload = lead if isinstance(lead, dict) else {}
+    payload.setdefault("nome", nome)
+    payload.setdefault("email", email)
+    payload.setdefault("email_lead", email)
+    payload.setdefault("telefone", telefone)
+    payload.setdefault("origem", origem or payload.get("origem", ""))
+    payload.setdefault("tempo_site", tempo_site)
+    payload.setdefault("paginas_visitadas", paginas_visitadas)
+    payload.setdefault("clicou_preco", clicou_preco)
+
+    return {
+        "nome": nome,
+        "email": email,
+        "telefone": telefone,
+        "origem": origem,
+        "tempo_site": tempo_site,
+        "paginas_visitadas": paginas_visitadas,
+        "clicou_preco": clicou_preco,
+        "payload": payload,
+    }
+
+
+def score_lead(fields: Dict[str, Any]) -> Tuple[float, int, Optional[int]]:
+    base = 0.10
+    base += min(fields["tempo_site"] / 400, 0.25)
+    base += min(fields["paginas_visitadas"] / 10, 0.25)
+    base += 0.20 if fields["clicou_preco"] else 0.0
+    if fields["telefone"] and len(fields["telefone"]) >= 10:
+        base += 0.06
+    if fields["nome"] and len(fields["nome"]) >= 4:
+        base += 0.04
+
+    prob = max(0.02, min(0.98, base))
+    score = int(round(prob * 100))
+    label = 1 if prob >= 0.70 else (0 if prob < 0.35 else None)
+    return prob, score, label
+
+
+def prever_insert_params(
+    client_id: str, fields: Dict[str, Any], prob: float, score: int, label: Optional[int]
+) -> Tuple[Any, ...]:
+    """Parâmetros do statement prever_insert_lead."""
+
+    return (
+        client_id,
+        fields["nome"],
+        fields["email"],
+        fields["telefone"],
+        fields["origem"],
+        fields["tempo_site"],
+        fields["paginas_visitadas"],
+        fields["clicou_preco"],
+        float(prob),
+        int(score),
+        label,
+        *encode_payload(fields["payload"]),
+    )
+
+
+def new_lead_row(lead_id: int, created_at: Any, fields: Dict[str, Any], prob: float, score: int) -> Dict[str, Any]:
+    """Lead recém-inserido no formato de fetch_action_candidates (para o ranking)."""
+
+    return {
+        "id": int(lead_id or 0),
+        "nome": fields["nome"],
+        "email_lead": fields["email"],
+        "telefone": fields["telefone"],
+        "origem": fields["origem"],
+        "score": int(score),
+        "probabilidade": float(prob),
+        "created_at": created_at,
+        "virou_cliente": None,
+    }
+
+
+def dashboard_payload(
+    client_id: str,
+    page: int,
+    per_page: int,
+    total_leads: int,
+    rows: List[Dict[str, Any]],
+    top_origens_rows: List[Dict[str, Any]],
+    hot_leads: List[Dict[str, Any]],
+) -> Dict[str, Any]:
+    convertidos, negados, pendentes = count_status(rows)
+
+    def norm(item: Dict[str, Any]) -> Dict[str, Any]:
+        rr = dict(item)
+        rr["created_at"] = iso(rr.get("created_at"))
+        return rr
+
+    return {
+        "client_id": client_id,
+        "convertidos": convertidos,
+        "negados": negados,
+        "pendentes": pendentes,
+        "page": page,
+        "per_page": per_page,
+        "total_leads": total_leads,
+        "top_origens_30d": top_origens_rows,
+        "hot_leads_today": hot_leads,
+        "hot_leads_today_tz": "America/Sao_Paulo",
+        "dados": [norm(r) for r in rows],
+        "total_recentes_considerados": len(rows),
+    }
+
+
+async def _fetch_statement_async(client_id: str, name: str, params: Tuple[Any, ...]) -> List[Dict[str, Any]]:
+    async with adb(READ_ONLY, client_id) as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await execute_statement(cur, name, params)
+            return [dict(r) for r in (await cur.fetchall() or [])]
+
+
+async def dashboard_reads_async(client_id: str, limit: int, offset: int):
+    """As 4 leituras do /dashboard_data em paralelo (uma conexão do pool async cada)."""
+
+    start_utc, end_utc = sp_today_bounds_utc()
+    total_rows, rows, top, hot = await asyncio.gather(
+        _fetch_statement_async(client_id, "dashboard_count_leads", (client_id,)),
+        _fetch_statement_async(client_id, "dashboard_recent_leads", (client_id, int(limit), int(offset))),
+        _fetch_statement_async(client_id, "dashboard_top_origens", (client_id, 30, 6)),
+        _fetch_statement_async(client_id, "dashboard_hot_today", (client_id, start_utc, end_utc, 20)),
+    )
+    for r in hot:
+        r["created_at"] = iso(r.get("created_at"))
+    total = int((total_rows[0] if total_rows else {}).get("total") or 0)
+    return total, rows, top, hot
+
+
+async def prever_insert_async(
+    client_id: str, client_row: Dict[str, Any], fields: Dict[str, Any], prob: float, score: int, label: Optional[int]
+) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Transação do /prever no modo ASGI. Retorna (linha inserida, None) ou (None, erro de limite)."""
+
+    async with adb() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            mk = month_key()
+            await execute_statement(cur, "prever_lock_usage", (mk, client_id))
+            locked_client = await cur.fetchone() or {}
+            plan_locked = (locked_client.get("plan") or client_row.get("plan") or "trial").lower()
+            limit_err = plan_limit_error(plan_locked, int(locked_client.get("leads_used_month") or 0))
+            if limit_err:
+                return None, limit_err
+            await execute_statement(cur, "prever_insert_lead", prever_insert_params(client_id, fields, prob, score, label))
+            row = await cur.fetchone() or {}
+            await execute_statement(cur, "prever_bump_usage", (mk, mk, client_id))
+    note_client_write(client_id)
+    return dict(row), None
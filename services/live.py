@@ -0,0 +1,270 @@
+"""Stream SSE de leads quentes (/leads_stream): um LISTEN por processo, fan-out em memória.
+
+O trigger de migrations/014 faz pg_notify('leads_hot', ...) quando um lead entra quente ou quando um rescoring
+mexe num lead que era/ficou quente; o de migrations/020, no soft delete (evento "delete"). O NOTIFY só sai
+no COMMIT. Cada processo web abre UMA conexão dedicada com LISTEN (thread daemon) e distribui os eventos, por
+client_id, para as conexões SSE abertas nele. Parado, o custo no banco é essa conexão ociosa; sem streams por
+SSE_LISTENER_IDLE_SECONDS, ela é fechada.
+
+O id de cada evento é um cursor do change feed (services/changes.py). Reconexão com Last-Event-ID refaz o
+que foi perdido lendo o feed com lag 0: a inscrição acontece antes do replay, então o que commitar durante o
+replay chega pelo NOTIFY (e o que já saiu no replay é descartado). O mesmo replay cobre queda/reconexão do
+LISTEN e fila de eventos estourada.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+from structlog import get_logger
+
+from services import settings
+from services.changes import encode_cursor, fetch_changes
+from services.db import listen_connection
+from services.lead_service import lead_temperature
+from services.utils import iso, now_utc, safe_float, safe_int
+
+logger = get_logger()
+
+CHANNEL = "leads_hot"
+RETRY_MS = 3000
+
+# (id do evento, nome do evento, dados)
+Event = Tuple[str, str, Dict[str, Any]]
+
+_LOCK = threading.Lock()
+_SUBSCRIBERS: Dict[str, List["Subscriber"]] = {}
+_LISTENER: Optional[threading.Thread] = None
+_IDLE_SINCE = time.monotonic()
+
+
+class Subscriber:
+    """Fila de uma conexão SSE. push() roda na thread do LISTEN; take() na thread do request."""
+
+    def __init__(self, client_id: str):
+        self.client_id = client_id
+        self.events: Deque[Event] = deque()
+        self.resync = False
+        self.wake = threading.Event()
+
+    def push(self, event: Event) -> None:
+        # Chamado com _LOCK. Cliente lento não segura memória: descarta e refaz pelo change feed.
+        if len(self.events) >= settings.SSE_QUEUE_MAX:
+            self.events.clear()
+            self.resync = True
+        else:
+            self.events.append(event)
+        self.wake.set()
+
+    def take(self, timeout: float) -> Tuple[List[Event], bool]:
+        self.wake.wait(timeout)
+        with _LOCK:
+            events = list(self.events)
+            self.events.clear()
+            resync, self.resync = self.resync, False
+            self.wake.clear()
+        return events, resync
+
+
+def lead_event(lead: Dict[str, Any]) -> Event:
+    """Evento "lead" no formato da lista de ação (/acao_do_dia) + updated_at."""
+
+    updated_at = lead.get("updated_at")
+    if isinstance(updated_at, str):
+        updated_at = datetime.fromisoformat(updated_at)
+    created_at = lead.get("created_at")
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    data = {
+        "id": safe_int(lead.get("id"), 0),
+        "nome": lead.get("nome"),
+        "email": lead.get("email"),
+        "telefone": lead.get("telefone"),
+        "origem": lead.get("origem"),
+        "score": safe_int(lead.get("score"), 0) if lead.get("score") is not None else None,
+        "probabilidade": safe_float(lead.get("probabilidade"), 0.0),
+        "created_at": iso(created_at),
+        "updated_at": iso(updated_at),
+        "virou_cliente": lead.get("virou_cliente"),
+        "temperatura": lead_temperature(lead.get("probabilidade"), lead.get("score")),
+    }
+    return encode_cursor(updated_at, data["id"]), "lead", data
+
+
+def delete_event(change: Dict[str, Any]) -> Event:
+    """Evento "delete" no formato do tombstone do change feed (NOTIFY da migration 020 ou replay)."""
+
+    data = {
+        "op": "delete",
+        "id": safe_int(change.get("id"), 0),
+        "updated_at": change.get("updated_at"),
+        "deleted_at": change.get("deleted_at"),
+    }
+    return encode_cursor(datetime.fromisoformat(data["updated_at"]), data["id"]), "delete", data
+
+
+def sse_frame(event: Event) -> str:
+    event_id, name, data = event
+    return f"id: {event_id}\nevent: {name}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def live_stats() -> Dict[str, Any]:
+    with _LOCK:
+        by_client = {client_id: len(subs) for client_id, subs in _SUBSCRIBERS.items()}
+        return {
+            "listener_alive": bool(_LISTENER is not None and _LISTENER.is_alive()),
+            "streams": sum(by_client.values()),
+            "streams_by_client": by_client,
+        }
+
+
+def subscribe(client_id: str) -> Optional[Subscriber]:
+    """Registra uma conexão. None se o cliente (ou o processo) já está no limite de streams."""
+
+    global _LISTENER
+    with _LOCK:
+        subs = _SUBSCRIBERS.get(client_id) or []
+        total = sum(len(v) for v in _SUBSCRIBERS.values())
+        if len(subs) >= settings.SSE_MAX_STREAMS_PER_CLIENT or total >= settings.SSE_MAX_STREAMS:
+            return None
+        sub = Subscriber(client_id)
+        _SUBSCRIBERS.setdefault(client_id, []).append(sub)
+        if _LISTENER is None or not _LISTENER.is_alive():
+            _LISTENER = threading.Thread(target=_listen_loop, name="leads-hot-listener", daemon=True)
+            _LISTENER.start()
+    return sub
+
+
+def unsubscribe(sub: Subscriber) -> None:
+    """Idempotente (chamado no fim do gerador e no close da resposta)."""
+
+    global _IDLE_SINCE
+    with _LOCK:
+        subs = _SUBSCRIBERS.get(sub.client_id) or []
+        if sub in subs:
+            subs.remove(sub)
+        if not subs:
+            _SUBSCRIBERS.pop(sub.client_id, None)
+        if not _SUBSCRIBERS:
+            _IDLE_SINCE = time.monotonic()
+
+
+def dispatch(payload: str) -> int:
+    """Entrega um NOTIFY às conexões do cliente neste processo. Retorna quantas receberam."""
+
+    try:
+        lead = json.loads(payload)
+        client_id = str(lead.pop("client_id"))
+        event = delete_event(lead) if lead.get("deleted_at") else lead_event(lead)
+    except Exception:
+        logger.warning("live_bad_notify", payload=payload[:200])
+        return 0
+    with _LOCK:
+        subs = list(_SUBSCRIBERS.get(client_id) or ())
+        for sub in subs:
+            sub.push(event)
+    return len(subs)
+
+
+def _resync_all() -> None:
+    with _LOCK:
+        for subs in _SUBSCRIBERS.values():
+            for sub in subs:
+                sub.resync = True
+                sub.wake.set()
+
+
+def _stop_if_idle() -> bool:
+    global _LISTENER
+    with _LOCK:
+        if _SUBSCRIBERS or time.monotonic() - _IDLE_SINCE < settings.SSE_LISTENER_IDLE_SECONDS:
+            return False
+        _LISTENER = None
+        return True
+
+
+def _listen_loop() -> None:
+    backoff = 1.0
+    while not _stop_if_idle():
+        try:
+            with listen_connection() as conn:
+                conn.execute(f"LISTEN {CHANNEL}")
+                logger.info("live_listener_connected")
+                backoff = 1.0
+                # Eventos de antes do LISTEN (ou da queda anterior) vêm pelo replay de cada conexão.
+                _resync_all()
+                while True:
+                    for note in conn.notifies(timeout=settings.SSE_HEARTBEAT_SECONDS):
+                        dispatch(note.payload)
+                    if _stop_if_idle():
+                        logger.info("live_listener_idle_closed")
+                        return
+        except Exception as exc:
+            logger.warning("live_listener_error", error=str(exc), retry_in_s=backoff)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+
+def _replayable(lead: Dict[str, Any]) -> bool:
+    # Quente, ou alterado depois do insert (rescoring/rótulo): pode ter esfriado com o cliente desconectado, e
+    # o evento com temperatura != hot atualiza o item na lista. Lead novo e frio nunca esteve na lista ao vivo.
+    if lead_temperature(lead.get("probabilidade"), lead.get("score")) == "hot":
+        return True
+    return bool(lead.get("updated_at")) and lead.get("updated_at") != lead.get("created_at")
+
+
+def replay(client_id: str, cursor: str) -> Tuple[List[Event], str, bool]:
+    """Leads quentes ou alterados (podem ter esfriado) e exclusões depois do cursor. (eventos, cursor, reset).
+
+    reset=True quando há mais de SSE_REPLAY_MAX mudanças: mais barato o cliente recarregar a lista.
+    """
+
+    events: List[Event] = []
+    scanned = 0
+    while True:
+        page = fetch_changes(client_id, cursor, lag=0)
+        for change in page["changes"]:
+            if change["op"] == "delete":
+                events.append(delete_event(change))
+            elif _replayable(change["lead"]):
+                events.append(lead_event(change["lead"]))
+        scanned += len(page["changes"])
+        cursor = page["next_cursor"]
+        if scanned > settings.SSE_REPLAY_MAX:
+            return [], cursor, True
+        if not page["has_more"]:
+            return events, cursor, False
+
+
+def stream(sub: Subscriber, last_event_id: str = "") -> Iterator[str]:
+    """Texto SSE até SSE_MAX_STREAM_SECONDS (o navegador reconecta com Last-Event-ID)."""
+
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        # Sem Last-Event-ID o cliente acabou de carregar a lista; a margem só gera duplicatas inofensivas.
+        cursor = last_event_id or encode_cursor(now_utc() - timedelta(seconds=settings.CHANGE_FEED_LAG_SECONDS), 0)
+        resync = bool(last_event_id)
+        seen: Set[str] = set()
+        deadline = time.monotonic() + settings.SSE_MAX_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            if resync:
+                events, cursor, reset = replay(sub.client_id, cursor)
+                if reset:
+                    yield sse_frame((cursor, "reset", {}))
+                seen = {event[0] for event in events}
+                for event in events:
+                    yield sse_frame(event)
+            events, resync = sub.take(settings.SSE_HEARTBEAT_SECONDS)
+            if not events and not resync:
+                yield ": ping\n\n"
+                continue
+            for event in events:
+                if event[0] in seen:
+                    continue
+                cursor = event[0]
+                yield sse_frame(event)
+    finally:
+        unsubscribe(sub)
@@ -0,0 +1,170 @@
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from psycopg.rows import dict_row
+from structlog import get_logger
+
+from services import settings
+from services.cache import cache_get_json, cache_set_json
+from services.db import READ_ONLY, db, get_active_leads_query
+from services.utils import iso, now_utc
+
+logger = get_logger()
+
+_CACHE_KEY = "metrics:snapshot"
+_LOCAL: Dict[str, Any] = {"snapshot": None}
+_REFRESH_LOCK = threading.Lock()
+
+
+def estimate_counts(
+    reltuples: float,
+    active_frac: Optional[float],
+    pending_frac: Optional[float],
+) -> Dict[str, int]:
+    """Estimativa a partir das estatísticas do planner.
+
+    active_frac = null_frac de deleted_at, pending_frac = null_frac de virou_cliente.
+    Assume independência entre as duas colunas (bom o bastante para monitoramento).
+    """
+
+    total_rows = max(0.0, float(reltuples or 0.0))
+    active = total_rows * (1.0 if active_frac is None else float(active_frac))
+    pending = active * (1.0 if pending_frac is None else float(pending_frac))
+    total = int(round(active))
+    pending_i = min(total, int(round(pending)))
+    return {"total_leads": total, "labeled": total - pending_i, "pending": pending_i}
+
+
+def _fetch_estimate(cur) -> Optional[Dict[str, int]]:
+    # Soma pai + partições (quando leads for particionada, o pai não guarda tuplas).
+    cur.execute(
+        """
+        SELECT COALESCE(SUM(c.reltuples) FILTER (WHERE c.reltuples >= 0), -1) AS reltuples
+        FROM pg_class c
+        WHERE c.oid = 'leads'::regclass
+           OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = 'leads'::regclass)
+        """
+    )
+    reltuples = float((cur.fetchone() or {}).get("reltuples") or -1)
+    if reltuples < 0:
+        # Tabela nunca analisada (ainda pequena): não há estimativa confiável.
+        return None
+
+    cur.execute(
+        """
+        SELECT DISTINCT ON (attname) attname, null_frac
+        FROM pg_stats
+        WHERE schemaname = current_schema()
+          AND tablename = 'leads'
+          AND attname IN ('deleted_at', 'virou_cliente')
+        ORDER BY attname, inherited DESC
+        """
+    )
+    fracs = {r["attname"]: r["null_frac"] for r in (cur.fetchall() or [])}
+    return estimate_counts(reltuples, fracs.get("deleted_at"), fracs.get("virou_cliente"))
+
+
+def _fetch_exact(cur) -> Dict[str, int]:
+    active_leads_query = get_active_leads_query()
+    cur.execute(
+        f"""
+        SELECT COUNT(*) AS total,
+               COUNT(*) FILTER (WHERE virou_cliente IS NOT NULL) AS labeled
+        {active_leads_query}
+        """
+    )
+    row = cur.fetchone() or {}
+    total = int(row.get("total") or 0)
+    labeled = int(row.get("labeled") or 0)
+    return {"total_leads": total, "labeled": labeled, "pending": total - labeled}
+
+
+def compute_metrics(exact: bool = False) -> Dict[str, Any]:
+    conn = db(READ_ONLY)
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                counts = None if exact else _fetch_estimate(cur)
+                source = "estimate"
+                if counts is None:
+                    counts = _fetch_exact(cur)
+                    source = "exact"
+    finally:
+        conn.close()
+    payload: Dict[str, Any] = dict(counts)
+    payload["source"] = source
+    payload["computed_at"] = time.time()
+    return payload
+
+
+def _store(snapshot: Dict[str, Any]) -> None:
+    _LOCAL["snapshot"] = snapshot
+    try:
+        # Guarda por mais tempo que o TTL: um snapshot velho ainda serve enquanto outro é calculado.
+        cache_set_json(_CACHE_KEY, snapshot, ttl=settings.METRICS_SNAPSHOT_TTL_SECONDS * 10)
+    except Exception:
+        logger.warning("metrics_snapshot_cache_failed")
+
+
+def _refresh_in_background() -> None:
+    if not _REFRESH_LOCK.acquire(blocking=False):
+        return
+
+    def _run():
+        try:
+            _store(compute_metrics())
+        except Exception:
+            logger.exception("metrics_snapshot_refresh_failed")
+        finally:
+            _REFRESH_LOCK.release()
+
+    threading.Thread(target=_run, name="metrics-snapshot", daemon=True).start()
+
+
+def _age(snapshot: Optional[Dict[str, Any]]) -> float:
+    if not snapshot:
+        return float("inf")
+    return max(0.0, time.time() - float(snapshot.get("computed_at") or 0))
+
+
+def get_metrics_snapshot() -> Dict[str, Any]:
+    """Snapshot global (estimado) com stale-while-revalidate.
+
+    Ordem: cópia local do worker -> Redis (compartilhado) -> cálculo síncrono só quando
+    não existe nenhum snapshot. Snapshots vencidos são servidos enquanto um refresh roda em thread.
+    """
+
+    ttl = settings.METRICS_SNAPSHOT_TTL_SECONDS
+    snapshot = _LOCAL["snapshot"]
+    if _age(snapshot) > ttl:
+        try:
+            shared = cache_get_json(_CACHE_KEY)
+        except Exception:
+            shared = None
+        if isinstance(shared, dict) and _age(shared) < _age(snapshot):
+            snapshot = shared
+            _LOCAL["snapshot"] = shared
+
+    if snapshot is None:
+        snapshot = compute_metrics()
+        _store(snapshot)
+    elif _age(snapshot) > ttl:
+        _refresh_in_background()
+
+    return snapshot
+
+
+def metrics_payload(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    computed_at = float(snapshot.get("computed_at") or 0)
+    return {
+        "db": True,
+        "total_leads": int(snapshot.get("total_leads") or 0),
+        "labeled": int(snapshot.get("labeled") or 0),
+        "pending": int(snapshot.get("pending") or 0),
+        "source": snapshot.get("source") or "estimate",
+        "snapshot_at": iso(datetime.fromtimestamp(computed_at, tz=timezone.utc)) if computed_at else None,
+        "snapshot_age_s": round(_age(snapshot), 1),
+        "ts": iso(now_utc()),
+    }
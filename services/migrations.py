@@ -0,0 +1,448 @@
+"""Motor único de migrations (migrations/*.sql + backfills em lotes).
+
+Uso (Render pre-deploy / Shell):
+  python -m services.migrations up               # aplica migrations/*.sql pendentes
+  python -m services.migrations backfill [nome]  # roda/continua backfills registrados em BACKFILLS
+  python -m services.migrations status
+
+- Um advisory lock no Postgres garante que só um processo migra por vez; os demais esperam e
+  encontram tudo aplicado.
+- Arquivos com CONCURRENTLY rodam fora de transação, statement a statement. Índice inválido
+  deixado por um CREATE INDEX CONCURRENTLY que falhou é removido antes de recriar.
+- Os demais arquivos rodam numa transação cada, com lock_timeout (MIGRATION_LOCK_TIMEOUT_MS)
+  para não enfileirar o tráfego atrás de um ALTER TABLE esperando lock.
+- Backfills percorrem a tabela em faixas de id, uma transação por lote, com pausa entre lotes
+  e progresso salvo em schema_backfills (retomam de onde pararam).
+"""
+
+import re
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import psycopg
+from psycopg.rows import dict_row
+from structlog import get_logger
+
+from services import settings
+
+logger = get_logger()
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+
+# pg_advisory_lock é por banco; a chave só precisa ser estável e exclusiva deste app.
+_MIGRATION_LOCK_KEY = 7_345_021_001
+
+_BOOKKEEPING_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version TEXT PRIMARY KEY,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE TABLE IF NOT EXISTS schema_backfills (
+    name TEXT PRIMARY KEY,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    max_id BIGINT NOT NULL DEFAULT 0,
+    rows_updated BIGINT NOT NULL DEFAULT 0,
+    done BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+)
+"""
+
+_CONCURRENT_INDEX_RE = re.compile(
+    r"^\s*CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\"?[\w.]+\"?)",
+    re.IGNORECASE,
+)
+_INDEX_TARGET_RE = re.compile(r"\bON\s+(?:ONLY\s+)?(\"?[\w.]+\"?)", re.IGNORECASE)
+_DOLLAR_TAG_RE = re.compile(r"\$[A-Za-z_]*\$")
+
+
+@dataclass
+class Backfill:
+    """UPDATE em lotes por faixa de id.
+
+    `sql` recebe %(lo)s e %(hi)s (faixa id > lo AND id <= hi) e deve filtrar as linhas que ainda
+    precisam do backfill, para o lote ser idempotente se for repetido.
+    """
+
+    name: str
+    table: str
+    sql: str
+    after: str = ""  # versão de migration que precisa estar aplicada antes
+
+
+# Backfills registrados (rodam via `python -m services.migrations backfill`, nunca no deploy).
+BACKFILLS: Dict[str, Backfill] = {
+    # leads.payload inline -> lead_payloads (010). Não mexe em updated_at: não é mudança do lead.
+    "lead_payloads": Backfill(
+        name="lead_payloads",
+        table="leads",
+        after="010",
+        sql="""
+            WITH src AS (
+                SELECT id, client_id, payload FROM leads
+                WHERE id > %(lo)s AND id <= %(hi)s AND payload <> '{}'::jsonb
+                FOR UPDATE
+            ), copied AS (
+                INSERT INTO lead_payloads (lead_id, client_id, encoding, payload)
+                SELECT id, client_id, 'json', payload FROM src
+                ON CONFLICT (lead_id) DO NOTHING
+            )
+            UPDATE leads l SET payload = '{}'::jsonb FROM src WHERE l.id = src.id
+        """,
+    ),
+}
+
+
+def split_sql(sql_text: str) -> List[str]:
+    """Quebra um arquivo SQL em statements, respeitando strings, identificadores, comentários
+    e corpos $$...$$ / $tag$...$tag$ (funções e DO blocks têm ';' dentro)."""
+
+    statements: List[str] = []
+    buf: List[str] = []
+    i = 0
+    n = len(sql_text)
+    while i < n:
+        ch = sql_text[i]
+        nxt = sql_text[i + 1] if i + 1 < n else ""
+        if ch == "-" and nxt == "-":
+            end = sql_text.find("\n", i)
+            end = n if end == -1 else end
+            buf.append(sql_text[i:end])
+            i = end
+            continue
+        if ch == "/" and nxt == "*":
+            end = sql_text.find("*/", i + 2)
+            end = n if end == -1 else end + 2
+            buf.append(sql_text[i:end])
+            i = end
+            continue
+        if ch in ("'", '"'):
+            # E'...' aceita escape com barra; nos demais, aspas duplicadas ('' / "").
+            backslash = ch == "'" and i > 0 and sql_text[i - 1] in "eE"
+            j = i + 1
+            while j < n:
+                if backslash and sql_text[j] == "\\":
+                    j += 2
+                    continue
+                if sql_text[j] == ch:
+                    if j + 1 < n and sql_text[j + 1] == ch:
+                        j += 2
+                        continue
+                    break
+                j += 1
+            buf.append(sql_text[i : j + 1])
+            i = j + 1
+            continue
+        if ch == "$":
+            match = _DOLLAR_TAG_RE.match(sql_text, i)
+            if match:
+                tag = match.group(0)
+                end = sql_text.find(tag, match.end())
+                end = n if end == -1 else end + len(tag)
+                buf.append(sql_text[i:end])
+                i = end
+                continue
+        if ch == ";":
+            stmt = "".join(buf).strip()
+            if _has_code(stmt):
+                statements.append(stmt)
+            buf = []
+            i += 1
+            continue
+        buf.append(ch)
+        i += 1
+    stmt = "".join(buf).strip()
+    if _has_code(stmt):
+        statements.append(stmt)
+    return statements
+
+
+def _code(stmt: str) -> str:
+    # Só para classificar o statement (o SQL executado é o original, com comentários).
+    return re.sub(r"--[^\n]*|/\*.*?\*/", "", stmt, flags=re.DOTALL).strip()
+
+
+def _has_code(stmt: str) -> bool:
+    # Bloco só de comentários não é statement.
+    return bool(_code(stmt))
+
+
+def _is_concurrent(stmt: str) -> bool:
+    return bool(re.match(r"(CREATE|DROP|REINDEX)\b.*\bCONCURRENTLY\b", _code(stmt), re.I | re.DOTALL))
+
+
+def connect(conninfo: str = "") -> psycopg.Connection:
+    """Conexão dedicada (fora do pool): o advisory lock é de sessão e o DDL não pode cair no statement_timeout."""
+
+    conninfo = conninfo or settings.DATABASE_URL
+    if not conninfo:
+        raise RuntimeError("DATABASE_URL não configurada.")
+    conn = psycopg.connect(conninfo, autocommit=True, row_factory=dict_row)
+    conn.execute("SET statement_timeout = 0")
+    return conn
+
+
+def _ensure_bookkeeping(conn: psycopg.Connection) -> None:
+    for stmt in split_sql(_BOOKKEEPING_SQL):
+        conn.execute(stmt)
+
+
+def _applied_versions(conn: psycopg.Connection) -> set:
+    rows = conn.execute("SELECT version FROM schema_migrations").fetchall()
+    return {row["version"] for row in rows}
+
+
+def _adopt_alembic_history(conn: psycopg.Connection, versions: List[str]) -> List[str]:
+    """Bancos migrados pelo antigo tree Alembic: marca como aplicadas as versões até alembic_version."""
+
+    exists = conn.execute("SELECT to_regclass('alembic_version') IS NOT NULL AS ok").fetchone()
+    if not exists["ok"]:
+        return []
+    row = conn.execute("SELECT version_num FROM alembic_version LIMIT 1").fetchone()
+    current = ((row or {}).get("version_num") or "").split("_", 1)[0]
+    if not current:
+        return []
+    adopted = [v for v in versions if v <= current]
+    for version in adopted:
+        conn.execute(
+            "INSERT INTO schema_migrations (version) VALUES (%s) ON CONFLICT (version) DO NOTHING",
+            (version,),
+        )
+    logger.info("migrations_alembic_adopted", alembic_version=current, versions=adopted)
+    return adopted
+
+
+def _drop_invalid_index(conn: psycopg.Connection, stmt: str) -> None:
+    match = _CONCURRENT_INDEX_RE.match(_code(stmt))
+    if not match:
+        return
+    name = match.group(1)
+    row = conn.execute(
+        """
+        SELECT NOT i.indisvalid AS invalid
+        FROM pg_index i
+        WHERE i.indexrelid = to_regclass(%s)
+        """,
+        (name,),
+    ).fetchone()
+    if row and row["invalid"]:
+        logger.warning("migrations_invalid_index_dropped", index=name)
+        conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def _on_partitioned_table(conn: psycopg.Connection, stmt: str) -> bool:
+    match = _INDEX_TARGET_RE.search(_code(stmt))
+    if not match:
+        return False
+    row = conn.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)) AS ok",
+        (match.group(1),),
+    ).fetchone()
+    return bool(row["ok"])
+
+
+def _apply_concurrent(conn: psycopg.Connection, stmt: str) -> None:
+    if _CONCURRENT_INDEX_RE.match(_code(stmt)) and _on_partitioned_table(conn, stmt):
+        # Postgres não aceita CONCURRENTLY no pai particionado (services/partitions.py):
+        # cria direto, o que segura escrita em cada partição enquanto o índice é montado.
+        logger.warning("migrations_concurrently_skipped_partitioned", statement=_code(stmt)[:120])
+        conn.execute(re.sub(r"\bCONCURRENTLY\s+", "", stmt, count=1, flags=re.IGNORECASE))
+        return
+    _drop_invalid_index(conn, stmt)
+    conn.execute(stmt)
+
+
+def _apply_file(conn: psycopg.Connection, path: Path, version: str) -> None:
+    statements = split_sql(path.read_text(encoding="utf-8"))
+    start = time.perf_counter()
+    if any(_is_concurrent(stmt) for stmt in statements):
+        # Fora de transação: cada statement faz commit sozinho, então precisam ser idempotentes
+        # (IF [NOT] EXISTS) para o arquivo poder ser reexecutado após uma falha no meio.
+        conn.execute("SET lock_timeout = 0")
+        for stmt in statements:
+            if _is_concurrent(stmt):
+                _apply_concurrent(conn, stmt)
+            else:
+                conn.execute(stmt)
+        conn.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+    else:
+        with conn.transaction():
+            conn.execute(f"SET LOCAL lock_timeout = {int(settings.MIGRATION_LOCK_TIMEOUT_MS)}")
+            for stmt in statements:
+                conn.execute(stmt)
+            conn.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+    logger.info(
+        "migration_applied",
+        version=version,
+        file=path.name,
+        statements=len(statements),
+        duration_ms=int((time.perf_counter() - start) * 1000),
+    )
+
+
+def migration_files() -> List[Path]:
+    if not MIGRATIONS_DIR.exists():
+        raise RuntimeError("Diretório migrations/ não encontrado.")
+    return sorted(MIGRATIONS_DIR.glob("*.sql"))
+
+
+def _wait_advisory_lock(conn: psycopg.Connection, key: int, poll_s: float = 1.0) -> None:
+    # Polling com pg_try_advisory_lock em vez de pg_advisory_lock: uma sessão bloqueada esperando o
+    # lock mantém uma transação aberta, e o CREATE INDEX CONCURRENTLY de quem tem o lock espera por
+    # ela (deadlock entre workers subindo juntos).
+    waited = False
+    while not conn.execute("SELECT pg_try_advisory_lock(%s) AS ok", (key,)).fetchone()["ok"]:
+        if not waited:
+            logger.info("migrations_waiting_lock")
+            waited = True
+        time.sleep(poll_s)
+
+
+def apply_migrations(conn: psycopg.Connection) -> List[str]:
+    """Aplica as migrations pendentes numa conexão autocommit. Devolve as versões aplicadas."""
+
+    _wait_advisory_lock(conn, _MIGRATION_LOCK_KEY)
+    try:
+        _ensure_bookkeeping(conn)
+        files = migration_files()
+        applied = _applied_versions(conn)
+        if not applied:
+            applied.update(_adopt_alembic_history(conn, [p.stem.split("_", 1)[0] for p in files]))
+        done: List[str] = []
+        for path in files:
+            version = path.stem.split("_", 1)[0]
+            if version in applied:
+                continue
+            _apply_file(conn, path, version)
+            done.append(version)
+        return done
+    finally:
+        conn.execute("SELECT pg_advisory_unlock(%s)", (_MIGRATION_LOCK_KEY,))
+
+
+def migrate(conninfo: str = "") -> List[str]:
+    conn = connect(conninfo)
+    try:
+        return apply_migrations(conn)
+    finally:
+        conn.close()
+
+
+def run_backfill(
+    conn: psycopg.Connection,
+    backfill: Backfill,
+    batch_size: Optional[int] = None,
+    sleep_ms: Optional[int] = None,
+    max_batches: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Roda (ou continua) um backfill em lotes por id. Progresso persistido a cada lote."""
+
+    batch_size = batch_size or settings.MIGRATION_BACKFILL_BATCH
+    sleep_ms = settings.MIGRATION_BACKFILL_SLEEP_MS if sleep_ms is None else sleep_ms
+    lock = conn.execute(
+        "SELECT pg_try_advisory_lock(hashtext(%s)) AS ok", ("backfill:" + backfill.name,)
+    ).fetchone()
+    if not lock["ok"]:
+        logger.info("backfill_already_running", name=backfill.name)
+        return {"name": backfill.name, "skipped": "running"}
+    try:
+        _ensure_bookkeeping(conn)
+        if backfill.after and backfill.after not in _applied_versions(conn):
+            raise RuntimeError(f"Backfill {backfill.name} precisa da migration {backfill.after}.")
+        # Linhas inseridas depois do início já nascem no formato novo: o teto é o max(id) de agora.
+        conn.execute(
+            f"""
+            INSERT INTO schema_backfills (name, max_id)
+            SELECT %s, COALESCE(MAX(id), 0) FROM {backfill.table}
+            ON CONFLICT (name) DO NOTHING
+            """,
+            (backfill.name,),
+        )
+        state = conn.execute("SELECT * FROM schema_backfills WHERE name=%s", (backfill.name,)).fetchone()
+        last_id, max_id, total = int(state["last_id"]), int(state["max_id"]), int(state["rows_updated"])
+        batches = 0
+        while not state["done"] and last_id < max_id:
+            if max_batches is not None and batches >= max_batches:
+                break
+            hi = min(last_id + batch_size, max_id)
+            start = time.perf_counter()
+            with conn.transaction():
+                cur = conn.execute(backfill.sql, {"lo": last_id, "hi": hi})
+                rows = max(0, cur.rowcount)
+                conn.execute(
+                    """
+                    UPDATE schema_backfills
+                    SET last_id=%s, rows_updated=rows_updated + %s, done=%s, updated_at=NOW()
+                    WHERE name=%s
+                    """,
+                    (hi, rows, hi >= max_id, backfill.name),
+                )
+            last_id, total, batches = hi, total + rows, batches + 1
+            logger.info(
+                "backfill_progress",
+                name=backfill.name,
+                last_id=last_id,
+                max_id=max_id,
+                rows=rows,
+                rows_total=total,
+                pct=round(100.0 * last_id / max_id, 1) if max_id else 100.0,
+                batch_ms=int((time.perf_counter() - start) * 1000),
+            )
+            if sleep_ms and last_id < max_id:
+                time.sleep(sleep_ms / 1000.0)
+        if last_id >= max_id:
+            conn.execute(
+                "UPDATE schema_backfills SET done=TRUE, updated_at=NOW() WHERE name=%s AND NOT done",
+                (backfill.name,),
+            )
+        return {"name": backfill.name, "last_id": last_id, "max_id": max_id, "rows_updated": total,
+                "done": last_id >= max_id}
+    finally:
+        conn.execute("SELECT pg_advisory_unlock(hashtext(%s))", ("backfill:" + backfill.name,))
+
+
+def status(conn: psycopg.Connection) -> Dict[str, Any]:
+    _ensure_bookkeeping(conn)
+    applied = _applied_versions(conn)
+    versions = [p.stem.split("_", 1)[0] for p in migration_files()]
+    backfills = {
+        row["name"]: {k: row[k] for k in ("last_id", "max_id", "rows_updated", "done")}
+        for row in conn.execute("SELECT * FROM schema_backfills ORDER BY name").fetchall()
+    }
+    for name in BACKFILLS:
+        backfills.setdefault(name, {"last_id": 0, "max_id": None, "rows_updated": 0, "done": False})
+    return {
+        "applied": sorted(v for v in versions if v in applied),
+        "pending": [v for v in versions if v not in applied],
+        "backfills": backfills,
+    }
+
+
+def main(argv: List[str]) -> int:
+    cmd = argv[1] if len(argv) > 1 else "status"
+    conn = connect()
+    try:
+        if cmd == "up":
+            print({"applied": apply_migrations(conn)})
+        elif cmd == "backfill":
+            names = argv[2:] or list(BACKFILLS)
+            unknown = [n for n in names if n not in BACKFILLS]
+            if unknown:
+                print(f"Backfill desconhecido: {', '.join(unknown)}. Registrados: {', '.join(BACKFILLS) or '-'}")
+                return 2
+            for name in names:
+                print(run_backfill(conn, BACKFILLS[name]))
+        elif cmd == "status":
+            print(status(conn))
+        else:
+            print(__doc__)
+            return 2
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv))
@@ -0,0 +1,104 @@
+"""Particionamento opt-in de leads por mês (created_at).
+
+Uso (Render Shell / cron):
+  python -m services.partitions convert    # converte leads (janela de manutenção)
+  python -m services.partitions maintain   # cria partições futuras + BRIN nas antigas
+  python -m services.partitions status
+"""
+
+import sys
+from pathlib import Path
+from typing import Any, Dict
+
+from psycopg.rows import dict_row
+
+from services import settings
+from services.db import db
+
+_CONVERT_SQL = Path(__file__).resolve().parent.parent / "migrations" / "optional" / "partition_leads.sql"
+
+
+def is_leads_partitioned(cur) -> bool:
+    cur.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('leads')) AS partitioned"
+    )
+    return bool((cur.fetchone() or {}).get("partitioned"))
+
+
+def convert_leads_to_partitioned() -> Dict[str, Any]:
+    # Arquivo inteiro num execute só (sem parâmetros): os corpos $$...$$ contêm ';'.
+    sql_text = _CONVERT_SQL.read_text(encoding="utf-8")
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(sql_text)
+    finally:
+        conn.close()
+    return partition_status()
+
+
+def maintain_lead_partitions() -> Dict[str, Any]:
+    """Garante partições dos próximos meses e BRIN nas antigas. No-op se leads não for particionada."""
+
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                if not is_leads_partitioned(cur):
+                    return {"partitioned": False, "created": 0, "brin_created": 0}
+                cur.execute(
+                    "SELECT leads_ensure_partitions(%s) AS created",
+                    (settings.LEADS_PARTITION_MONTHS_AHEAD,),
+                )
+                created = int((cur.fetchone() or {}).get("created") or 0)
+                cur.execute(
+                    "SELECT leads_brin_old_partitions(%s) AS created",
+                    (settings.LEADS_PARTITION_BRIN_AFTER_MONTHS,),
+                )
+                brin_created = int((cur.fetchone() or {}).get("created") or 0)
+        return {"partitioned": True, "created": created, "brin_created": brin_created}
+    finally:
+        conn.close()
+
+
+def partition_status() -> Dict[str, Any]:
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                if not is_leads_partitioned(cur):
+                    return {"partitioned": False, "partitions": []}
+                cur.execute(
+                    """
+                    SELECT c.relname AS name,
+                           pg_get_expr(c.relpartbound, c.oid) AS bounds,
+                           GREATEST(c.reltuples, 0)::bigint AS approx_rows
+                    FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = 'leads'::regclass
+                    ORDER BY c.relname
+                    """
+                )
+                return {"partitioned": True, "partitions": [dict(r) for r in (cur.fetchall() or [])]}
+    finally:
+        conn.close()
+
+
+def main(argv: list[str]) -> int:
+    cmd = (argv[1] if len(argv) > 1 else "status").strip().lower()
+    if cmd == "convert":
+        result = convert_leads_to_partitioned()
+    elif cmd == "maintain":
+        result = maintain_lead_partitions()
+    elif cmd == "status":
+        result = partition_status()
+    else:
+        print("Uso: python -m services.partitions [convert|maintain|status]", file=sys.stderr)
+        return 2
+    print(result)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv))
@@ -0,0 +1,109 @@
+"""PBKDF2 (hash e verificação de senha) num pool de processos limitado, fora da thread do request.
+
+pbkdf2:sha256 com PBKDF2_ITERATIONS custa ~300 ms de CPU por chamada. Rodando no request, uma rajada de
+logins ocupa os cores que o /prever usa. Aqui, cada processo web tem no máximo PASSWORD_POOL_WORKERS
+processos de hash; até PASSWORD_POOL_MAX_PENDING pedidos esperam na fila. Acima disso, PasswordPoolBusy
+na hora (503 com Retry-After, ver app.py/asgi.py) em vez de empilhar logins atrás da ingestão.
+
+PASSWORD_POOL_WORKERS=0 roda no próprio request (dev/testes). O pool sobe no primeiro uso (depois do fork
+do gunicorn) com "spawn": o filho não herda threads nem conexões do processo web.
+"""
+
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from services import settings
+
+
+class PasswordPoolBusy(Exception):
+    """Fila de hash de senha cheia (ou resposta demorou mais que PASSWORD_POOL_TIMEOUT_SECONDS)."""
+
+
+_LOCK = threading.Lock()
+_POOL: Optional[ProcessPoolExecutor] = None
+_IN_FLIGHT = 0
+_REJECTED = 0
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(
+            max_workers=settings.PASSWORD_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _POOL
+
+
+def _done(_: Future) -> None:
+    global _IN_FLIGHT
+    with _LOCK:
+        _IN_FLIGHT -= 1
+
+
+def _submit(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    global _IN_FLIGHT, _REJECTED
+    with _LOCK:
+        if _IN_FLIGHT >= settings.PASSWORD_POOL_WORKERS + settings.PASSWORD_POOL_MAX_PENDING:
+            _REJECTED += 1
+            raise PasswordPoolBusy()
+        _IN_FLIGHT += 1
+        try:
+            future = _pool().submit(fn, *args, **kwargs)
+        except Exception:
+            _IN_FLIGHT -= 1
+            raise
+    future.add_done_callback(_done)
+    return future
+
+
+def _run(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    if settings.PASSWORD_POOL_WORKERS <= 0:
+        return fn(*args, **kwargs)
+    try:
+        return _submit(fn, *args, **kwargs).result(timeout=settings.PASSWORD_POOL_TIMEOUT_SECONDS)
+    except FutureTimeout:
+        raise PasswordPoolBusy() from None
+
+
+async def _run_async(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    if settings.PASSWORD_POOL_WORKERS <= 0:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    try:
+        return await asyncio.wait_for(
+            asyncio.wrap_future(_submit(fn, *args, **kwargs)), settings.PASSWORD_POOL_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        raise PasswordPoolBusy() from None
+
+
+def _method() -> str:
+    return f"pbkdf2:sha256:{settings.PBKDF2_ITERATIONS}"
+
+
+def hash_password(password: str) -> str:
+    return _run(generate_password_hash, password, method=_method())
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_async(generate_password_hash, password, method=_method())
+
+
+def verify_password(stored: str, password: str) -> bool:
+    return bool(_run(check_password_hash, stored, password))
+
+
+def pool_stats() -> Dict[str, int]:
+    with _LOCK:
+        return {
+            "workers": settings.PASSWORD_POOL_WORKERS,
+            "max_pending": settings.PASSWORD_POOL_MAX_PENDING,
+            "in_flight": _IN_FLIGHT,
+            "rejected": _REJECTED,
+        }
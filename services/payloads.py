@@ -0,0 +1,67 @@
+"""Payload bruto do /prever fora da linha quente de `leads`.
+
+O objeto `lead` recebido (até MAX_PREVER_PAYLOAD_BYTES) fica em `lead_payloads`, chaveado pelo id
+do lead, e só é lido quando alguém pede o detalhe (ex.: /lead_explain?include_payload=1).
+Com LEAD_PAYLOAD_COMPRESSION=zlib, payloads acima de LEAD_PAYLOAD_COMPRESS_MIN_BYTES são gravados
+compactados em `payload_z`; os demais ficam em JSONB (o TOAST do Postgres já comprime os grandes).
+
+Leads antigos ainda com `leads.payload` preenchido são migrados pelo backfill `lead_payloads`
+(python -m services.migrations backfill lead_payloads); até lá a leitura cai no valor inline.
+"""
+
+import json
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+from services import settings
+
+ENCODING_JSON = "json"
+ENCODING_ZLIB = "zlib"
+
+INSERT_PAYLOAD_SQL = """
+    INSERT INTO lead_payloads (lead_id, client_id, encoding, payload, payload_z)
+    VALUES (%s, %s, %s, %s::jsonb, %s)
+    ON CONFLICT (lead_id) DO NOTHING
+"""
+
+_SELECT_PAYLOAD_SQL = """
+    SELECT p.encoding, p.payload AS payload_json, p.payload_z, l.payload AS inline_payload
+    FROM leads l
+    LEFT JOIN lead_payloads p ON p.lead_id = l.id
+    WHERE l.client_id=%s AND l.id=%s
+"""
+
+
+def encode_payload(payload: Dict[str, Any]) -> Tuple[str, Optional[str], Optional[bytes]]:
+    """(encoding, json, bytes comprimidos) para as colunas de lead_payloads."""
+
+    raw = json.dumps(payload or {}, ensure_ascii=False)
+    if (
+        settings.LEAD_PAYLOAD_COMPRESSION == ENCODING_ZLIB
+        and len(raw.encode("utf-8")) >= settings.LEAD_PAYLOAD_COMPRESS_MIN_BYTES
+    ):
+        return ENCODING_ZLIB, None, zlib.compress(raw.encode("utf-8"), 6)
+    return ENCODING_JSON, raw, None
+
+
+def decode_payload(row: Dict[str, Any]) -> Dict[str, Any]:
+    if row.get("encoding") == ENCODING_ZLIB and row.get("payload_z") is not None:
+        return json.loads(zlib.decompress(bytes(row["payload_z"])).decode("utf-8"))
+    value = row.get("payload_json")
+    if value is None:
+        value = row.get("inline_payload")
+    if isinstance(value, str):
+        return json.loads(value)
+    return dict(value or {})
+
+
+def store_payload(cur, lead_id: int, client_id: str, payload: Dict[str, Any]) -> None:
+    cur.execute(INSERT_PAYLOAD_SQL, (lead_id, client_id, *encode_payload(payload)))
+
+
+def fetch_payload(cur, client_id: str, lead_id: int) -> Optional[Dict[str, Any]]:
+    """Payload do lead (None se o lead não existir). Cursor com dict_row."""
+
+    cur.execute(_SELECT_PAYLOAD_SQL, (client_id, lead_id))
+    row = cur.fetchone()
+    return None if row is None else decode_payload(row)
@@ -0,0 +1,307 @@
+"""Ranking da "ação do dia" mantido no Redis (ZSET por cliente).
+
+Estrutura por cliente:
+  - acao_rank:{client_id}       ZSET  member="<created_us>:<id>"  score=COALESCE(probabilidade, score/100)
+  - acao_rank_rows:{client_id}  HASH  id -> JSON com o item já formatado para a resposta
+  - acao_rank_meta:{client_id}  HASH  built_at / truncated (marca que a estrutura está completa)
+
+O ZSET guarda no máximo ACAO_RANK_CAPACITY leads. Quando o cliente tem mais leads que isso,
+a estrutura fica "truncated": continua sendo o prefixo correto do ranking, mas qualquer
+mudança que possa trazer um lead de fora para dentro invalida tudo (rebuild no próximo read).
+Sem Redis (ou com erro), quem chama cai no SELECT direto no Postgres.
+"""
+
+from datetime import datetime
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import redis
+from structlog import get_logger
+
+from services import settings
+from services.cache import get_async_redis_client, get_redis_client
+from services.lead_service import ACTION_LIST_LIMIT, action_item, fetch_action_candidates, lead_temperature
+from services.utils import safe_float
+
+logger = get_logger()
+
+# Leads sem probabilidade nem score ficam no fim (equivale a NULLS LAST).
+_NULL_PRIORITY = -1.0
+
+
+def _keys(client_id: str) -> tuple[str, str, str]:
+    return (
+        f"acao_rank:{client_id}",
+        f"acao_rank_rows:{client_id}",
+        f"acao_rank_meta:{client_id}",
+    )
+
+
+def lead_priority(probabilidade: Any, score: Any) -> float:
+    """Espelha COALESCE(probabilidade, score / 100.0) DESC NULLS LAST."""
+
+    prob = safe_float(probabilidade, None)
+    if prob is not None:
+        return prob
+    score_val = safe_float(score, None)
+    if score_val is not None:
+        return score_val / 100.0
+    return _NULL_PRIORITY
+
+
+def rank_member(lead_id: int, created_at: Optional[datetime]) -> str:
+    # Empate no score do ZSET é resolvido pela ordem lexicográfica do member:
+    # com ZREVRANGE, created_at mais recente vem primeiro (created_at DESC).
+    created_us = int(created_at.timestamp() * 1_000_000) if created_at else 0
+    return f"{created_us:017d}:{int(lead_id)}"
+
+
+def _entry(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "m": rank_member(row["id"], row.get("created_at")),
+        "p": safe_float(row.get("probabilidade"), None),
+        "s": row.get("score"),
+        "row": action_item(row),
+    }
+
+
+def _is_built(client: redis.Redis, client_id: str) -> bool:
+    return bool(client.exists(_keys(client_id)[2]))
+
+
+def rank_invalidate(client_id: str) -> None:
+    client = get_redis_client()
+    if not client:
+        return
+    try:
+        client.delete(*_keys(client_id))
+    except redis.RedisError:
+        logger.warning("acao_rank_invalidate_failed", client_id=client_id)
+
+
+def rank_rebuild(client_id: str) -> Optional[List[Dict[str, Any]]]:
+    """Reconstrói o ranking do cliente a partir do Postgres."""
+
+    client = get_redis_client()
+    if not client:
+        return None
+
+    capacity = settings.ACAO_RANK_CAPACITY
+    rows = fetch_action_candidates(client_id, limit=capacity + 1)
+    truncated = len(rows) > capacity
+    rows = rows[:capacity]
+    entries = [_entry(r) for r in rows]
+
+    zkey, hkey, mkey = _keys(client_id)
+    ttl = settings.ACAO_RANK_TTL_SECONDS
+    try:
+        pipe = client.pipeline(transaction=True)
+        pipe.delete(zkey, hkey, mkey)
+        if entries:
+            pipe.zadd(zkey, {e["m"]: lead_priority(e["p"], e["s"]) for e in entries})
+            pipe.hset(hkey, mapping={str(r["id"]): json.dumps(e) for r, e in zip(rows, entries)})
+            pipe.expire(zkey, ttl)
+            pipe.expire(hkey, ttl)
+        pipe.hset(mkey, mapping={"built_at": int(time.time()), "truncated": int(truncated)})
+        pipe.expire(mkey, ttl)
+        pipe.execute()
+    except redis.RedisError:
+        logger.warning("acao_rank_rebuild_failed", client_id=client_id)
+        return None
+    return [e["row"] for e in entries]
+
+
+def rank_top(client_id: str, limit: int = ACTION_LIST_LIMIT) -> Optional[List[Dict[str, Any]]]:
+    """Top-N do ranking, reconstruindo sob demanda. None = use o fallback SQL."""
+
+    client = get_redis_client()
+    if not client:
+        return None
+
+    zkey, hkey, _ = _keys(client_id)
+    try:
+        if not _is_built(client, client_id):
+            rows = rank_rebuild(client_id)
+            return rows[:limit] if rows is not None else None
+
+        members = client.zrevrange(zkey, 0, max(0, int(limit) - 1))
+        ids = [m.split(":", 1)[1] for m in members]
+        raw = client.hmget(hkey, ids) if ids else []
+    except redis.RedisError:
+        logger.warning("acao_rank_read_failed", client_id=client_id)
+        return None
+
+    if any(item is None for item in raw):
+        # Estrutura inconsistente (expirou pela metade, escrita concorrente): refaz.
+        rows = rank_rebuild(client_id)
+        return rows[:limit] if rows is not None else None
+    return [json.loads(item)["row"] for item in raw]
+
+
+def _trim(client: redis.Redis, client_id: str) -> None:
+    zkey, hkey, mkey = _keys(client_id)
+    excess = client.zcard(zkey) - settings.ACAO_RANK_CAPACITY
+    if excess <= 0:
+        return
+    popped = client.zpopmin(zkey, excess)
+    if popped:
+        client.hdel(hkey, *[m.split(":", 1)[1] for m, _ in popped])
+    client.hset(mkey, "truncated", 1)
+
+
+def _ensure_servable(client: redis.Redis, client_id: str) -> None:
+    # Um ranking truncado que encolheu abaixo do que servimos não sabe quem vem depois.
+    zkey, _, mkey = _keys(client_id)
+    truncated = (client.hget(mkey, "truncated") or "0") == "1"
+    if truncated and client.zcard(zkey) < ACTION_LIST_LIMIT:
+        client.delete(*_keys(client_id))
+
+
+def rank_add_lead(client_id: str, row: Dict[str, Any]) -> None:
+    """Lead recém-inserido. Só atualiza estruturas já construídas."""
+
+    client = get_redis_client()
+    if not client:
+        return
+    zkey, hkey, _ = _keys(client_id)
+    try:
+        if not _is_built(client, client_id):
+            return
+        entry = _entry(row)
+        ttl = settings.ACAO_RANK_TTL_SECONDS
+        pipe = client.pipeline(transaction=True)
+        pipe.zadd(zkey, {entry["m"]: lead_priority(entry["p"], entry["s"])})
+        pipe.hset(hkey, str(row["id"]), json.dumps(entry))
+        pipe.expire(zkey, ttl)
+        pipe.expire(hkey, ttl)
+        pipe.execute()
+        _trim(client, client_id)
+    except redis.RedisError:
+        logger.warning("acao_rank_add_failed", client_id=client_id)
+        rank_invalidate(client_id)
+
+
+async def rank_add_lead_async(client_id: str, row: Dict[str, Any]) -> None:
+    """rank_add_lead com redis.asyncio (modo ASGI)."""
+
+    client = get_async_redis_client()
+    if not client:
+        return
+    zkey, hkey, mkey = _keys(client_id)
+    try:
+        if not await client.exists(mkey):
+            return
+        entry = _entry(row)
+        ttl = settings.ACAO_RANK_TTL_SECONDS
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.zadd(zkey, {entry["m"]: lead_priority(entry["p"], entry["s"])})
+            pipe.hset(hkey, str(row["id"]), json.dumps(entry))
+            pipe.expire(zkey, ttl)
+            pipe.expire(hkey, ttl)
+            await pipe.execute()
+        excess = await client.zcard(zkey) - settings.ACAO_RANK_CAPACITY
+        if excess > 0:
+            popped = await client.zpopmin(zkey, excess)
+            if popped:
+                await client.hdel(hkey, *[m.split(":", 1)[1] for m, _ in popped])
+            await client.hset(mkey, "truncated", 1)
+    except redis.RedisError:
+        logger.warning("acao_rank_add_failed", client_id=client_id)
+        try:
+            await client.delete(*_keys(client_id))
+        except redis.RedisError:
+            logger.warning("acao_rank_invalidate_failed", client_id=client_id)
+
+
+def rank_update_probabilities(client_id: str, ids: List[int], probs: List[float]) -> None:
+    """Aplica um rescore em lote mantendo o ranking como prefixo correto do SQL."""
+
+    client = get_redis_client()
+    if not client or not ids:
+        return
+    zkey, hkey, mkey = _keys(client_id)
+    try:
+        if not _is_built(client, client_id):
+            return
+        truncated = (client.hget(mkey, "truncated") or "0") == "1"
+        tail = client.zrange(zkey, 0, 0, withscores=True)
+        old_min = tail[0][1] if tail else _NULL_PRIORITY
+
+        raw = client.hmget(hkey, [str(i) for i in ids])
+        zadds: Dict[str, float] = {}
+        hsets: Dict[str, str] = {}
+        drops: List[tuple[str, str]] = []
+        for lead_id, prob, item in zip(ids, probs, raw):
+            new_score = float(prob)
+            if item is None:
+                # Lead fora do ranking: se pode entrar (ou se a estrutura deveria conhecê-lo), refaz tudo.
+                if not truncated or new_score >= old_min:
+                    client.delete(*_keys(client_id))
+                    return
+                continue
+            entry = json.loads(item)
+            if truncated and new_score < old_min:
+                # Caiu abaixo da cauda conhecida: pode haver leads de fora à frente dele.
+                drops.append((entry["m"], str(lead_id)))
+                continue
+            entry["p"] = new_score
+            entry["row"]["probabilidade"] = new_score
+            entry["row"]["temperatura"] = lead_temperature(new_score, entry.get("s"))
+            zadds[entry["m"]] = new_score
+            hsets[str(lead_id)] = json.dumps(entry)
+
+        pipe = client.pipeline(transaction=True)
+        if zadds:
+            pipe.zadd(zkey, zadds)
+            pipe.hset(hkey, mapping=hsets)
+        if drops:
+            pipe.zrem(zkey, *[m for m, _ in drops])
+            pipe.hdel(hkey, *[i for _, i in drops])
+        pipe.execute()
+        if drops:
+            _ensure_servable(client, client_id)
+    except redis.RedisError:
+        logger.warning("acao_rank_rescore_failed", client_id=client_id)
+        rank_invalidate(client_id)
+
+
+def rank_set_label(client_id: str, lead_id: int, virou_cliente: Optional[float]) -> None:
+    """Rótulo não muda a ordem, só o conteúdo exibido."""
+
+    client = get_redis_client()
+    if not client:
+        return
+    _, hkey, _ = _keys(client_id)
+    try:
+        item = client.hget(hkey, str(lead_id))
+        if item is None:
+            return
+        entry = json.loads(item)
+        entry["row"]["virou_cliente"] = virou_cliente
+        client.hset(hkey, str(lead_id), json.dumps(entry))
+    except redis.RedisError:
+        logger.warning("acao_rank_label_failed", client_id=client_id)
+        rank_invalidate(client_id)
+
+
+def rank_remove(client_id: str, lead_id: int) -> None:
+    """Lead removido (soft delete/arquivamento)."""
+
+    client = get_redis_client()
+    if not client:
+        return
+    zkey, hkey, _ = _keys(client_id)
+    try:
+        item = client.hget(hkey, str(lead_id))
+        if item is None:
+            return
+        entry = json.loads(item)
+        pipe = client.pipeline(transaction=True)
+        pipe.zrem(zkey, entry["m"])
+        pipe.hdel(hkey, str(lead_id))
+        pipe.execute()
+        _ensure_servable(client, client_id)
+    except redis.RedisError:
+        logger.warning("acao_rank_remove_failed", client_id=client_id)
+        rank_invalidate(client_id)
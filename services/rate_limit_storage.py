@@ -0,0 +1,161 @@
+"""Storage do Flask-Limiter com contagem local por processo e sincronização em lote com o Redis.
+
+Com RATELIMIT_STORAGE_URI no Redis, cada request fazia ao menos um round trip por limite. Com
+RATELIMIT_LOCAL_BATCH (esquema batched+redis://), cada processo conta as hits de cada chave em memória e soma
+no Redis a cada RATELIMIT_SYNC_HITS hits ou RATELIMIT_SYNC_MS, o que vier primeiro. O INCR devolve o total
+global, que vira a base local até o próximo sync: ~1 round trip a cada RATELIMIT_SYNC_HITS hits.
+
+Admissão a mais é limitada: cada processo guarda no máximo RATELIMIT_SYNC_HITS - 1 hits que os outros ainda
+não viram. Faltando menos de um lote para o limite, toda hit vai ao Redis, então nenhuma recusa sai de contagem
+local. Pior caso por janela: (processos - 1) x (RATELIMIT_SYNC_HITS - 1) acima do limite. Escopos em
+RATELIMIT_STRICT_SCOPES (padrão: endpoints do blueprint auth, onde o limite segura força bruta) vão sempre
+direto ao Redis.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple, Type, Union
+
+from limits.storage import Storage, storage_from_string
+
+from services import settings
+
+_BUCKETS_MAX = 50_000
+
+
+class _Bucket:
+    __slots__ = ("expires_at", "synced_at", "base", "pending")
+
+    def __init__(self, expires_at: float, synced_at: float, base: int) -> None:
+        self.expires_at = expires_at
+        self.synced_at = synced_at
+        self.base = base
+        self.pending = 0
+
+
+def _parse_key(key: str) -> Tuple[str, Optional[int]]:
+    # Chave do limits: LIMITER/<key_func>/<escopo>/<quantidade>/<múltiplo>/<granularidade>.
+    parts = key.rsplit("/", 4)
+    if len(parts) < 5:
+        return "", None
+    try:
+        return parts[1], int(parts[2])
+    except ValueError:
+        return parts[1], None
+
+
+def batched_uri(uri: str) -> str:
+    """URI do limiter com o modo em lote aplicado (só para Redis; memory:// já é local)."""
+
+    if settings.RATELIMIT_LOCAL_BATCH and uri.split("://", 1)[0] in ("redis", "rediss"):
+        return f"batched+{uri}"
+    return uri
+
+
+class BatchedStorage(Storage):
+    STORAGE_SCHEME = ["batched+redis", "batched+rediss", "batched+memory"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options: Any) -> None:
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.inner = storage_from_string(uri.split("+", 1)[1], wrap_exceptions=wrap_exceptions, **options)
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, _Bucket] = {}
+        self._hits = 0
+        self._syncs = 0
+
+    @property
+    def base_exceptions(self) -> Union[Type[Exception], Tuple[Type[Exception], ...]]:
+        return self.inner.base_exceptions
+
+    def _live(self, key: str, now: float) -> Optional[_Bucket]:
+        bucket = self._buckets.get(key)
+        if bucket is not None and bucket.expires_at <= now:
+            del self._buckets[key]
+            return None
+        return bucket
+
+    def _prune(self, now: float) -> None:
+        for key in [k for k, b in self._buckets.items() if b.expires_at <= now]:
+            del self._buckets[key]
+        if len(self._buckets) >= _BUCKETS_MAX:
+            self._buckets.clear()
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        scope, limit = _parse_key(key)
+        strict = limit is None or any(scope.startswith(p) for p in settings.RATELIMIT_STRICT_SCOPES)
+        now = time.monotonic()
+        with self._lock:
+            self._hits += 1
+            bucket = None if strict else self._live(key, now)
+            if bucket is not None:
+                local = bucket.base + bucket.pending + amount
+                if (
+                    bucket.pending + amount < settings.RATELIMIT_SYNC_HITS
+                    and now - bucket.synced_at < settings.RATELIMIT_SYNC_MS / 1000
+                    and local + settings.RATELIMIT_SYNC_HITS <= limit
+                ):
+                    bucket.pending += amount
+                    return local
+                push = bucket.pending + amount
+                bucket.pending = 0
+            else:
+                push = amount
+            self._syncs += 1
+
+        try:
+            total = self.inner.incr(key, expiry, push)
+        except Exception:
+            if bucket is not None:
+                with self._lock:
+                    bucket.pending += push - amount
+            raise
+
+        if not strict:
+            with self._lock:
+                current = self._live(key, now)
+                if current is None:
+                    if len(self._buckets) >= _BUCKETS_MAX:
+                        self._prune(now)
+                    # Janela local a partir do 1º sync: se o Redis virar antes, o próximo sync corrige a base.
+                    self._buckets[key] = _Bucket(now + expiry, now, total)
+                else:
+                    if total < current.base:
+                        # Janela virou no Redis antes da local.
+                        current.expires_at = now + expiry
+                    current.base = total
+                    current.synced_at = now
+        return total
+
+    def get(self, key: str) -> int:
+        with self._lock:
+            bucket = self._live(key, time.monotonic())
+            if bucket is not None:
+                return bucket.base + bucket.pending
+        return self.inner.get(key)
+
+    def get_expiry(self, key: str) -> float:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._live(key, now)
+            if bucket is not None:
+                return time.time() + (bucket.expires_at - now)
+        return self.inner.get_expiry(key)
+
+    def check(self) -> bool:
+        return self.inner.check()
+
+    def reset(self) -> Optional[int]:
+        with self._lock:
+            self._buckets.clear()
+        return self.inner.reset()
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            self._buckets.pop(key, None)
+        self.inner.clear(key)
+
+    def stats(self) -> Dict[str, int]:
+        """Hits vistas e round trips ao storage de trás (Redis) neste processo."""
+
+        with self._lock:
+            return {"hits": self._hits, "syncs": self._syncs, "keys": len(self._buckets)}
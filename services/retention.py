@@ -0,0 +1,325 @@
+"""Retenção por plano: tira de `leads` o que não é mais dado ativo.
+
+- Soft-deleted há mais de RETENTION_DELETED_GRACE_DAYS dias.
+- Leads mais antigos que o horizonte do plano (PLAN_CATALOG[plan]["retention_days"],
+  sobrescrito por RETENTION_DAYS_JSON; None = sem horizonte).
+
+Destino (RETENTION_SINK): tabela `leads_archive` (padrão) ou arquivos Parquet compactados em
+RETENTION_PARQUET_DIR (precisa de pyarrow). Cada lote é uma transação; rodar de novo continua
+de onde parou. O que saiu por horizonte continua disponível no export (include_archived=1).
+
+Uso (cron diário, fora do pico):
+  python -m services.retention run [client_id]
+  python -m services.retention status
+"""
+
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from psycopg.rows import dict_row
+from structlog import get_logger
+
+from services import settings
+from services.cache import cache_delete_prefix
+from services.db import READ_ONLY, db
+from services.payloads import decode_payload
+from services.ranking import rank_invalidate
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:  # pragma: no cover - pyarrow é opcional (só para RETENTION_SINK=parquet)
+    pa = None
+    pq = None
+
+logger = get_logger()
+
+REASON_DELETED = "deleted"
+REASON_RETENTION = "retention"
+
+ARCHIVE_COLUMNS = [
+    "id",
+    "client_id",
+    "nome",
+    "email_lead",
+    "telefone",
+    "origem",
+    "tempo_site",
+    "paginas_visitadas",
+    "clicou_preco",
+    "probabilidade",
+    "virou_cliente",
+    "payload",
+    "score",
+    "label",
+    "created_at",
+    "updated_at",
+    "deleted_at",
+]
+_COLS = ", ".join(ARCHIVE_COLUMNS)
+
+_DELETED_BATCH_SQL = """
+    SELECT id FROM leads
+    WHERE deleted_at IS NOT NULL AND deleted_at < NOW() - make_interval(days => %(grace)s::int)
+    ORDER BY deleted_at
+    LIMIT %(limit)s
+    FOR UPDATE SKIP LOCKED
+"""
+
+# Só ativos: soft-deleted saem pelo lote de deletados, com archive_reason='deleted' (o change feed emite
+# tombstone só para esses).
+_STALE_BATCH_SQL = """
+    SELECT id FROM leads
+    WHERE client_id = %(client_id)s AND deleted_at IS NULL
+      AND created_at < NOW() - make_interval(days => %(days)s::int)
+    ORDER BY created_at
+    LIMIT %(limit)s
+    FOR UPDATE SKIP LOCKED
+"""
+
+# Seleção + DELETE + INSERT num statement só: o lote nunca fica nas duas tabelas nem em nenhuma.
+# O payload bruto sai de lead_payloads no mesmo statement (JSON em payload, zlib em payload_z); leads
+# anteriores ao backfill ainda têm o payload inline.
+_MOVE_TO_TABLE_SQL = f"""
+    WITH batch AS ({{batch}}),
+    moved AS (
+        DELETE FROM leads l USING batch b WHERE l.id = b.id
+        RETURNING {", ".join("l." + c for c in ARCHIVE_COLUMNS)}
+    ),
+    payloads AS (
+        DELETE FROM lead_payloads p USING moved m WHERE p.lead_id = m.id
+        RETURNING p.lead_id, p.encoding, p.payload, p.payload_z
+    )
+    INSERT INTO leads_archive ({_COLS}, payload_encoding, payload_z, archived_at, archive_reason)
+    SELECT {", ".join("COALESCE(p.payload, m.payload)" if c == "payload" else "m." + c for c in ARCHIVE_COLUMNS)},
+           COALESCE(p.encoding, 'json'), p.payload_z, NOW(), %(reason)s
+    FROM moved m LEFT JOIN payloads p ON p.lead_id = m.id
+    ON CONFLICT (id) DO NOTHING
+"""
+
+# Parquet: o payload vai decodificado na linha do arquivo.
+_PARQUET_BATCH_SQL = f"""
+    SELECT {", ".join("l." + c for c in ARCHIVE_COLUMNS)},
+           p.encoding, p.payload AS payload_json, p.payload_z, l.payload AS inline_payload
+    FROM leads l LEFT JOIN lead_payloads p ON p.lead_id = l.id
+    WHERE l.id IN ({{batch}})
+"""
+
+
+def retention_days(plan: str) -> Optional[int]:
+    """Horizonte do plano em dias. Plano desconhecido não tem horizonte (nada é arquivado por idade)."""
+
+    plan = (plan or "").strip().lower()
+    if settings.RETENTION_DAYS_JSON:
+        try:
+            overrides = json.loads(settings.RETENTION_DAYS_JSON)
+            if plan in overrides:
+                days = overrides[plan]
+                return None if days is None else max(1, int(days))
+        except Exception:
+            logger.warning("retention_days_json_invalid")
+    meta = settings.PLAN_CATALOG.get(plan)
+    if not meta or meta.get("retention_days") is None:
+        return None
+    return max(1, int(meta["retention_days"]))
+
+
+def _sink() -> str:
+    sink = settings.RETENTION_SINK
+    if sink == "parquet" and pq is None:
+        raise RuntimeError("RETENTION_SINK=parquet precisa de pyarrow (pip install pyarrow).")
+    return "parquet" if sink == "parquet" else "table"
+
+
+def _client_dir(client_id: str) -> Path:
+    safe = re.sub(r"[^\w.-]", "_", client_id)[:120] or "_"
+    return Path(settings.RETENTION_PARQUET_DIR) / f"client_id={safe}"
+
+
+def _write_parquet(rows: List[Dict[str, Any]], reason: str) -> int:
+    """Grava o lote em Parquet (zstd), um arquivo por cliente. Escrita atômica (tmp + rename)."""
+
+    by_client: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        row = dict(row)
+        row["payload"] = json.dumps(row.get("payload") or {}, ensure_ascii=False)
+        by_client.setdefault(row["client_id"], []).append(row)
+    for client_id, items in by_client.items():
+        folder = _client_dir(client_id)
+        folder.mkdir(parents=True, exist_ok=True)
+        ids = [r["id"] for r in items]
+        path = folder / f"{reason}_{min(ids)}_{max(ids)}.parquet"
+        tmp = path.with_suffix(".parquet.tmp")
+        pq.write_table(pa.Table.from_pylist(items), tmp, compression="zstd")
+        os.replace(tmp, path)
+    return len(rows)
+
+
+def _move_batch(batch_sql: str, params: Dict[str, Any], reason: str, sink: str) -> int:
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                if sink == "table":
+                    cur.execute(_MOVE_TO_TABLE_SQL.format(batch=batch_sql), {**params, "reason": reason})
+                    return max(0, cur.rowcount)
+                cur.execute(_PARQUET_BATCH_SQL.format(batch=batch_sql), params)
+                rows = [
+                    {**{c: r[c] for c in ARCHIVE_COLUMNS}, "payload": decode_payload(r)} for r in cur.fetchall() or []
+                ]
+                if not rows:
+                    return 0
+                # Arquivo gravado antes do DELETE: se o commit falhar, o lote volta a ser
+                # arquivado na próxima rodada (o leitor deduplica por id).
+                _write_parquet(rows, reason)
+                ids = [r["id"] for r in rows]
+                cur.execute("DELETE FROM leads WHERE id = ANY(%s)", (ids,))
+                cur.execute("DELETE FROM lead_payloads WHERE lead_id = ANY(%s)", (ids,))
+                return len(rows)
+    finally:
+        conn.close()
+
+
+def _drain(batch_sql: str, params: Dict[str, Any], reason: str, sink: str, **log_fields) -> int:
+    total = 0
+    while True:
+        start = time.perf_counter()
+        moved = _move_batch(batch_sql, {**params, "limit": settings.RETENTION_BATCH}, reason, sink)
+        total += moved
+        if moved:
+            logger.info(
+                "retention_batch",
+                reason=reason,
+                sink=sink,
+                rows=moved,
+                rows_total=total,
+                batch_ms=int((time.perf_counter() - start) * 1000),
+                **log_fields,
+            )
+        if moved < settings.RETENTION_BATCH:
+            return total
+        if settings.RETENTION_SLEEP_MS:
+            time.sleep(settings.RETENTION_SLEEP_MS / 1000.0)
+
+
+def run_retention(client_id: str = "") -> Dict[str, Any]:
+    sink = _sink()
+    result: Dict[str, Any] = {"sink": sink, "deleted": 0, "retention": {}}
+
+    if not client_id:
+        result["deleted"] = _drain(
+            _DELETED_BATCH_SQL, {"grace": settings.RETENTION_DELETED_GRACE_DAYS}, REASON_DELETED, sink
+        )
+
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                if client_id:
+                    cur.execute("SELECT client_id, plan FROM clients WHERE client_id=%s", (client_id,))
+                else:
+                    cur.execute("SELECT client_id, plan FROM clients ORDER BY client_id")
+                clients = cur.fetchall() or []
+    finally:
+        conn.close()
+
+    for row in clients:
+        days = retention_days(row.get("plan") or "")
+        if days is None:
+            continue
+        cid = row["client_id"]
+        moved = _drain(
+            _STALE_BATCH_SQL, {"client_id": cid, "days": days}, REASON_RETENTION, sink, client_id=cid, days=days
+        )
+        if moved:
+            result["retention"][cid] = moved
+            rank_invalidate(cid)
+            cache_delete_prefix(f"insights:{cid}:")
+    logger.info("retention_done", sink=sink, deleted=result["deleted"], clients=len(result["retention"]))
+    return result
+
+
+def archived_leads(client_id: str) -> Iterator[Dict[str, Any]]:
+    """Leads que saíram por horizonte (não os deletados), mais recentes primeiro."""
+
+    conn = db(READ_ONLY, client_id)
+    try:
+        with conn:
+            with conn.cursor(name="archived_leads_export", row_factory=dict_row) as cur:
+                cur.itersize = 1000
+                cur.execute(
+                    f"""
+                    SELECT {_COLS} FROM leads_archive
+                    WHERE client_id=%s AND deleted_at IS NULL
+                    ORDER BY created_at DESC
+                    """,
+                    (client_id,),
+                )
+                yield from cur
+    finally:
+        conn.close()
+    yield from archived_parquet_leads(client_id)
+
+
+def archived_parquet_leads(client_id: str) -> Iterator[Dict[str, Any]]:
+    """Parte de archived_leads gravada em Parquet (RETENTION_SINK=parquet)."""
+
+    folder = _client_dir(client_id)
+    if not folder.exists():
+        return
+    if pq is None:
+        logger.warning("retention_parquet_unreadable", client_id=client_id, reason="pyarrow ausente")
+        return
+    seen = set()
+    files = sorted(folder.glob(f"{REASON_RETENTION}_*.parquet"), key=lambda p: int(p.stem.split("_")[1]), reverse=True)
+    for path in files:
+        rows = [r for r in pq.read_table(path).to_pylist() if r.get("deleted_at") is None and r["id"] not in seen]
+        rows.sort(key=lambda r: r["created_at"], reverse=True)
+        for row in rows:
+            seen.add(row["id"])
+            yield row
+
+
+def retention_status() -> Dict[str, Any]:
+    conn = db(READ_ONLY)
+    try:
+        with conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(
+                    "SELECT archive_reason, COUNT(*) AS n FROM leads_archive GROUP BY archive_reason ORDER BY 1"
+                )
+                archived = {r["archive_reason"]: int(r["n"]) for r in cur.fetchall() or []}
+                cur.execute("SELECT COUNT(*) AS n FROM leads WHERE deleted_at IS NOT NULL")
+                pending_deleted = int((cur.fetchone() or {}).get("n") or 0)
+    finally:
+        conn.close()
+    root = Path(settings.RETENTION_PARQUET_DIR)
+    files = list(root.glob("client_id=*/*.parquet")) if root.exists() else []
+    return {
+        "sink": settings.RETENTION_SINK,
+        "archived_rows": archived,
+        "soft_deleted_in_hot_table": pending_deleted,
+        "parquet_files": len(files),
+        "parquet_bytes": sum(p.stat().st_size for p in files),
+    }
+
+
+def main(argv: List[str]) -> int:
+    cmd = argv[1] if len(argv) > 1 else "status"
+    if cmd == "run":
+        print(run_retention(argv[2] if len(argv) > 2 else ""))
+    elif cmd == "status":
+        print(retention_status())
+    else:
+        print(__doc__)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv))
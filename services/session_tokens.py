@@ -0,0 +1,173 @@
+"""Access tokens curtos, assinados com HMAC, para o dashboard (emitidos por /login e /token).
+
+Formato: at1.<claims em base64url>.<HMAC-SHA256(SESSION_TOKEN_SECRET) em base64url>. Os claims trazem
+client_id, plano, status, epoch de revogação e expiração, então a verificação é só em memória: assinatura,
+validade e o epoch do cliente, que fica em cache no worker por SESSION_EPOCH_CACHE_SECONDS (uma query
+por cliente por janela, não por request).
+
+Revogar = somar 1 em clients.token_epoch (migration 017): /tokens/revoke, /set_plan e mudança de status no
+billing. Tokens antigos param de valer em até SESSION_EPOCH_CACHE_SECONDS; o dashboard pega outro em /token.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from psycopg.rows import tuple_row
+
+from services import settings
+from services.db import db
+
+TOKEN_PREFIX = "at1."
+
+EPOCH_SQL = "SELECT token_epoch FROM clients WHERE client_id = %s"
+BUMP_EPOCH_SQL = "UPDATE clients SET token_epoch = token_epoch + 1, updated_at = NOW() WHERE client_id = %s"
+
+_EPOCH_CACHE_MAX = 50_000
+_LOCK = threading.Lock()
+# client_id -> (expira em, epoch ou None se o cliente não existe)
+_EPOCHS: Dict[str, Tuple[float, Optional[int]]] = {}
+
+
+def enabled() -> bool:
+    return bool(settings.SESSION_TOKEN_SECRET)
+
+
+def is_token(value: str) -> bool:
+    return value.startswith(TOKEN_PREFIX)
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(signed_part: str) -> str:
+    digest = hmac.new(settings.SESSION_TOKEN_SECRET.encode("utf-8"), signed_part.encode("ascii"), hashlib.sha256)
+    return _b64(digest.digest())
+
+
+def issue_token(client_id: str, plan: str, status: str, epoch: int) -> Tuple[str, int]:
+    """(token, validade em segundos)."""
+
+    ttl = settings.SESSION_TOKEN_TTL_SECONDS
+    claims = {"c": client_id, "p": plan, "s": status, "e": int(epoch), "x": int(time.time()) + ttl}
+    body = TOKEN_PREFIX + _b64(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{body}.{_sign(body)}", ttl
+
+
+def decode_token(token: str, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """Claims de um token com assinatura válida e não expirado (sem checar o epoch), ou None."""
+
+    if not enabled() or not is_token(token):
+        return None
+    body, _, sig = token.rpartition(".")
+    if not body or not hmac.compare_digest(sig.encode("ascii", "replace"), _sign(body).encode("ascii")):
+        return None
+    try:
+        claims = json.loads(_unb64(body[len(TOKEN_PREFIX):]))
+        expires = int(claims["x"])
+    except Exception:
+        return None
+    if expires <= (time.time() if now is None else now):
+        return None
+    return claims
+
+
+def _profile(claims: Dict[str, Any]) -> Dict[str, Any]:
+    # Uso do mês não vai no token: quem precisa lê com a linha travada (ou client_usage, para exibir).
+    return {
+        "client_id": claims["c"],
+        "plan": claims.get("p") or "trial",
+        "status": claims.get("s") or "active",
+        "usage_month": None,
+        "leads_used_month": None,
+    }
+
+
+def _cached_epoch(client_id: str) -> Tuple[bool, Optional[int]]:
+    with _LOCK:
+        hit = _EPOCHS.get(client_id)
+        if hit is None or hit[0] < time.monotonic():
+            return False, None
+        return True, hit[1]
+
+
+def _store_epoch(client_id: str, epoch: Optional[int]) -> None:
+    with _LOCK:
+        if len(_EPOCHS) >= _EPOCH_CACHE_MAX:
+            _EPOCHS.clear()
+        _EPOCHS[client_id] = (time.monotonic() + settings.SESSION_EPOCH_CACHE_SECONDS, epoch)
+
+
+def token_epoch(client_id: str) -> Optional[int]:
+    hit, epoch = _cached_epoch(client_id)
+    if hit:
+        return epoch
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor(row_factory=tuple_row) as cur:
+                cur.execute(EPOCH_SQL, (client_id,))
+                row = cur.fetchone()
+    finally:
+        conn.close()
+    epoch = int(row[0]) if row else None
+    _store_epoch(client_id, epoch)
+    return epoch
+
+
+async def token_epoch_async(client_id: str) -> Optional[int]:
+    from services.async_db import adb
+
+    hit, epoch = _cached_epoch(client_id)
+    if hit:
+        return epoch
+    async with adb() as conn:
+        async with conn.cursor(row_factory=tuple_row) as cur:
+            await cur.execute(EPOCH_SQL, (client_id,))
+            row = await cur.fetchone()
+    epoch = int(row[0]) if row else None
+    _store_epoch(client_id, epoch)
+    return epoch
+
+
+def verify_token(token: str) -> Optional[Dict[str, Any]]:
+    """Perfil do cliente (client_id, plan, status) se o token vale, ou None."""
+
+    claims = decode_token(token)
+    if claims is None or token_epoch(claims["c"]) != claims.get("e"):
+        return None
+    return _profile(claims)
+
+
+async def verify_token_async(token: str) -> Optional[Dict[str, Any]]:
+    claims = decode_token(token)
+    if claims is None or await token_epoch_async(claims["c"]) != claims.get("e"):
+        return None
+    return _profile(claims)
+
+
+def forget_epoch(client_id: str) -> None:
+    """Depois de somar no token_epoch: este worker para de aceitar os tokens antigos na hora."""
+
+    with _LOCK:
+        _EPOCHS.pop(client_id, None)
+
+
+def revoke_tokens(client_id: str) -> None:
+    conn = db()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(BUMP_EPOCH_SQL, (client_id,))
+    finally:
+        conn.close()
+    forget_epoch(client_id)
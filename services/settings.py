@@ -8,6 +8,9 @@ load_dotenv()
 config = get_config()
 
 DATABASE_URL = config.DATABASE_URL
+DATABASE_REPLICA_URL = config.DATABASE_REPLICA_URL
+# LISTEN do /leads_stream (services/live.py). Precisa de conexão de sessão (não PgBouncer transaction mode).
+DATABASE_LISTEN_URL = os.getenv("DATABASE_LISTEN_URL", "").strip() or DATABASE_URL
 DEMO_KEY = config.DEMO_KEY
 ADMIN_KEY = os.getenv("ADMIN_KEY", "").strip()
 DEBUG_MODE = config.DEBUG_MODE
@@ -62,13 +65,14 @@ if not ALLOWED_ORIGINS and DEBUG_MODE:
         "http://127.0.0.1",
     ]
 
+# retention_days: horizonte da retenção (services/retention.py). None = guarda tudo na tabela quente.
 PLAN_CATALOG = {
-    "demo": {"price_brl_month": 0, "setup_fee_brl": 0, "lead_limit_month": 30},
-    "trial": {"price_brl_month": 0, "setup_fee_brl": 0, "lead_limit_month": 100},
-    "starter": {"price_brl_month": 79, "setup_fee_brl": 0, "lead_limit_month": 1000},
-    "pro": {"price_brl_month": 179, "setup_fee_brl": 0, "lead_limit_month": 5000},
-    "enterprise": {"price_brl_month": 279, "setup_fee_brl": 0, "lead_limit_month": 20000},
-    "vip": {"price_brl_month": 279, "setup_fee_brl": 0, "lead_limit_month": 20000},
+    "demo": {"price_brl_month": 0, "setup_fee_brl": 0, "lead_limit_month": 30, "retention_days": 30},
+    "trial": {"price_brl_month": 0, "setup_fee_brl": 0, "lead_limit_month": 100, "retention_days": 90},
+    "starter": {"price_brl_month": 79, "setup_fee_brl": 0, "lead_limit_month": 1000, "retention_days": 365},
+    "pro": {"price_brl_month": 179, "setup_fee_brl": 0, "lead_limit_month": 5000, "retention_days": 730},
+    "enterprise": {"price_brl_month": 279, "setup_fee_brl": 0, "lead_limit_month": 20000, "retention_days": None},
+    "vip": {"price_brl_month": 279, "setup_fee_brl": 0, "lead_limit_month": 20000, "retention_days": None},
 }
 
 MAX_PREVER_PAYLOAD_BYTES = int(os.getenv("MAX_PREVER_PAYLOAD_BYTES", "51200"))
@@ -81,8 +85,121 @@ SENTRY_TRACES_SAMPLE_RATE = float(os.getenv("SENTRY_TRACES_SAMPLE_RATE", "0.0"))
 
 REDIS_URL = os.getenv("REDIS_URL", "").strip()
 RATELIMIT_STORAGE_URI = os.getenv("RATELIMIT_STORAGE_URI", REDIS_URL).strip()
+# Contagem local com sync em lote no Redis (services/rate_limit_storage.py). Escopos "strict" vão sempre ao Redis.
+RATELIMIT_LOCAL_BATCH = _bool(os.getenv("RATELIMIT_LOCAL_BATCH", "true"))
+RATELIMIT_SYNC_HITS = max(1, _int(os.getenv("RATELIMIT_SYNC_HITS", "10"), 10))
+RATELIMIT_SYNC_MS = max(0, _int(os.getenv("RATELIMIT_SYNC_MS", "1000"), 1000))
+RATELIMIT_STRICT_SCOPES = _split_csv(os.getenv("RATELIMIT_STRICT_SCOPES", "auth."))
 CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "60"))
 
+# Ranking da "ação do dia" (ZSET no Redis): quantos leads manter por cliente e por quanto tempo.
+ACAO_RANK_CAPACITY = max(30, _int(os.getenv("ACAO_RANK_CAPACITY", "200"), 200))
+ACAO_RANK_TTL_SECONDS = max(60, _int(os.getenv("ACAO_RANK_TTL_SECONDS", "3600"), 3600))
+
+# Particionamento opt-in de leads (ver migrations/optional/partition_leads.sql).
+LEADS_PARTITION_MONTHS_AHEAD = max(1, _int(os.getenv("LEADS_PARTITION_MONTHS_AHEAD", "3"), 3))
+LEADS_PARTITION_BRIN_AFTER_MONTHS = max(1, _int(os.getenv("LEADS_PARTITION_BRIN_AFTER_MONTHS", "3"), 3))
+
+# Migrations (python -m services.migrations): lock_timeout do DDL e ritmo dos backfills em lotes.
+MIGRATION_LOCK_TIMEOUT_MS = max(0, _int(os.getenv("MIGRATION_LOCK_TIMEOUT_MS", "5000"), 5000))
+MIGRATION_BACKFILL_BATCH = max(100, _int(os.getenv("MIGRATION_BACKFILL_BATCH", "5000"), 5000))
+MIGRATION_BACKFILL_SLEEP_MS = max(0, _int(os.getenv("MIGRATION_BACKFILL_SLEEP_MS", "100"), 100))
+
+# Payload bruto do /prever em lead_payloads (services/payloads.py): "" (JSONB) ou "zlib".
+LEAD_PAYLOAD_COMPRESSION = os.getenv("LEAD_PAYLOAD_COMPRESSION", "").strip().lower()
+LEAD_PAYLOAD_COMPRESS_MIN_BYTES = max(0, _int(os.getenv("LEAD_PAYLOAD_COMPRESS_MIN_BYTES", "1024"), 1024))
+
+# Export: tamanho dos pedaços repassados do COPY para a resposta.
+EXPORT_CHUNK_BYTES = max(4096, _int(os.getenv("EXPORT_CHUNK_BYTES", "65536"), 65536))
+# Linhas por lote (row group/record batch) nos formatos parquet/arrow/ndjson.
+EXPORT_BATCH_ROWS = max(1000, _int(os.getenv("EXPORT_BATCH_ROWS", "10000"), 10000))
+
+# Change feed (/leads_changes): itens por página e atraso de segurança. Só entram mudanças com
+# updated_at mais antigo que o atraso, para não pular transações que ainda não commitaram.
+CHANGE_FEED_PAGE_MAX = max(10, _int(os.getenv("CHANGE_FEED_PAGE_MAX", "1000"), 1000))
+CHANGE_FEED_LAG_SECONDS = max(0.0, _float(os.getenv("CHANGE_FEED_LAG_SECONDS", "5"), 5.0))
+
+# Jobs de export assíncrono (services/export_jobs.py, python -m worker).
+EXPORT_JOBS_DIR = os.getenv("EXPORT_JOBS_DIR", "data/exports").strip() or "data/exports"
+# Pedidos iguais dentro da mesma janela reaproveitam o mesmo arquivo.
+EXPORT_JOB_WINDOW_SECONDS = max(60, _int(os.getenv("EXPORT_JOB_WINDOW_SECONDS", "900"), 900))
+EXPORT_JOB_TTL_SECONDS = max(300, _int(os.getenv("EXPORT_JOB_TTL_SECONDS", "86400"), 86400))
+EXPORT_JOBS_MAX_PENDING = max(1, _int(os.getenv("EXPORT_JOBS_MAX_PENDING", "3"), 3))
+EXPORT_JOB_MAX_ATTEMPTS = max(1, _int(os.getenv("EXPORT_JOB_MAX_ATTEMPTS", "3"), 3))
+# Worker sem heartbeat há mais que isso é considerado morto e o job volta para a fila.
+EXPORT_JOB_STALE_SECONDS = max(30, _int(os.getenv("EXPORT_JOB_STALE_SECONDS", "120"), 120))
+WORKER_POLL_SECONDS = max(0.2, _float(os.getenv("WORKER_POLL_SECONDS", "2"), 2.0))
+
+# Stream SSE de leads quentes (/leads_stream, services/live.py). Limites valem por processo web.
+SSE_MAX_STREAMS_PER_CLIENT = max(1, _int(os.getenv("SSE_MAX_STREAMS_PER_CLIENT", "5"), 5))
+SSE_MAX_STREAMS = max(1, _int(os.getenv("SSE_MAX_STREAMS", "200"), 200))
+SSE_HEARTBEAT_SECONDS = max(1.0, _float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"), 15.0))
+# Conexão é encerrada depois disso; o navegador reconecta com Last-Event-ID (e a auth é revalidada).
+SSE_MAX_STREAM_SECONDS = max(30, _int(os.getenv("SSE_MAX_STREAM_SECONDS", "1800"), 1800))
+# Eventos pendentes por conexão; estourou, a conexão refaz o replay pelo change feed.
+SSE_QUEUE_MAX = max(10, _int(os.getenv("SSE_QUEUE_MAX", "500"), 500))
+# Replay por Last-Event-ID: mais mudanças que isso vira um evento "reset" (recarregar a lista).
+SSE_REPLAY_MAX = max(10, _int(os.getenv("SSE_REPLAY_MAX", "2000"), 2000))
+# Sem streams abertos por esse tempo, a conexão do LISTEN é fechada (reabre no próximo stream).
+SSE_LISTENER_IDLE_SECONDS = max(5, _int(os.getenv("SSE_LISTENER_IDLE_SECONDS", "60"), 60))
+
+# /cohorts: a chave inclui a geração dos dados (MAX(updated_at) do cliente), então o TTL só limita memória.
+COHORT_CACHE_TTL_SECONDS = max(60, _int(os.getenv("COHORT_CACHE_TTL_SECONDS", "86400"), 86400))
+
+# API keys (services/api_keys.py): o banco guarda HMAC-SHA256(API_KEY_PEPPER, chave). Trocar o pepper
+# invalida todas as chaves emitidas; defina antes de migrar as chaves antigas.
+API_KEY_PEPPER = os.getenv("API_KEY_PEPPER", "").strip()
+# Cache por processo hash -> perfil do cliente. Mudança de plano/status em outro processo aparece em até um TTL.
+API_KEY_CACHE_MAX = max(100, _int(os.getenv("API_KEY_CACHE_MAX", "10000"), 10000))
+API_KEY_CACHE_TTL_SECONDS = max(1, _int(os.getenv("API_KEY_CACHE_TTL_SECONDS", "60"), 60))
+# Chave desconhecida no tier do rate limit: não volta à réplica por esse tempo (0 desliga). Só o limiter usa;
+# a auth do handler continua indo ao primário, então chave recém-emitida não é recusada.
+API_KEY_NEGATIVE_CACHE_SECONDS = max(0, _int(os.getenv("API_KEY_NEGATIVE_CACHE_SECONDS", "10"), 10))
+# Cada login emite uma chave de login; acima disso, as de login mais antigas são apagadas (integração não).
+API_KEYS_PER_CLIENT = max(1, _int(os.getenv("API_KEYS_PER_CLIENT", "20"), 20))
+# Intervalo mínimo entre leituras do ZSET de chaves revogadas no Redis (revogação entre processos).
+API_KEY_REVOCATION_POLL_MS = max(0, _int(os.getenv("API_KEY_REVOCATION_POLL_MS", "1000"), 1000))
+
+# Access tokens assinados do /login e /token (services/session_tokens.py). Sem segredo, não são emitidos.
+SESSION_TOKEN_SECRET = os.getenv("SESSION_TOKEN_SECRET", "").strip() or FLASK_SECRET_KEY.strip()
+SESSION_TOKEN_TTL_SECONDS = max(60, _int(os.getenv("SESSION_TOKEN_TTL_SECONDS", "900"), 900))
+# Epoch de revogação por cliente em cache no worker: revogação/mudança de plano vale em até isso.
+SESSION_EPOCH_CACHE_SECONDS = max(1, _int(os.getenv("SESSION_EPOCH_CACHE_SECONDS", "30"), 30))
+
+# Hash de senha (PBKDF2) em pool de processos por worker web (services/password_pool.py). 0 = no próprio request.
+PASSWORD_POOL_WORKERS = max(0, _int(os.getenv("PASSWORD_POOL_WORKERS", "1"), 1))
+# Pedidos esperando além dos que estão rodando; acima disso, 503 auth_busy na hora.
+PASSWORD_POOL_MAX_PENDING = max(0, _int(os.getenv("PASSWORD_POOL_MAX_PENDING", "8"), 8))
+PASSWORD_POOL_TIMEOUT_SECONDS = max(1.0, _float(os.getenv("PASSWORD_POOL_TIMEOUT_SECONDS", "10"), 10.0))
+
+# Compressão de respostas (services/compression.py), negociada pelo Accept-Encoding.
+# Ordem de preferência do servidor; zstd/br só entram se zstandard/brotli estiverem instalados.
+COMPRESS_ENABLED = _bool(os.getenv("COMPRESS_ENABLED", "true"))
+COMPRESS_ALGORITHMS = _split_csv(os.getenv("COMPRESS_ALGORITHMS", "zstd,br,gzip").lower())
+COMPRESS_MIN_BYTES = max(0, _int(os.getenv("COMPRESS_MIN_BYTES", "1024"), 1024))
+COMPRESS_MIMETYPES = set(
+    _split_csv(
+        os.getenv(
+            "COMPRESS_MIMETYPES",
+            "application/json,text/csv,text/plain,text/html,application/x-ndjson,application/vnd.apache.arrow.stream",
+        ).lower()
+    )
+)
+COMPRESS_GZIP_LEVEL = min(9, max(1, _int(os.getenv("COMPRESS_GZIP_LEVEL", "6"), 6)))
+COMPRESS_ZSTD_LEVEL = min(19, max(1, _int(os.getenv("COMPRESS_ZSTD_LEVEL", "3"), 3)))
+COMPRESS_BROTLI_QUALITY = min(11, max(0, _int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"), 4)))
+
+# Retenção (python -m services.retention run): destino do arquivo e ritmo dos lotes.
+RETENTION_DAYS_JSON = os.getenv("RETENTION_DAYS_JSON", "").strip()  # ex.: {"trial": 60, "pro": null}
+RETENTION_DELETED_GRACE_DAYS = max(0, _int(os.getenv("RETENTION_DELETED_GRACE_DAYS", "7"), 7))
+RETENTION_SINK = (os.getenv("RETENTION_SINK", "table").strip().lower() or "table")  # table | parquet
+RETENTION_PARQUET_DIR = os.getenv("RETENTION_PARQUET_DIR", "data/archive").strip() or "data/archive"
+RETENTION_BATCH = max(100, _int(os.getenv("RETENTION_BATCH", "2000"), 2000))
+RETENTION_SLEEP_MS = max(0, _int(os.getenv("RETENTION_SLEEP_MS", "50"), 50))
+
+# /metrics: idade máxima do snapshot global antes de recalcular em background.
+METRICS_SNAPSHOT_TTL_SECONDS = max(5, _int(os.getenv("METRICS_SNAPSHOT_TTL_SECONDS", "60"), 60))
+
 DEFAULT_CSP = (
     "default-src 'self'; "
     "base-uri 'self'; "
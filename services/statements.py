@@ -0,0 +1,166 @@
+"""Catálogo de statements nomeados dos caminhos quentes.
+
+Cada entrada é um SQL fixo (texto idêntico a cada chamada), executado com
+prepare=True: o psycopg faz PREPARE na primeira execução em cada conexão do
+pool e reaproveita o plano nas seguintes (parse/plan só uma vez por conexão).
+
+Atrás do PgBouncer em modo transaction, uma conexão do servidor pode não ser a
+mesma entre transações: DB_PGBOUNCER_TRANSACTION_MODE=true desliga o PREPARE
+(aqui e no prepare_threshold automático do psycopg).
+
+Benchmark do tempo de planejamento economizado: python -m scripts.bench_statements
+"""
+
+import os
+from functools import lru_cache
+from typing import Any, Dict, Optional, Sequence
+
+
+def _bool_env(name: str) -> bool:
+    return os.getenv(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def pgbouncer_transaction_mode() -> bool:
+    return _bool_env("DB_PGBOUNCER_TRANSACTION_MODE")
+
+
+def prepare_threshold() -> Optional[int]:
+    """prepare_threshold das conexões (queries fora do catálogo). None desliga o PREPARE automático."""
+
+    if pgbouncer_transaction_mode():
+        return None
+    try:
+        return max(0, int(os.getenv("DB_PREPARE_THRESHOLD", "2")))
+    except Exception:
+        return 2
+
+
+def prepared_statements_enabled() -> bool:
+    return not pgbouncer_transaction_mode()
+
+
+CLIENT_COLUMNS = (
+    "client_id, nome, email, empresa, telefone, valid_until, password_hash, last_login_at, api_key, "
+    "plan, status, usage_month, leads_used_month, created_at, updated_at"
+)
+
+
+@lru_cache(maxsize=1)
+def catalog() -> Dict[str, str]:
+    # Import tardio: services.db usa este módulo (ensure_client_row) e vice-versa.
+    from services.db import get_active_leads_query
+
+    active = get_active_leads_query()
+    return {
+        # Auth: require_client_auth -> ensure_client_row
+        "client_insert_if_missing": """
+            INSERT INTO clients (client_id, api_key, plan, status, usage_month, leads_used_month, updated_at)
+            VALUES (%s, '', %s, 'active', %s, 0, NOW())
+            ON CONFLICT (client_id) DO NOTHING
+        """,
+        # Colunas explícitas: com SELECT * um ALTER TABLE em clients quebraria o plano preparado
+        # ("cached plan must not change result type") nas conexões já abertas.
+        "client_lock": f"SELECT {CLIENT_COLUMNS} FROM clients WHERE client_id=%s FOR UPDATE",
+        # Auth por api_key (services/api_keys.py), só no miss do cache: hash -> perfil do cliente.
+        "api_key_profile": """
+            SELECT k.client_id, k.last_used_at, c.plan, c.status, c.usage_month, c.leads_used_month
+            FROM api_keys k
+            JOIN clients c ON c.client_id = k.client_id
+            WHERE k.key_hash = %s
+        """,
+        # /prever. A virada do mês acontece aqui (a auth não passa mais por ensure_client_row):
+        # uso de outro mês conta como 0 e o bump recomeça do 1. Params: (mês atual, client_id).
+        "prever_lock_usage": """
+            SELECT plan, CASE WHEN usage_month = %s THEN leads_used_month ELSE 0 END AS leads_used_month
+            FROM clients WHERE client_id=%s FOR UPDATE
+        """,
+        # Lead + payload bruto (lead_payloads, fora da linha quente) num statement só.
+        "prever_insert_lead": """
+            WITH lead AS (
+                INSERT INTO leads
+                  (client_id, nome, email_lead, telefone, origem, tempo_site, paginas_visitadas, clicou_preco,
+                   probabilidade, score, label, virou_cliente, created_at, updated_at)
+                VALUES
+                  (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,NULL,NOW(),NOW())
+                RETURNING id, client_id, created_at
+            ), raw AS (
+                INSERT INTO lead_payloads (lead_id, client_id, encoding, payload, payload_z)
+                SELECT id, client_id, %s, %s::jsonb, %s FROM lead
+            )
+            SELECT id, created_at FROM lead
+        """,
+        # Params: (mês atual, mês atual, client_id).
+        "prever_bump_usage": """
+            UPDATE clients
+            SET leads_used_month = CASE WHEN usage_month = %s THEN leads_used_month + 1 ELSE 1 END,
+                usage_month = %s, updated_at=NOW()
+            WHERE client_id=%s
+        """,
+        # /dashboard_data
+        "dashboard_recent_leads": f"""
+            SELECT id, client_id, nome, email_lead, telefone, tempo_site, paginas_visitadas, clicou_preco,
+                   probabilidade, virou_cliente, created_at
+            {active}
+              AND client_id=%s
+            ORDER BY created_at DESC
+            LIMIT %s
+            OFFSET %s
+        """,
+        "dashboard_count_leads": f"""
+            SELECT COUNT(*)::int AS total
+            {active}
+              AND client_id=%s
+        """,
+        "dashboard_top_origens": f"""
+            SELECT COALESCE(NULLIF(TRIM(origem), ''), 'desconhecida') AS origem,
+                   COUNT(*)::int AS total
+            {active}
+              AND client_id=%s
+              AND created_at >= (NOW() - make_interval(days => %s::int))
+            GROUP BY 1
+            ORDER BY total DESC, origem ASC
+            LIMIT %s
+        """,
+        "dashboard_hot_today": f"""
+            SELECT id, nome, telefone, email_lead, origem,
+                   probabilidade, score, created_at, virou_cliente
+            {active}
+              AND client_id=%s
+              AND created_at >= %s AND created_at <= %s
+              AND (
+                    (probabilidade IS NOT NULL AND probabilidade >= 0.70)
+                    OR (score IS NOT NULL AND score >= 70)
+                  )
+            ORDER BY COALESCE(probabilidade, score/100.0) DESC NULLS LAST,
+                     created_at DESC
+            LIMIT %s
+        """,
+        "threshold_by_client": "SELECT threshold FROM thresholds WHERE client_id=%s",
+        # /acao_do_dia (fallback SQL e rebuild do ranking)
+        "acao_do_dia_candidates": f"""
+            SELECT id, nome, email_lead, telefone, origem,
+                   score, probabilidade, created_at, virou_cliente
+            {active}
+              AND client_id=%s
+            ORDER BY COALESCE(probabilidade, score / 100.0) DESC NULLS LAST,
+                     created_at DESC
+            LIMIT %s
+        """,
+        # /lead_explain
+        "lead_explain_features": f"""
+            SELECT tempo_site, paginas_visitadas, clicou_preco, probabilidade
+            {active}
+              AND client_id=%s
+              AND id=%s
+        """,
+    }
+
+
+def statement(name: str) -> str:
+    return catalog()[name]
+
+
+def execute(cur, name: str, params: Sequence[Any] = ()):
+    """cur.execute de um statement do catálogo (PREPARE na 1ª execução por conexão)."""
+
+    return cur.execute(statement(name), params, prepare=prepared_statements_enabled())
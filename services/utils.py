@@ -42,7 +42,8 @@ def json_ok(payload: Dict[str, Any], code: int = 200):
     return resp(payload, code)
 
 
-def json_err(msg: str, code: int = 400, **extra):
+def json_err(msg: str, code: int = 400, /, **extra):
+    # code é posicional: o payload também usa a chave "code" (ex.: code="auth_required").
     payload = {"ok": False, "error": msg}
     payload.update(extra)
     return resp(payload, code)
@@ -100,6 +100,84 @@
       .replaceAll("'", "&#039;");
   }
 
+  let currentItems = [];
+  let lastEventId = "";
+  let streaming = false;
+
+  function applyStreamEvent(name, lead) {
+    const idx = currentItems.findIndex((it) => String(it.id) === String(lead.id));
+    if (name === "delete") {
+      if (idx < 0) return;
+      currentItems.splice(idx, 1);
+    } else if (idx >= 0) {
+      currentItems[idx] = { ...currentItems[idx], ...lead };
+    } else if (normalizeTemp(lead) === "hot") {
+      currentItems.unshift(lead);
+    } else {
+      return;
+    }
+    renderList(currentItems);
+    setState(currentItems.length ? "ready" : "empty");
+  }
+
+  function parseSseBlock(block) {
+    const msg = { id: "", event: "message", data: "", retry: 0 };
+    block.split("\n").forEach((line) => {
+      if (!line || line.startsWith(":")) return; // ": ping" (heartbeat)
+      const sep = line.indexOf(":");
+      const field = sep < 0 ? line : line.slice(0, sep);
+      const value = sep < 0 ? "" : line.slice(sep + 1).replace(/^ /, "");
+      if (field === "id") msg.id = value;
+      else if (field === "event") msg.event = value;
+      else if (field === "data") msg.data += (msg.data ? "\n" : "") + value;
+      else if (field === "retry") msg.retry = Number(value) || 0;
+    });
+    return msg;
+  }
+
+  // Leads quentes em tempo real (/leads_stream). EventSource não envia X-API-KEY, então lemos o SSE via fetch.
+  async function streamHotLeads() {
+    if (streaming) return;
+    streaming = true;
+    let retryMs = 3000;
+    for (;;) {
+      const apiKey = getApiKey();
+      const clientId = getClientId();
+      if (!apiKey || !clientId) break;
+
+      let waitMs = retryMs;
+      try {
+        const headers = { "X-API-KEY": apiKey, "X-CLIENT-ID": clientId, Accept: "text/event-stream" };
+        if (lastEventId) headers["Last-Event-ID"] = lastEventId;
+        const resp = await fetch(`${BACKEND}/leads_stream`, { headers, cache: "no-store" });
+        if (resp.status === 403) break;
+        if (resp.status === 429) waitMs = 30000; // muitas abas abertas: tenta de novo mais tarde
+        if (!resp.ok || !resp.body) throw new Error(`HTTP ${resp.status}`);
+
+        const reader = resp.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buf = "";
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buf += value;
+          let sep;
+          while ((sep = buf.indexOf("\n\n")) >= 0) {
+            const msg = parseSseBlock(buf.slice(0, sep));
+            buf = buf.slice(sep + 2);
+            if (msg.retry) retryMs = msg.retry;
+            if (msg.id) lastEventId = msg.id;
+            if (msg.event === "reset") fetchActionList();
+            else if ((msg.event === "lead" || msg.event === "delete") && msg.data) applyStreamEvent(msg.event, JSON.parse(msg.data));
+          }
+        }
+      } catch (err) {
+        console.warn("Stream de leads interrompido; reconectando", err);
+      }
+      await new Promise((resolve) => setTimeout(resolve, waitMs));
+    }
+    streaming = false;
+  }
+
   async function fetchActionList() {
     if (!BACKEND) {
       console.error("BACKEND_URL não definido");
@@ -131,12 +209,13 @@
 
       const data = await resp.json();
       const list = data.action_list || data.rows || data.items || [];
-      if (!Array.isArray(list) || list.length === 0) {
+      currentItems = Array.isArray(list) ? list.slice() : [];
+      if (currentItems.length === 0) {
         setState("empty");
         return;
       }
 
-      renderList(list);
+      renderList(currentItems);
       setState("ready");
     } catch (err) {
       console.error("Erro ao carregar /acao_do_dia", err);
@@ -205,6 +284,6 @@
 
   document.addEventListener("DOMContentLoaded", () => {
     wireUI();
-    fetchActionList();
+    fetchActionList().then(streamHotLeads);
   });
 })();
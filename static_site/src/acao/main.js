@@ -1,7 +1,7 @@
-import { createApp, ref } from "vue";
+import { createApp, onBeforeUnmount, ref } from "vue";
 import LeadsTable from "../components/LeadsTable.vue";
 import LeadDetailModal from "../components/LeadDetailModal.vue";
-import { exportCsv, getActionList, seedTestLeads } from "../shared/api.js";
+import { exportCsv, getActionList, seedTestLeads, streamHotLeads } from "../shared/api.js";
 
 const app = {
   components: { LeadsTable, LeadDetailModal },
@@ -56,7 +56,31 @@ const app = {
       }
     };
 
-    loadLeads();
+    const applyStreamEvent = (name, lead) => {
+      if (name === "reset") {
+        loadLeads();
+        return;
+      }
+      const list = leads.value.slice();
+      const idx = list.findIndex((item) => String(item.id) === String(lead.id));
+      if (name === "delete") {
+        if (idx < 0) return;
+        list.splice(idx, 1);
+      } else if (idx >= 0) {
+        list[idx] = { ...list[idx], ...lead };
+      } else if (lead.temperatura === "hot") {
+        list.unshift(lead);
+      } else {
+        return;
+      }
+      leads.value = list;
+      state.value = list.length ? "ready" : "empty";
+    };
+
+    const streamAbort = new AbortController();
+    onBeforeUnmount(() => streamAbort.abort());
+
+    loadLeads().then(() => streamHotLeads(applyStreamEvent, { signal: streamAbort.signal }));
 
     return {
       leads,
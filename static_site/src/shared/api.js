@@ -14,24 +14,72 @@ const getFirstStored = (keys) => {
 const getApiKey = () => getFirstStored(["leadrank_api_key", "api_key", "LR_API_KEY"]);
 const getClientId = () => getFirstStored(["leadrank_client_id", "client_id", "LR_CLIENT_ID"]);
 
-const authHeaders = () => {
+// Access token curto (/login, /token): o backend valida sem ir ao banco. Expirou, renova com a api_key.
+const TOKEN_KEY = "leadrank_access_token";
+const TOKEN_EXP_KEY = "leadrank_access_token_exp";
+let tokensUnavailable = false;
+
+const storeToken = (data) => {
+  try {
+    if (data?.access_token) {
+      sessionStorage.setItem(TOKEN_KEY, data.access_token);
+      sessionStorage.setItem(TOKEN_EXP_KEY, String(Date.now() + (Number(data.expires_in) || 0) * 1000));
+    } else {
+      sessionStorage.removeItem(TOKEN_KEY);
+      sessionStorage.removeItem(TOKEN_EXP_KEY);
+    }
+  } catch (_) {}
+};
+
+const accessToken = async () => {
+  try {
+    const token = sessionStorage.getItem(TOKEN_KEY) || "";
+    if (token && Number(sessionStorage.getItem(TOKEN_EXP_KEY) || 0) - 30000 > Date.now()) return token;
+  } catch (_) {}
   const apiKey = getApiKey();
   const clientId = getClientId();
+  if (tokensUnavailable || !apiKey || !clientId) return "";
+  try {
+    const response = await fetch(`${backend}/token`, {
+      method: "POST",
+      headers: { "X-API-KEY": apiKey, "X-CLIENT-ID": clientId }
+    });
+    const data = response.ok ? await response.json() : {};
+    // Tokens desligados no backend (ou falha): segue só com a api_key nesta página.
+    if (!data.access_token) tokensUnavailable = true;
+    storeToken(data);
+    return data.access_token || "";
+  } catch (_) {
+    tokensUnavailable = true;
+    return "";
+  }
+};
+
+const authHeaders = async () => {
+  const clientId = getClientId();
+  const token = await accessToken();
+  const apiKey = getApiKey();
   return {
-    ...(apiKey ? { "X-API-KEY": apiKey } : {}),
+    ...(token ? { Authorization: `Bearer ${token}` } : apiKey ? { "X-API-KEY": apiKey } : {}),
     ...(clientId ? { "X-CLIENT-ID": clientId } : {})
   };
 };
 
-const requestJson = async (path, options = {}) => {
+const requestJson = async (path, options = {}, retried = false) => {
+  const auth = await authHeaders();
   const response = await fetch(`${backend}${path}`, {
     ...options,
     headers: {
       "Content-Type": "application/json",
       ...(options.headers || {}),
-      ...authHeaders()
+      ...auth
     }
   });
+  if (response.status === 403 && auth.Authorization && !retried) {
+    // Token revogado (troca de plano, /tokens/revoke): pega outro e tenta uma vez.
+    storeToken(null);
+    return requestJson(path, options, true);
+  }
   const data = await response.json().catch(() => ({}));
   if (!response.ok) {
     const message = data.error || data.message || `Erro ${response.status}`;
@@ -45,6 +93,62 @@ const getActionList = async () => {
   return data.action_list || data.items || data.rows || [];
 };
 
+const parseSseBlock = (block) => {
+  const msg = { id: "", event: "message", data: "", retry: 0 };
+  for (const line of block.split("\n")) {
+    if (!line || line.startsWith(":")) continue; // ": ping" (heartbeat)
+    const sep = line.indexOf(":");
+    const field = sep < 0 ? line : line.slice(0, sep);
+    const value = sep < 0 ? "" : line.slice(sep + 1).replace(/^ /, "");
+    if (field === "id") msg.id = value;
+    else if (field === "event") msg.event = value;
+    else if (field === "data") msg.data += (msg.data ? "\n" : "") + value;
+    else if (field === "retry") msg.retry = Number(value) || 0;
+  }
+  return msg;
+};
+
+// Leads quentes em tempo real (/leads_stream). EventSource não envia X-API-KEY, então o SSE é lido via fetch.
+// onEvent(name, data): "lead" (upsert), "delete" ou "reset" (recarregar a lista). Para com signal.abort().
+const streamHotLeads = async (onEvent, { signal } = {}) => {
+  let lastEventId = "";
+  let retryMs = 3000;
+  while (!signal?.aborted) {
+    let waitMs = retryMs;
+    try {
+      const headers = { ...(await authHeaders()), Accept: "text/event-stream" };
+      if (lastEventId) headers["Last-Event-ID"] = lastEventId;
+      const response = await fetch(`${backend}/leads_stream`, { headers, cache: "no-store", signal });
+      if (response.status === 403 && !headers.Authorization) return;
+      if (response.status === 403) storeToken(null); // token revogado: reconecta com um novo
+      if (response.status === 429) waitMs = 30000; // muitas abas abertas: tenta de novo mais tarde
+      if (!response.ok || !response.body) throw new Error(`Erro ${response.status}`);
+
+      const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+      let buf = "";
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buf += value;
+        let sep;
+        while ((sep = buf.indexOf("\n\n")) >= 0) {
+          const msg = parseSseBlock(buf.slice(0, sep));
+          buf = buf.slice(sep + 2);
+          if (msg.retry) retryMs = msg.retry;
+          if (msg.id) lastEventId = msg.id;
+          if (msg.event === "lead" || msg.event === "delete" || msg.event === "reset") {
+            onEvent(msg.event, msg.data ? JSON.parse(msg.data) : {});
+          }
+        }
+      }
+    } catch (err) {
+      if (signal?.aborted) return;
+      console.warn("Stream de leads interrompido; reconectando", err);
+    }
+    await new Promise((resolve) => setTimeout(resolve, waitMs));
+  }
+};
+
 const seedTestLeads = async (count = 10) => {
   const clientId = getClientId();
   return requestJson("/seed_test_leads", {
@@ -54,7 +158,7 @@ const seedTestLeads = async (count = 10) => {
 };
 
 const exportCsv = async () => {
-  const response = await fetch(`${backend}/leads_export.csv`, { headers: authHeaders() });
+  const response = await fetch(`${backend}/leads_export.csv`, { headers: await authHeaders() });
   if (!response.ok) {
     throw new Error(`Erro ${response.status}`);
   }
@@ -68,6 +172,7 @@ const exportCsv = async () => {
 export {
   backend,
   getActionList,
+  streamHotLeads,
   seedTestLeads,
   exportCsv,
   requestJson,
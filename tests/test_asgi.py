@@ -0,0 +1,39 @@
+import asyncio
+import json
+
+import asgi
+
+
+def _call(method, path, body=b"", headers=None):
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": b"",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": ("127.0.0.1", 5000),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi.app(scope, receive, send))
+    return sent[0]["status"], json.loads(sent[1]["body"])
+
+
+def test_prever_sem_client_id_responde_400():
+    status, payload = _call("POST", "/prever", b"{}", {"Content-Type": "application/json"})
+    assert status == 400
+    assert payload["ok"] is False
+
+
+def test_prever_payload_grande_responde_413_antes_do_banco(monkeypatch):
+    monkeypatch.setattr(asgi.settings, "MAX_PREVER_PAYLOAD_BYTES", 10)
+    status, payload = _call("POST", "/prever", b'{"client_id": "c1", "nome": "x"}', {"X-CLIENT-ID": "c1"})
+    assert status == 413
+    assert payload["code"] == "payload_too_large"
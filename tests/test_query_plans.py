@@ -0,0 +1,275 @@
+"""Confere que as queries quentes de leads usam índice num banco local populado.
+
+Precisa de um Postgres descartável: TEST_DATABASE_URL=postgresql://... pytest tests/test_query_plans.py
+Cria um schema temporário, aplica migrations/*.sql, popula ~60k leads e roda EXPLAIN.
+Também roda os statements da retenção nesse schema (o que sai de leads e como chega ao arquivo) e, com o
+app apontado para o schema, o caminho /excluir_lead -> tombstone no /leads_changes.
+"""
+
+import json
+import os
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+
+psycopg = pytest.importorskip("psycopg")
+
+from services.changes import FEED_SQL
+from services.cohorts import COHORT_SQL, window_start
+from services.db import get_active_leads_query
+from services.export import csv_select_sql, export_where, parse_export_filters
+from services.insights import INSIGHTS_SQL
+from services.lead_service import sp_today_bounds_utc
+from services.migrations import split_sql
+from services.retention import _DELETED_BATCH_SQL, _MOVE_TO_TABLE_SQL, _STALE_BATCH_SQL
+from services.statements import statement
+from services.utils import now_utc
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "").strip()
+MIGRATIONS_DIR = Path(__file__).resolve().parents[1] / "migrations"
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL não configurada")
+
+ACTIVE = get_active_leads_query()
+CLIENT = "c42"
+
+
+def _export_query(args, expected_index=None):
+    where, params = export_where(CLIENT, parse_export_filters(args))
+    return csv_select_sql("leads", where), params, expected_index
+
+
+def _queries():
+    start_utc, end_utc = sp_today_bounds_utc()
+    since = now_utc() - timedelta(days=14)
+    return {
+        "fetch_recent_leads": (statement("dashboard_recent_leads"), (CLIENT, 200, 0), None),
+        "count_leads": (statement("dashboard_count_leads"), (CLIENT,), None),
+        "top_origens": (statement("dashboard_top_origens"), (CLIENT, 30, 6), None),
+        "hot_leads_today": (statement("dashboard_hot_today"), (CLIENT, start_utc, end_utc, 20), None),
+        "acao_do_dia": (statement("acao_do_dia_candidates"), (CLIENT, 30), "idx_leads_active_client_rank"),
+        "recalc_pending": (
+            f"""
+            SELECT id, tempo_site, paginas_visitadas, clicou_preco {ACTIVE}
+              AND client_id=%s AND virou_cliente IS NULL ORDER BY created_at DESC LIMIT %s
+            """,
+            (CLIENT, 500),
+            "idx_leads_active_client_pending",
+        ),
+        "get_labeled_rows": (
+            f"""
+            SELECT id, probabilidade, virou_cliente {ACTIVE}
+              AND client_id=%s AND virou_cliente IS NOT NULL ORDER BY created_at DESC
+            """,
+            (CLIENT,),
+            None,
+        ),
+        "insights": (
+            INSIGHTS_SQL,
+            {"edges": [0.0, 0.2, 0.4, 0.6, 0.8, 1.0], "bands": 5, "score_bins": 10, "client_id": CLIENT, "since": since},
+            None,
+        ),
+        "funnels": (
+            f"""
+            SELECT COUNT(*) FILTER (WHERE probabilidade >= 0.70) AS hot {ACTIVE} AND client_id=%s
+            """,
+            (CLIENT,),
+            None,
+        ),
+        "leads_export": (csv_select_sql("leads"), (CLIENT,), None),
+        "lead_explain": (statement("lead_explain_features"), (CLIENT, 4242), None),
+        "export_filtro_periodo": _export_query({"from": (now_utc() - timedelta(days=7)).date().isoformat()}),
+        "export_filtro_hot": _export_query({"temperature": "hot"}, "idx_leads_active_client_hot"),
+        "export_filtro_warm_cold": _export_query({"temperature": "warm,cold"}),
+        "export_filtro_pendentes": _export_query({"label": "pending"}, "idx_leads_active_client_pending"),
+        "export_filtro_convertidos": _export_query({"label": "converted"}, "idx_leads_active_client_labeled"),
+        "export_filtro_origem": _export_query({"origem": "ads,site"}),
+        "export_filtro_min_prob": _export_query({"min_prob": "0.9"}),
+        "export_filtro_combinado": _export_query(
+            {"from": (now_utc() - timedelta(days=7)).date().isoformat(), "temperature": "hot", "label": "pending"}
+        ),
+        "cohorts": (
+            COHORT_SQL,
+            {"client_id": CLIENT, "t0": window_start(12)},
+            "idx_leads_active_client_created",
+        ),
+        "leads_changes": (
+            FEED_SQL,
+            {"client_id": CLIENT, "updated_at": now_utc() - timedelta(days=1), "id": 0, "lag": 5, "limit": 1000},
+            "idx_leads_client_updated_id",
+        ),
+    }
+
+
+SEED_SQL = """
+INSERT INTO leads (client_id, nome, origem, tempo_site, paginas_visitadas, clicou_preco,
+                   probabilidade, score, virou_cliente, created_at, updated_at, deleted_at)
+SELECT 'c' || (g % 200),
+       'Lead ' || g,
+       (ARRAY['site', 'ads', 'indicacao', 'whatsapp'])[1 + g % 4],
+       g % 400, g % 10, g % 2,
+       CASE WHEN g % 10 = 0 THEN NULL ELSE (g % 100) / 100.0 END,
+       g % 100,
+       CASE WHEN g % 5 = 0 THEN 1 WHEN g % 7 = 0 THEN 0 END,
+       NOW() - ((g % 365) || ' days')::interval - ((g % 1440) || ' minutes')::interval,
+       NOW(),
+       CASE WHEN g % 50 = 0 THEN NOW() END
+FROM generate_series(1, 60000) AS g
+"""
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans") or []:
+        yield from _plan_nodes(child)
+
+
+@pytest.fixture(scope="module")
+def seeded_conn():
+    schema = f"lr_plan_test_{uuid.uuid4().hex[:8]}"
+    conn = psycopg.connect(TEST_DATABASE_URL, autocommit=True)
+    try:
+        conn.execute(f"CREATE SCHEMA {schema}")
+        conn.execute(f"SET search_path TO {schema}")
+        for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+            for stmt in split_sql(path.read_text(encoding="utf-8")):
+                conn.execute(stmt)
+        conn.execute(SEED_SQL)
+        conn.execute("ANALYZE leads")
+        yield conn
+    finally:
+        conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        conn.close()
+
+
+@pytest.mark.parametrize("name", sorted(_queries().keys()))
+def test_query_usa_indice(seeded_conn, name):
+    sql, params, expected_index = _queries()[name]
+    cur = psycopg.ClientCursor(seeded_conn)
+    cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    raw = cur.fetchone()[0]
+    plan = (raw if isinstance(raw, list) else json.loads(raw))[0]["Plan"]
+
+    lead_nodes = [n for n in _plan_nodes(plan) if n.get("Relation Name") == "leads"]
+    assert lead_nodes, f"{name}: plano não toca leads"
+    assert all(n["Node Type"] != "Seq Scan" for n in lead_nodes), f"{name}: seq scan em leads\n{plan}"
+
+    index_names = {n.get("Index Name") for n in _plan_nodes(plan) if n.get("Index Name")}
+    assert index_names, f"{name}: nenhum índice no plano\n{plan}"
+    if expected_index:
+        assert expected_index in index_names, f"{name}: esperado {expected_index}, plano usou {index_names}"
+
+
+def _archive(conn, batch_sql, params, reason):
+    conn.execute(_MOVE_TO_TABLE_SQL.format(batch=batch_sql), {**params, "limit": 1000, "reason": reason})
+
+
+def test_retencao_deletado_antigo_sai_como_deleted(seeded_conn):
+    client = f"ret_{uuid.uuid4().hex[:8]}"
+    seeded_conn.execute(
+        """
+        INSERT INTO leads (id, client_id, nome, created_at, updated_at, deleted_at)
+        VALUES (900000001, %(c)s, 'ativo', NOW() - interval '400 days', NOW(), NULL),
+               (900000002, %(c)s, 'deletado', NOW() - interval '400 days', NOW(), NOW() - interval '1 day')
+        """,
+        {"c": client},
+    )
+    _archive(seeded_conn, _STALE_BATCH_SQL, {"client_id": client, "days": 30}, "retention")
+    _archive(seeded_conn, _DELETED_BATCH_SQL, {"grace": 0}, "deleted")
+    rows = seeded_conn.execute(
+        "SELECT id, archive_reason FROM leads_archive WHERE client_id=%s ORDER BY id", (client,)
+    ).fetchall()
+    assert rows == [(900000001, "retention"), (900000002, "deleted")]
+
+
+def test_retencao_leva_payload_junto_e_nao_deixa_orfao(seeded_conn):
+    client = f"ret_{uuid.uuid4().hex[:8]}"
+    seeded_conn.execute(
+        """
+        INSERT INTO leads (id, client_id, nome, created_at, updated_at)
+        VALUES (900000011, %(c)s, 'json', NOW() - interval '400 days', NOW()),
+               (900000012, %(c)s, 'zlib', NOW() - interval '400 days', NOW())
+        """,
+        {"c": client},
+    )
+    seeded_conn.execute(
+        """
+        INSERT INTO lead_payloads (lead_id, client_id, encoding, payload, payload_z)
+        VALUES (900000011, %(c)s, 'json', '{"utm": "x"}', NULL), (900000012, %(c)s, 'zlib', NULL, '\\x789c')
+        """,
+        {"c": client},
+    )
+    _archive(seeded_conn, _STALE_BATCH_SQL, {"client_id": client, "days": 30}, "retention")
+    rows = seeded_conn.execute(
+        "SELECT id, payload, payload_encoding, payload_z IS NOT NULL FROM leads_archive WHERE client_id=%s ORDER BY id",
+        (client,),
+    ).fetchall()
+    assert rows == [(900000011, {"utm": "x"}, "json", False), (900000012, {}, "zlib", True)]
+    assert seeded_conn.execute("SELECT COUNT(*) FROM lead_payloads WHERE client_id=%s", (client,)).fetchone()[0] == 0
+
+
+@pytest.fixture
+def app_client(seeded_conn, monkeypatch):
+    """Flask test client com o pool do app no schema temporário (sem Redis: rate limit em memória)."""
+
+    import app as flask_app
+    from services import db as db_module, settings
+
+    schema = seeded_conn.execute("SHOW search_path").fetchone()[0]
+    sep = "&" if "?" in TEST_DATABASE_URL else "?"
+    monkeypatch.setattr(settings, "DATABASE_URL", f"{TEST_DATABASE_URL}{sep}options=-csearch_path%3D{schema}")
+    monkeypatch.setattr(settings, "DATABASE_REPLICA_URL", "")
+    monkeypatch.setattr(settings, "CHANGE_FEED_LAG_SECONDS", 0)
+    monkeypatch.setattr(db_module, "_POOL", None)
+    try:
+        yield flask_app.app.test_client()
+    finally:
+        if db_module._POOL is not None:
+            db_module._POOL.close()
+
+
+def test_excluir_lead_vira_tombstone_no_change_feed(seeded_conn, app_client):
+    from services.api_keys import INSERT_KEY_SQL, new_api_key
+
+    client = f"del_{uuid.uuid4().hex[:8]}"
+    api_key, key_hash = new_api_key(client)
+    seeded_conn.execute("INSERT INTO clients (client_id, plan) VALUES (%s, 'pro')", (client,))
+    seeded_conn.execute(INSERT_KEY_SQL, (key_hash, client))
+    lead_id = seeded_conn.execute(
+        "INSERT INTO leads (client_id, nome, created_at, updated_at) VALUES (%s, 'x', NOW(), NOW()) RETURNING id",
+        (client,),
+    ).fetchone()[0]
+    headers = {"X-CLIENT-ID": client, "X-API-KEY": api_key}
+
+    feed = app_client.get("/leads_changes", headers=headers).get_json()
+    assert [c["op"] for c in feed["changes"]] == ["upsert"]
+
+    resp = app_client.post("/excluir_lead", json={"lead_id": lead_id}, headers=headers)
+    assert resp.get_json()["deleted"] is True
+    assert app_client.post("/excluir_lead", json={"lead_id": lead_id}, headers=headers).get_json()["deleted"] is False
+
+    page = app_client.get(f"/leads_changes?cursor={feed['next_cursor']}", headers=headers).get_json()
+    assert [(c["op"], c["id"]) for c in page["changes"]] == [("delete", lead_id)]
+
+
+def test_insights_lead_sem_probabilidade_ou_score_fica_so_nos_totais(seeded_conn, app_client):
+    from services.insights import fetch_insights, parse_bins
+
+    client = f"ins_{uuid.uuid4().hex[:8]}"
+    seeded_conn.execute(
+        """
+        INSERT INTO leads (client_id, nome, probabilidade, score, virou_cliente, created_at, updated_at)
+        VALUES (%(c)s, 'quente', 0.9, 95, 1, NOW(), NOW()), (%(c)s, 'frio', 0.1, 5, 0, NOW(), NOW()),
+               (%(c)s, 'sem_prob', NULL, 50, NULL, NOW(), NOW()), (%(c)s, 'sem_score', 0.5, NULL, NULL, NOW(), NOW()),
+               (%(c)s, 'sem_nada', NULL, NULL, NULL, NOW(), NOW())
+        """,
+        {"c": client},
+    )
+    edges, score_bins = parse_bins({})
+    out = fetch_insights(client, now_utc() - timedelta(days=1), edges, score_bins)
+
+    assert out["overall"]["window_total"] == 5 and out["overall"]["labeled"] == 2
+    assert [b["total"] for b in out["bands"]] == [1, 0, 1, 0, 1]
+    assert [b["total"] for b in out["score_histogram"]] == [1, 0, 0, 0, 0, 1, 0, 0, 0, 1]
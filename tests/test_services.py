@@ -1,7 +1,25 @@
+import gzip
+import json
+from datetime import datetime, timezone
+
 import pytest
 
+from services import api_keys, live, password_pool, session_tokens, settings
 from services.auth_service import validate_password_strength
+from services.changes import decode_cursor, encode_cursor
+from services.cohorts import compute_cohorts
+from services.compression import compress_stream, negotiate
+from services.export import FORMATS, format_unavailable, parse_export_filters
+from services.export_jobs import job_payload, window_start
+from services.insights import band_label, parse_bins
 from services.lead_service import lead_temperature
+from services.metrics_service import estimate_counts
+from services.migrations import split_sql
+from services.payloads import decode_payload, encode_payload
+from services.rate_limit_storage import BatchedStorage, batched_uri
+from services.ranking import lead_priority, rank_member
+from services.retention import retention_days
+from services.statements import catalog, prepare_threshold, prepared_statements_enabled
 
 
 @pytest.mark.parametrize(
@@ -34,3 +52,418 @@ def test_lead_temperature_thresholds(probabilidade, score, expected):
 def test_validate_password_strength(password, expected_ok):
     ok, _ = validate_password_strength(password)
     assert ok is expected_ok
+
+
+@pytest.mark.parametrize(
+    ("probabilidade", "score", "expected"),
+    [
+        (0.42, 90, 0.42),
+        (None, 55, 0.55),
+        (0.0, None, 0.0),
+        (None, None, -1.0),
+    ],
+)
+def test_lead_priority_espelha_coalesce(probabilidade, score, expected):
+    assert lead_priority(probabilidade, score) == pytest.approx(expected)
+
+
+def test_rank_member_desempata_por_created_at_desc():
+    older = rank_member(99, datetime(2024, 1, 1, tzinfo=timezone.utc))
+    newer = rank_member(7, datetime(2024, 1, 2, tzinfo=timezone.utc))
+    # ZREVRANGE ordena empates pelo member em ordem lexicográfica decrescente.
+    assert sorted([older, newer], reverse=True) == [newer, older]
+    assert newer.split(":", 1)[1] == "7"
+
+
+def test_estimate_counts_usa_null_frac():
+    counts = estimate_counts(1000.0, active_frac=0.9, pending_frac=0.25)
+    assert counts == {"total_leads": 900, "labeled": 675, "pending": 225}
+
+
+def test_estimate_counts_sem_estatisticas_assume_tudo_ativo_e_pendente():
+    assert estimate_counts(10.0, None, None) == {"total_leads": 10, "labeled": 0, "pending": 10}
+
+
+def test_pgbouncer_transaction_mode_desliga_prepare(monkeypatch):
+    monkeypatch.setenv("DB_PREPARE_THRESHOLD", "3")
+    monkeypatch.delenv("DB_PGBOUNCER_TRANSACTION_MODE", raising=False)
+    assert prepare_threshold() == 3
+    assert prepared_statements_enabled()
+
+    monkeypatch.setenv("DB_PGBOUNCER_TRANSACTION_MODE", "true")
+    assert prepare_threshold() is None
+    assert not prepared_statements_enabled()
+
+
+def test_catalogo_nao_usa_select_estrela():
+    # SELECT * num statement preparado quebra após ALTER TABLE ("cached plan must not change result type").
+    for name, sql in catalog().items():
+        assert "SELECT *" not in sql, name
+
+
+def test_split_sql_respeita_dollar_quote_strings_e_comentarios():
+    sql = """
+    -- comentário; com ponto e vírgula
+    CREATE TABLE t (v TEXT DEFAULT 'a;b');
+    CREATE FUNCTION f() RETURNS void AS $fn$ BEGIN PERFORM 1; PERFORM 2; END $fn$ LANGUAGE plpgsql;
+    DO $$ BEGIN RAISE NOTICE 'x;y'; END $$;
+    /* bloco; */
+    SELECT E'it\\'s;', 'o''k;' ;
+    """
+    stmts = split_sql(sql)
+    assert len(stmts) == 4
+    assert "PERFORM 2; END $fn$" in stmts[1]
+    assert stmts[3].endswith("'o''k;'")
+
+
+def test_retention_days_por_plano_com_override(monkeypatch):
+    monkeypatch.setattr(settings, "RETENTION_DAYS_JSON", '{"trial": 60, "pro": null}')
+    assert retention_days("trial") == 60
+    assert retention_days("pro") is None
+    assert retention_days("starter") == settings.PLAN_CATALOG["starter"]["retention_days"]
+    assert retention_days("enterprise") is None
+    # Plano desconhecido nunca arquiva por idade.
+    assert retention_days("plano_x") is None
+
+
+def test_payload_zlib_so_acima_do_minimo(monkeypatch):
+    monkeypatch.setattr(settings, "LEAD_PAYLOAD_COMPRESSION", "zlib")
+    monkeypatch.setattr(settings, "LEAD_PAYLOAD_COMPRESS_MIN_BYTES", 200)
+    small = {"nome": "Ana"}
+    assert encode_payload(small)[0] == "json"
+
+    big = {"nome": "Ana", "utm": "x" * 500}
+    encoding, as_json, compressed = encode_payload(big)
+    assert (encoding, as_json) == ("zlib", None)
+    assert decode_payload({"encoding": encoding, "payload_z": compressed}) == big
+    # Lead antigo ainda não migrado pelo backfill: cai no valor inline de leads.payload.
+    assert decode_payload({"encoding": None, "payload_json": None, "inline_payload": small}) == small
+
+
+def test_export_formatos_tipados(monkeypatch):
+    import services.export as export
+
+    assert format_unavailable("csv") is None
+    assert format_unavailable("ndjson") is None
+    assert "format inválido" in format_unavailable("xlsx")
+    # Sem pyarrow, parquet/arrow viram erro explícito em vez de 500 no meio do stream.
+    monkeypatch.setattr(export, "pa", None)
+    assert "pyarrow" in format_unavailable("parquet")
+    assert set(FORMATS) == {"csv", "parquet", "arrow", "ndjson"}
+
+
+def test_compressao_negocia_e_comprime_stream_incremental(monkeypatch):
+    monkeypatch.setattr(settings, "COMPRESS_ALGORITHMS", ["zstd", "br", "gzip"])
+    assert negotiate("") is None
+    assert negotiate("gzip, deflate") == "gzip"
+    assert negotiate("gzip;q=0") is None
+    assert negotiate("identity, *;q=0.5") is not None
+
+    chunks = [b"nome,email\n"] + [f"Lead {i},l{i}@x.com\n".encode() for i in range(500)]
+    out = list(compress_stream("gzip", iter(chunks)))
+    # Um bloco por pedaço de entrada (flush), não um único blob no final.
+    assert len(out) > 1
+    assert gzip.decompress(b"".join(out)) == b"".join(chunks)
+
+
+def test_export_job_janela_e_progresso(monkeypatch):
+    monkeypatch.setattr(settings, "EXPORT_JOB_WINDOW_SECONDS", 900)
+    a = window_start(datetime(2026, 5, 1, 10, 14, 59, tzinfo=timezone.utc))
+    b = window_start(datetime(2026, 5, 1, 10, 0, 0, tzinfo=timezone.utc))
+    assert a == b == datetime(2026, 5, 1, 10, 0, tzinfo=timezone.utc)
+    assert window_start(datetime(2026, 5, 1, 10, 15, tzinfo=timezone.utc)) > a
+
+    job = {"id": 7, "status": "running", "format": "csv", "include_archived": False, "rows_total": 200, "rows_done": 250}
+    assert job_payload(job)["progress"] == 0.99
+    done = job_payload({**job, "status": "done", "etag": "abc"})
+    assert done["progress"] == 1.0
+    assert done["download_url"] == "/export_jobs/7/download"
+
+
+def test_change_feed_cursor_opaco_ida_e_volta():
+    ts = datetime(2026, 3, 9, 12, 30, 1, 123456, tzinfo=timezone.utc)
+    cursor = encode_cursor(ts, 987654)
+    assert ":" not in cursor
+    assert decode_cursor(cursor) == (ts, 987654)
+    assert decode_cursor("")[1] == 0
+    with pytest.raises(ValueError):
+        decode_cursor("nao-e-cursor")
+
+
+def test_export_filtros_viram_predicados_sql():
+    f = parse_export_filters({"from": "2026-03-01", "to": "2026-03-31", "temperature": "hot", "label": "pending"})
+    sql, params = f.sql()
+    # Datas são dias inteiros em São Paulo (UTC-3): [01/03 03:00Z, 01/04 03:00Z).
+    assert params == [datetime(2026, 3, 1, 3, tzinfo=timezone.utc), datetime(2026, 4, 1, 3, tzinfo=timezone.utc)]
+    assert "probabilidade >= 0.70" in sql and "virou_cliente IS NULL" in sql
+    same = parse_export_filters({"label": "pending", "temperature": "hot", "to": "2026-03-31", "from": "2026-03-01"})
+    assert f.query_string() == same.query_string()
+
+    # Caminho em Python (arquivo Parquet) segue as mesmas regras.
+    created = datetime(2026, 3, 10, tzinfo=timezone.utc)
+    row = {"created_at": created, "probabilidade": 0.8, "score": 80, "virou_cliente": None}
+    assert f.matches(row)
+    assert not f.matches({**row, "virou_cliente": 1})
+    assert not f.matches({**row, "probabilidade": 0.5, "score": 50})
+
+    with pytest.raises(ValueError):
+        parse_export_filters({"label": "talvez"})
+
+
+def test_stream_ao_vivo_fan_out_limite_e_fila(monkeypatch):
+    monkeypatch.setattr(live, "_listen_loop", lambda: None)
+    monkeypatch.setattr(settings, "SSE_MAX_STREAMS_PER_CLIENT", 2)
+    monkeypatch.setattr(settings, "SSE_QUEUE_MAX", 3)
+    a, b = live.subscribe("c1"), live.subscribe("c1")
+    other = live.subscribe("c2")
+    try:
+        assert live.subscribe("c1") is None
+        payload = {"client_id": "c1", "id": 5, "nome": "Ana", "probabilidade": 0.9, "score": 90,
+                   "created_at": "2026-03-09T12:00:00+00:00", "updated_at": "2026-03-09T12:00:01.5+00:00"}
+        assert live.dispatch(json.dumps(payload)) == 2
+        events, resync = a.take(0)
+        assert not resync and other.take(0) == ([], False)
+        event_id, name, data = events[0]
+        assert name == "lead" and data["temperatura"] == "hot"
+        assert decode_cursor(event_id) == (datetime(2026, 3, 9, 12, 0, 1, 500000, tzinfo=timezone.utc), 5)
+        assert live.sse_frame(events[0]).startswith(f"id: {event_id}\nevent: lead\ndata: {{")
+
+        # Fila estourada: descarta tudo e pede replay pelo change feed.
+        for _ in range(3):
+            live.dispatch(json.dumps(payload))
+        assert b.take(0) == ([], True)
+    finally:
+        for sub in (a, b, other):
+            live.unsubscribe(sub)
+    assert live.live_stats()["streams"] == 0
+
+
+def test_stream_ao_vivo_exclusao_e_replay_de_lead_que_esfriou(monkeypatch):
+    monkeypatch.setattr(live, "_listen_loop", lambda: None)
+    sub = live.subscribe("c1")
+    try:
+        # NOTIFY do soft delete (migration 020) vira "delete" no formato do tombstone do change feed.
+        deleted = {"client_id": "c1", "id": 7, "updated_at": "2026-03-09T12:00:02+00:00",
+                   "deleted_at": "2026-03-09T12:00:02+00:00"}
+        assert live.dispatch(json.dumps(deleted)) == 1
+        (event_id, name, data), = sub.take(0)[0]
+        assert name == "delete" and data["op"] == "delete" and data["id"] == 7
+        assert decode_cursor(event_id) == (datetime(2026, 3, 9, 12, 0, 2, tzinfo=timezone.utc), 7)
+    finally:
+        live.unsubscribe(sub)
+
+    def lead(lead_id, prob, created, updated):
+        return {"op": "upsert", "id": lead_id, "updated_at": updated,
+                "lead": {"id": lead_id, "probabilidade": prob, "score": int(prob * 100),
+                         "created_at": created, "updated_at": updated}}
+
+    t0, t1 = "2026-03-09T12:00:00+00:00", "2026-03-09T12:05:00+00:00"
+    page = {"changes": [lead(1, 0.9, t0, t0), lead(2, 0.1, t0, t0), lead(3, 0.1, t0, t1)],
+            "next_cursor": "x", "has_more": False}
+    monkeypatch.setattr(live, "fetch_changes", lambda client_id, cursor, lag=None: page)
+    events, _, reset = live.replay("c1", "")
+    # Frio e nunca alterado fica de fora; o que esfriou com o cliente desconectado volta com a temperatura.
+    assert not reset and [(e[2]["id"], e[2]["temperatura"]) for e in events] == [(1, "hot"), (3, "cold")]
+
+
+def test_insights_faixas_configuraveis():
+    edges, score_bins = parse_bins({})
+    assert [band_label(a, b) for a, b in zip(edges, edges[1:])] == ["0-0.2", "0.2-0.4", "0.4-0.6", "0.6-0.8", "0.8-1.0"]
+    assert score_bins == 10
+    edges, _ = parse_bins({"bands": "20"})
+    assert len(edges) == 21 and band_label(edges[1], edges[2]) == "0.05-0.1"
+    assert parse_bins({"edges": "0,0.35,0.7,1", "score_bins": "4"}) == ([0.0, 0.35, 0.7, 1.0], 4)
+    for bad in ({"bands": "0"}, {"bands": "x"}, {"edges": "0.1,1"}, {"edges": "0,0.5,0.5,1"}, {"score_bins": "500"}):
+        with pytest.raises(ValueError):
+            parse_bins(bad)
+
+
+def test_coortes_matriz_e_percentis():
+    np = pytest.importorskip("numpy")
+    # Semana 0: 4 leads, 2 convertidos (na 1ª e na 2ª semana de vida), 1 negado. Semana 1: 1 lead pendente.
+    week = np.array([0, 0, 0, 0, 1])
+    label = np.array([1, 1, 0, -1, -1], dtype=np.int8)
+    hours = np.array([10.0, 200.0, 50.0, np.nan, np.nan])
+    codes = np.array([0, 1, 0, -1, -1], dtype=np.int32)
+    out = compute_cohorts(week, label, hours, codes, ["ads", "site"], 3, datetime(2026, 3, 2).date())
+
+    first, second, third = out["cohorts"]
+    assert first["week"] == "2026-03-02" and second["week"] == "2026-03-09"
+    assert (first["leads"], first["labeled"], first["converted"]) == (4, 3, 2)
+    assert first["cumulative_conversion"] == [0.25, 0.5, 0.5]
+    # Coortes recentes só mostram as semanas já observadas.
+    assert second["cumulative_conversion"] == [0.0, 0.0] and len(third["cumulative_conversion"]) == 1
+
+    ads = next(o for o in out["latency_by_origem"] if o["origem"] == "ads")
+    assert (ads["labeled"], ads["converted"], ads["hours_p50"]) == (2, 1, 30.0)
+    assert out["latency_overall"]["labeled"] == 3
+
+
+
+def test_api_key_hash_com_pepper_e_cache_lru(monkeypatch):
+    monkeypatch.setattr(settings, "API_KEY_PEPPER", "p1")
+    key = api_keys.gen_api_key("c1")
+    assert key.startswith("sk_live_") and len(key) == 40
+    digest = api_keys.hash_api_key(key)
+    assert digest == api_keys.hash_api_key(key) and len(digest) == 64
+    monkeypatch.setattr(settings, "API_KEY_PEPPER", "p2")
+    assert api_keys.hash_api_key(key) != digest
+
+    monkeypatch.setattr(api_keys, "_CACHE", type(api_keys._CACHE)())
+    monkeypatch.setattr(settings, "API_KEY_CACHE_MAX", 2)
+    profile = {"client_id": "c1", "plan": "pro", "status": "active", "usage_month": "1999-01", "leads_used_month": 7}
+    api_keys._cache_put("h1", profile)
+    api_keys._cache_put("h2", None)
+    assert api_keys._cache_get("h1") == (True, profile)  # h1 vira o mais recente
+    api_keys._cache_put("h3", {**profile, "client_id": "c3"})
+    assert api_keys._cache_get("h2") == (False, None)
+    # Uso de outro mês aparece zerado; forget_client limpa só o cliente.
+    assert api_keys._current(profile)["leads_used_month"] == 0
+    api_keys.forget_client("c1")
+    assert api_keys._cache_get("h1") == (False, None) and api_keys._cache_get("h3")[0]
+
+    # Revogação: sai do cache local na hora; o poll do ZSET (outros processos) respeita o intervalo.
+    api_keys.revoke_cached(["h3"])
+    assert api_keys._cache_get("h3") == (False, None)
+    monkeypatch.setattr(settings, "API_KEY_REVOCATION_POLL_MS", 60_000)
+    monkeypatch.setattr(api_keys, "_REVOKED_POLLED_AT", 0.0)
+    assert api_keys._revoked_poll_due() is not None and api_keys._revoked_poll_due() is None
+
+
+def test_pool_de_senha_recusa_acima_da_fila(monkeypatch):
+    monkeypatch.setattr(settings, "PBKDF2_ITERATIONS", 1000)
+    monkeypatch.setattr(settings, "PASSWORD_POOL_WORKERS", 0)
+    stored = password_pool.hash_password("Senha-forte-1")
+    assert stored.startswith("pbkdf2:sha256:1000$") and password_pool.verify_password(stored, "Senha-forte-1")
+
+    # 1 rodando + 1 na fila: o próximo é recusado sem esperar.
+    monkeypatch.setattr(settings, "PASSWORD_POOL_WORKERS", 1)
+    monkeypatch.setattr(settings, "PASSWORD_POOL_MAX_PENDING", 1)
+    monkeypatch.setattr(password_pool, "_IN_FLIGHT", 2)
+    with pytest.raises(password_pool.PasswordPoolBusy):
+        password_pool.verify_password(stored, "Senha-forte-1")
+    assert password_pool.pool_stats()["rejected"] >= 1
+
+
+def test_access_token_assinado_expira_e_respeita_epoch(monkeypatch):
+    monkeypatch.setattr(settings, "SESSION_TOKEN_SECRET", "s1")
+    token, ttl = session_tokens.issue_token("c1", "pro", "active", 3)
+    assert token.startswith("at1.") and ttl == settings.SESSION_TOKEN_TTL_SECONDS
+    claims = session_tokens.decode_token(token)
+    assert (claims["c"], claims["p"], claims["e"]) == ("c1", "pro", 3)
+    assert session_tokens.decode_token(token, now=claims["x"]) is None
+    forged, _ = session_tokens.issue_token("c2", "pro", "active", 3)
+    assert session_tokens.decode_token(forged.rpartition(".")[0] + "." + token.rpartition(".")[2]) is None
+    monkeypatch.setattr(settings, "SESSION_TOKEN_SECRET", "s2")
+    assert session_tokens.decode_token(token) is None
+    monkeypatch.setattr(settings, "SESSION_TOKEN_SECRET", "s1")
+
+    # Epoch em cache: sem banco. Epoch novo (revogação) invalida o token.
+    monkeypatch.setattr(session_tokens, "_EPOCHS", {})
+    session_tokens._store_epoch("c1", 3)
+    assert session_tokens.verify_token(token) == {
+        "client_id": "c1", "plan": "pro", "status": "active", "usage_month": None, "leads_used_month": None,
+    }
+    session_tokens._store_epoch("c1", 4)
+    assert session_tokens.verify_token(token) is None
+
+
+class _CountingConn:
+    """Conexão falsa: conta transações (`with conn:`) e responde às queries do /prever."""
+
+    transactions = 0
+
+    def __enter__(self):
+        type(self).transactions += 1
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self, **_):
+        return _FakeCursor()
+
+    def close(self):
+        pass
+
+
+class _FakeCursor:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None, **_):
+        pass
+
+    def fetchone(self):
+        return {
+            "client_id": "c1", "plan": "pro", "status": "active", "usage_month": None, "leads_used_month": 0,
+            "id": 1, "created_at": datetime.now(timezone.utc),
+        }
+
+
+def test_prever_limite_por_plano_sem_banco_e_uma_transacao(monkeypatch):
+    import app as flask_app
+    from blueprints import leads
+    from services import db as db_module, lead_service
+
+    monkeypatch.setattr(_CountingConn, "transactions", 0)
+    for module in (leads, lead_service, api_keys, session_tokens, db_module):
+        monkeypatch.setattr(module, "db", lambda *_, **__: _CountingConn())
+    monkeypatch.setattr(api_keys, "_CACHE", type(api_keys._CACHE)())
+    monkeypatch.setattr(settings, "SESSION_TOKEN_SECRET", "s1")
+
+    # Sem credencial ou token de outro cliente: limite do trial, sem banco. Token do cliente: plano dos claims.
+    key = api_keys.gen_api_key("c1")
+    token, _ = session_tokens.issue_token("c1", "pro", "active", 0)
+    assert lead_service.prever_rate_limit("c1") == "20 per minute"
+    assert lead_service.prever_rate_limit("c2", token) == "20 per minute"
+    assert lead_service.prever_rate_limit("c1", token) == "600 per minute"
+    assert _CountingConn.transactions == 0
+
+    # Chave pro com cache frio: uma leitura, e o perfil fica no cache (a seguinte não vai ao banco).
+    assert lead_service.prever_rate_limit("c1", key) == "600 per minute"
+    assert lead_service.prever_rate_limit("c1", key) == "600 per minute"
+    assert _CountingConn.transactions == 1
+    monkeypatch.setattr(_CountingConn, "transactions", 0)
+
+    client = flask_app.app.test_client()
+    resp = client.post("/prever", json={"nome": "Ana"}, headers={"X-CLIENT-ID": "c1", "X-API-KEY": key})
+    assert resp.status_code == 200, resp.get_json()
+    assert _CountingConn.transactions == 1
+
+    # Chave desconhecida: uma leitura; as seguintes (mesmo já barradas pelo limite) não voltam ao banco.
+    monkeypatch.setattr(api_keys, "_MISSES", type(api_keys._MISSES)())
+    monkeypatch.setattr(_FakeCursor, "fetchone", lambda self: None)
+    monkeypatch.setattr(_CountingConn, "transactions", 0)
+    unknown = api_keys.gen_api_key("c1")
+    assert [lead_service.prever_rate_limit("c1", unknown) for _ in range(5)] == ["20 per minute"] * 5
+    assert _CountingConn.transactions == 1
+
+
+def test_rate_limit_em_lote_sincroniza_a_cada_n_hits_e_auth_estrito(monkeypatch):
+    from limits import parse
+    from limits.strategies import FixedWindowRateLimiter
+
+    monkeypatch.setattr(settings, "RATELIMIT_LOCAL_BATCH", True)
+    monkeypatch.setattr(settings, "RATELIMIT_SYNC_HITS", 10)
+    monkeypatch.setattr(settings, "RATELIMIT_SYNC_MS", 60_000)
+    monkeypatch.setattr(settings, "RATELIMIT_STRICT_SCOPES", ["auth."])
+    assert batched_uri("redis://r:6379") == "batched+redis://r:6379" and batched_uri("memory://") == "memory://"
+
+    storage = BatchedStorage("batched+memory://")
+    limiter = FixedWindowRateLimiter(storage)
+    prever, login = parse("600 per minute"), parse("20 per minute")
+    assert all(limiter.hit(prever, "c1", "leads.prever") for _ in range(200))
+    assert storage.stats()["syncs"] <= 21
+    assert storage.inner.get(prever.key_for("c1", "leads.prever")) >= 191
+
+    # Perto do limite toda hit vai ao storage de trás: a recusa nunca sai da contagem local.
+    trial = parse("20 per minute")
+    assert sum(limiter.hit(trial, "c2", "leads.prever") for _ in range(30)) == 20
+
+    before = storage.stats()["syncs"]
+    assert sum(limiter.hit(login, "1.2.3.4", "auth.login") for _ in range(25)) == 20
+    assert storage.stats()["syncs"] - before == 25
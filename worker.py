@@ -0,0 +1,58 @@
+# worker.py
+# ---------
+# Worker dos jobs de export assíncrono (services/export_jobs.py). Roda fora do web:
+#   python -m worker
+#
+# Vários workers podem rodar em paralelo (FOR UPDATE SKIP LOCKED). Precisam enxergar o mesmo
+# EXPORT_JOBS_DIR que o web (mesmo disco/volume). SIGTERM: o job em andamento volta para a fila.
+
+import os
+import signal
+import socket
+import time
+
+from structlog import get_logger
+
+from services import settings
+from services.db import close_db_pool, require_env_db
+from services.export_jobs import claim_job, expire_jobs, run_job
+from services.logging_config import configure_logging
+
+logger = get_logger()
+
+_stop = False
+
+
+def _handle_stop(signum, frame) -> None:
+    global _stop
+    _stop = True
+
+
+def main() -> int:
+    configure_logging()
+    require_env_db()
+    signal.signal(signal.SIGTERM, _handle_stop)
+    signal.signal(signal.SIGINT, _handle_stop)
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info("worker_started", worker_id=worker_id)
+    last_expire = 0.0
+    try:
+        while not _stop:
+            if time.monotonic() - last_expire >= 60:
+                last_expire = time.monotonic()
+                expire_jobs()
+            job = claim_job(worker_id)
+            if job is None:
+                time.sleep(settings.WORKER_POLL_SECONDS)
+                continue
+            logger.info("export_job_started", job_id=job["id"], client_id=job["client_id"], format=job["format"])
+            run_job(job, worker_id, should_stop=lambda: _stop)
+    finally:
+        close_db_pool()
+    logger.info("worker_stopped", worker_id=worker_id)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())